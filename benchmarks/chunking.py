@@ -0,0 +1,155 @@
+"""
+Overhead of running training as compiled segments with checkpoints in between.
+
+The update loop of a baseline is run by `popgym_arcade.baselines.driver.run_segments`
+as segments of `CHUNK` updates. Every segment boundary returns to the host and,
+with checkpointing, starts an asynchronous orbax save of the runner state. For
+each chunk size we time a whole training run, after a warmup run that compiles
+the segments, and report the time per update relative to a single segment.
+
+    python -m benchmarks.chunking --TRAIN_TYPE PQN --CHUNKS 0 64 16 4 --CHECKPOINT True False
+
+"""
+import argparse
+import gc
+import itertools
+import shutil
+import tempfile
+import time
+
+import jax
+
+from popgym_arcade.baselines.driver import run_segments
+from benchmarks.common import environment_metadata, median_ci, write_results
+from benchmarks.training import ALGORITHMS, make_config
+
+
+def benchmark_chunk(
+        train_type: str,
+        env_id: str,
+        chunk: int,
+        checkpoint: bool,
+        num_envs: int = 16,
+        num_updates: int = 64,
+        num_seeds: int = 1,
+        repeats: int = 3,
+        seed: int = 0,
+) -> dict:
+    """Time `num_updates` updates run as segments of `chunk` updates, returning a row of the results table."""
+    module, _ = ALGORITHMS[train_type]
+    directory = tempfile.mkdtemp(prefix="popgym_arcade_chunking_")
+    config = make_config(
+        train_type, env_id, num_envs, num_updates, seed,
+        # A chunk of 0 runs the whole training as one segment
+        SEGMENT_UPDATES=chunk,
+        CHECKPOINT_INTERVAL=chunk if checkpoint else 0,
+        CHECKPOINT_DIR=directory,
+    )
+    segments = module.make_train_segments(config)
+    rngs = jax.random.split(jax.random.PRNGKey(seed), num_seeds)
+
+    times = []
+    try:
+        # The first run compiles the segments
+        for i in range(repeats + 1):
+            shutil.rmtree(directory, ignore_errors=True)
+            t0 = time.perf_counter()
+            jax.block_until_ready(run_segments(config, *segments, rngs))
+            if i > 0:
+                times.append(time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    run_time, run_time_low, run_time_high = median_ci(times)
+    return {
+        "Train Type": train_type,
+        "Environment": env_id,
+        "Chunk": chunk if chunk > 0 else config["NUM_UPDATES"],
+        "Checkpoint": checkpoint,
+        "Num Envs": num_envs,
+        "Num Seeds": num_seeds,
+        "Num Updates": config["NUM_UPDATES"],
+        "Update Time": run_time / config["NUM_UPDATES"],
+        "Update Time CI Low": run_time_low / config["NUM_UPDATES"],
+        "Update Time CI High": run_time_high / config["NUM_UPDATES"],
+        "Run Time": run_time,
+    }
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Segment boundary and checkpoint overhead benchmark")
+    parser.add_argument('--TRAIN_TYPE',
+                        type=str,
+                        default='PQN',
+                        choices=list(ALGORITHMS),
+                        help='Baseline to train')
+    parser.add_argument('--ENV_NAME',
+                        type=str,
+                        default='CartPoleEasy',
+                        help='Environment to train on')
+    parser.add_argument('--CHUNKS',
+                        type=int,
+                        nargs='+',
+                        default=[0, 64, 16, 4],
+                        help='Updates per compiled segment, 0 runs the whole training as one segment')
+    parser.add_argument('--CHECKPOINT',
+                        type=lambda x: x == 'True',
+                        nargs='+',
+                        default=[False, True],
+                        help='Whether to checkpoint at every segment boundary, True and/or False')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        default=16,
+                        help='Number of parallel environments')
+    parser.add_argument('--NUM_UPDATES',
+                        type=int,
+                        default=64,
+                        help='Updates per timed run')
+    parser.add_argument('--NUM_SEEDS',
+                        type=int,
+                        default=1,
+                        help='Number of vmapped seeds')
+    parser.add_argument('--REPEATS',
+                        type=int,
+                        default=3,
+                        help='Timed runs per configuration')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    parser.add_argument('--OUT',
+                        type=str,
+                        default='benchmark_results/chunking',
+                        help='Output path prefix for the .json and .csv results')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    rows = []
+    for chunk, checkpoint in itertools.product(args.CHUNKS, args.CHECKPOINT):
+        if chunk == 0 and checkpoint:
+            continue
+        row = benchmark_chunk(
+            args.TRAIN_TYPE, args.ENV_NAME, chunk, checkpoint,
+            args.NUM_ENVS, args.NUM_UPDATES, args.NUM_SEEDS, args.REPEATS,
+        )
+        rows.append(row)
+        jax.clear_caches()
+        gc.collect()
+    # Overhead relative to running the whole training as a single segment without checkpoints
+    single = [row for row in rows if row["Chunk"] == row["Num Updates"] and not row["Checkpoint"]]
+    for row in rows:
+        row["Overhead"] = row["Update Time"] / single[0]["Update Time"] - 1 if single else None
+        overhead = "n/a" if row["Overhead"] is None else f"{100 * row['Overhead']:+.1f}%"
+        print(
+            f"{args.TRAIN_TYPE} {args.ENV_NAME} - Chunk: {row['Chunk']}, Checkpoint: {row['Checkpoint']}, "
+            f"Update time: {1000 * row['Update Time']:.2f}ms, Overhead: {overhead}"
+        )
+    write_results(rows, args.OUT, environment_metadata())
+    print(f"Results written to {args.OUT}.json and {args.OUT}.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import csv
+import json
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import jax
+import numpy as np
+
+
+def compile_fn(fn: Callable, *args) -> Tuple[Any, float, Dict[str, Any]]:
+    """
+    Compile `fn` for `args` ahead of time.
+
+    Returns:
+        The compiled function, the trace + compile time in seconds and the sizes
+        reported by `memory_analysis()` in bytes (`None` where the backend does not
+        report them).
+    """
+    start = time.perf_counter()
+    compiled = jax.jit(fn).lower(*args).compile()
+    compile_time = time.perf_counter() - start
+    memory = compiled.memory_analysis()
+    sizes = {
+        name: getattr(memory, name, None) if memory is not None else None
+        for name in ("temp_size_in_bytes", "argument_size_in_bytes", "output_size_in_bytes")
+    }
+    return compiled, compile_time, sizes
+
+
+def cost(compiled) -> Dict[str, float]:
+    """FLOPs and bytes accessed from the compiled HLO cost model."""
+    analysis = compiled.cost_analysis()
+    # Older jax versions return one dict per device
+    if isinstance(analysis, (list, tuple)):
+        analysis = analysis[0] if analysis else {}
+    analysis = analysis or {}
+    return {
+        "flops": analysis.get("flops"),
+        "bytes_accessed": analysis.get("bytes accessed"),
+    }
+
+
+def time_fn(fn: Callable, args: Sequence[Any], warmup: int = 2, repeats: int = 10) -> List[float]:
+    """Wall-clock times in seconds of `repeats` calls to `fn(*args)` after `warmup` untimed calls."""
+    for _ in range(warmup):
+        jax.block_until_ready(fn(*args))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        jax.block_until_ready(fn(*args))
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def median_ci(values: Sequence[float], confidence: float = 0.95, num_resamples: int = 1000, seed: int = 0):
+    """Median of `values` with a bootstrap confidence interval."""
+    values = np.asarray(values)
+    rng = np.random.default_rng(seed)
+    resamples = rng.choice(values, size=(num_resamples, len(values)), replace=True)
+    medians = np.median(resamples, axis=1)
+    alpha = (1 - confidence) / 2
+    return (
+        statistics.median(values.tolist()),
+        float(np.quantile(medians, alpha)),
+        float(np.quantile(medians, 1 - alpha)),
+    )
+
+
+def write_results(rows: List[Dict[str, Any]], out_prefix: str, metadata: Dict[str, Any] = None) -> None:
+    """Write `rows` to `<out_prefix>.json` and `<out_prefix>.csv`."""
+    directory = os.path.dirname(out_prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(out_prefix + ".json", "w") as f:
+        json.dump({"metadata": metadata or {}, "results": rows}, f, indent=2)
+    with open(out_prefix + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def environment_metadata() -> Dict[str, Any]:
+    device = jax.devices()[0]
+    return {
+        "jax_version": jax.__version__,
+        "platform": device.platform,
+        "device": device.device_kind,
+        "num_devices": jax.device_count(),
+    }
@@ -0,0 +1,147 @@
+"""
+Microbenchmarks for the rendering primitives in `popgym_arcade.environments.draw_utils`.
+
+Every primitive draws on a batch of 256x256 canvases through `jax.vmap`, with a
+per-canvas argument (position, digit, angle, ...) so the batch is not folded into
+a single call. For each primitive and batch size we report the time per call and
+the FLOPs and bytes accessed estimated by the compiled HLO cost model.
+
+    python -m benchmarks.draw_utils --PLATFORM cpu --BATCH_SIZES 1 64 512
+
+"""
+import argparse
+import gc
+import itertools
+
+import jax
+import jax.numpy as jnp
+
+from popgym_arcade.environments import draw_utils as du
+from benchmarks.common import compile_fn, cost, environment_metadata, median_ci, time_fn, write_results
+
+CANVAS_SIZE = 256
+COLOR = jnp.array([1.0, 0.0, 0.0])
+LETTERS = jnp.array([ord(c) for c in "POPGYM"], dtype=jnp.int32)
+
+
+def _box(i):
+    """A 48x48 box whose horizontal position varies with the canvas index."""
+    x = 16 + i % 160
+    return (x, 64), (x + 48, 112)
+
+
+# Each case draws one primitive on one canvas, `i` is the int32 index of the canvas in the batch
+CASES = {
+    "draw_rectangle": lambda c, i: du.draw_rectangle(*_box(i), COLOR, c),
+    "draw_circle": lambda c, i: du.draw_circle(*_box(i), 20.0, COLOR, c),
+    "draw_triangle": lambda c, i: du.draw_triangle(*_box(i), COLOR, c, i % 4 + 1),
+    "draw_o": lambda c, i: du.draw_o(*_box(i), 2, COLOR, c),
+    "draw_x": lambda c, i: du.draw_x(*_box(i), 2, COLOR, c),
+    "draw_grid": lambda c, i: du.draw_grid(20 + i % 2, 2, COLOR, c),
+    "draw_sub_canvas": lambda c, i: du.draw_sub_canvas(c[:192, :192] * (i % 2), c),
+    "draw_heart": lambda c, i: du.draw_heart(*_box(i), COLOR, c),
+    "draw_spade": lambda c, i: du.draw_spade(*_box(i), COLOR, c),
+    "draw_club": lambda c, i: du.draw_club(*_box(i), COLOR, c),
+    "draw_diamond": lambda c, i: du.draw_diamond(*_box(i), COLOR, c),
+    "draw_hexagon": lambda c, i: du.draw_hexagon(*_box(i), COLOR, c),
+    "draw_matchstick_man": lambda c, i: du.draw_matchstick_man(*_box(i), COLOR, c),
+    "draw_tnt_block": lambda c, i: du.draw_tnt_block(*_box(i), c),
+    "draw_crooked_tail": lambda c, i: du.draw_crooked_tail(*_box(i), COLOR, 2, c),
+    "draw_stick": lambda c, i: du.draw_stick(*_box(i), 0.01 * i, 2, COLOR, c),
+    "draw_digit": lambda c, i: du.draw_digit(*_box(i), COLOR, c, i % 10),
+    "draw_number": lambda c, i: du.draw_number((86, 2), (171, 30), COLOR, c, i % 100),
+    "draw_single_digit": lambda c, i: du.draw_single_digit(*_box(i), COLOR, c, i % 10),
+    "draw_horizontal_tail": lambda c, i: du.draw_horizontal_tail(*_box(i), 2, COLOR, c),
+    "draw_vertical_tail": lambda c, i: du.draw_vertical_tail(*_box(i), 2, COLOR, c),
+    "draw_horizontal_arrow": lambda c, i: du.draw_horizontal_arrow(*_box(i), COLOR, 0.1 * i - 1.0, c),
+    "draw_vertical_arrow": lambda c, i: du.draw_vertical_arrow(*_box(i), COLOR, 0.1 * i - 1.0, c),
+    "draw_crooked_arrow": lambda c, i: du.draw_crooked_arrow(*_box(i), COLOR, 0.1 * i - 1.0, c),
+    "rotate": lambda c, i: du.rotate(c, 0.01 * i, (128, 128)),
+    "draw_pole": lambda c, i: du.draw_pole((128, 128), (128, 60), COLOR, 0.01 * i, 3, c),
+    "draw_letter": lambda c, i: du.draw_letter(*_box(i), COLOR, c, 65 + i % 26),
+    "draw_words_h": lambda c, i: du.draw_words_h((0, 231 - i % 2), (256, 256), COLOR, c, LETTERS),
+    "draw_words_v": lambda c, i: du.draw_words_v((231 - i % 2, 0), (256, 256), COLOR, c, LETTERS),
+    "draw_str": lambda c, i: du.draw_str((0, 231 - i % 2), (256, 256), COLOR, c, "BattleShip"),
+}
+
+
+def benchmark_primitive(name: str, batch_size: int, warmup: int = 2, repeats: int = 20) -> dict:
+    """Time and cost one primitive vmapped over `batch_size` canvases."""
+    fn = jax.vmap(CASES[name])
+    canvases = jnp.full((batch_size, CANVAS_SIZE, CANVAS_SIZE, 3), 0.5)
+    index = jnp.arange(batch_size, dtype=jnp.int32)
+    compiled, compile_time, memory = compile_fn(fn, canvases, index)
+    times = time_fn(compiled, (canvases, index), warmup=warmup, repeats=repeats)
+    batch_time, low, high = median_ci(times)
+    hlo_cost = cost(compiled)
+    return {
+        "Primitive": name,
+        "Batch Size": batch_size,
+        "us per Call": 1e6 * batch_time / batch_size,
+        "us per Call CI Low": 1e6 * low / batch_size,
+        "us per Call CI High": 1e6 * high / batch_size,
+        "us per Batch": 1e6 * batch_time,
+        "FLOPs per Call": hlo_cost["flops"] / batch_size if hlo_cost["flops"] is not None else None,
+        "Bytes per Call": hlo_cost["bytes_accessed"] / batch_size if hlo_cost["bytes_accessed"] is not None else None,
+        "Compile Time": compile_time,
+        "Temp Memory": memory["temp_size_in_bytes"],
+    }
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="draw_utils microbenchmarks")
+    parser.add_argument('--PRIMITIVES',
+                        type=str,
+                        nargs='+',
+                        default=list(CASES),
+                        help='Primitives to benchmark')
+    parser.add_argument('--BATCH_SIZES',
+                        type=int,
+                        nargs='+',
+                        default=[1, 64, 512],
+                        help='Number of canvases per call')
+    parser.add_argument('--WARMUP',
+                        type=int,
+                        default=2,
+                        help='Untimed calls before timing')
+    parser.add_argument('--REPEATS',
+                        type=int,
+                        default=20,
+                        help='Timed calls per configuration')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    parser.add_argument('--OUT',
+                        type=str,
+                        default='benchmark_results/draw_utils',
+                        help='Output path prefix for the .json and .csv results')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    rows = []
+    for name, batch_size in itertools.product(args.PRIMITIVES, args.BATCH_SIZES):
+        row = benchmark_primitive(name, batch_size, args.WARMUP, args.REPEATS)
+        print(
+            f"{name} - Batch: {batch_size}, {row['us per Call']:.2f}us per call, "
+            f"FLOPs per call: {row['FLOPs per Call']}, Bytes per call: {row['Bytes per Call']}"
+        )
+        rows.append(row)
+        jax.clear_caches()
+        gc.collect()
+    # Slowest primitives first, at the largest batch size
+    largest = max(args.BATCH_SIZES)
+    ranking = sorted((r for r in rows if r["Batch Size"] == largest), key=lambda r: -r["us per Call"])
+    print(f"\nPrimitives by time per call at batch size {largest}:")
+    for r in ranking:
+        print(f"  {r['Primitive']:<24} {r['us per Call']:>10.2f}us")
+    write_results(rows, args.OUT, environment_metadata())
+    print(f"Results written to {args.OUT}.json and {args.OUT}.csv")
+
+
+if __name__ == '__main__':
+    main()
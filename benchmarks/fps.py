@@ -0,0 +1,160 @@
+"""
+Environment throughput benchmark.
+
+Every environment is rolled out with random actions inside a single `lax.scan`,
+so compile time does not grow with the number of steps. Compile time and run
+time are measured separately and the run time is reported as the median of
+repeated timings with a bootstrap confidence interval.
+
+    python -m benchmarks.fps --PLATFORM cpu --NUM_ENVS 1 16 256
+
+"""
+import argparse
+import gc
+import itertools
+import sys
+
+import jax
+
+import popgym_arcade
+from popgym_arcade.registration import REGISTERED_ENVIRONMENTS
+from popgym_arcade.rollouts import init_rollout, rollout
+from benchmarks import regression
+from benchmarks.common import compile_fn, environment_metadata, median_ci, time_fn, write_results
+
+
+def make_rollout(env, env_params, num_steps: int):
+    def policy(carry, obs, last_done, key):
+        action = jax.random.randint(key, last_done.shape, 0, env.num_actions)
+        return carry, action, None
+
+    def run(state):
+        # Only the carried state is returned so the trajectory is never materialized
+        state, _ = rollout(env, policy, num_steps, state, env_params)
+        return state
+
+    return run
+
+
+def benchmark_env(
+        env_id: str,
+        partial_obs: bool,
+        num_envs: int,
+        num_steps: int = 128,
+        warmup: int = 2,
+        repeats: int = 10,
+        seed: int = 0,
+) -> dict:
+    """Benchmark one environment configuration, returning a row of the results table."""
+    env, env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+    state = init_rollout(env, jax.random.PRNGKey(seed), num_envs, params=env_params)
+    compiled, compile_time, memory = compile_fn(make_rollout(env, env_params, num_steps), state)
+    times = time_fn(compiled, (state,), warmup=warmup, repeats=repeats)
+    run_time, run_time_low, run_time_high = median_ci(times)
+    frames = num_envs * num_steps
+    return {
+        "Environment": env_id,
+        "Partial Obs": partial_obs,
+        "Num Envs": num_envs,
+        "Num Steps": num_steps,
+        "FPS": frames / run_time,
+        "FPS CI Low": frames / run_time_high,
+        "FPS CI High": frames / run_time_low,
+        "Run Time": run_time,
+        "Compile Time": compile_time,
+        "Temp Memory": memory["temp_size_in_bytes"],
+        "Argument Memory": memory["argument_size_in_bytes"],
+        "Output Memory": memory["output_size_in_bytes"],
+    }
+
+
+def run_benchmarks(args) -> list:
+    rows = []
+    for env_id, partial_obs, num_envs in itertools.product(args.ENV_NAMES, args.PARTIAL_OBS, args.NUM_ENVS):
+        row = benchmark_env(
+            env_id, partial_obs, num_envs, args.NUM_STEPS, args.WARMUP, args.REPEATS, args.SEED
+        )
+        print(
+            f"{env_id} - Partial: {partial_obs}, Envs: {num_envs}, Steps: {args.NUM_STEPS}, "
+            f"FPS: {row['FPS']:.0f} [{row['FPS CI Low']:.0f}, {row['FPS CI High']:.0f}], "
+            f"Compile: {row['Compile Time']:.2f}s"
+        )
+        rows.append(row)
+        # Release the executables and buffers of this configuration before the next one
+        jax.clear_caches()
+        gc.collect()
+    return rows
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="popgym_arcade FPS benchmark")
+    parser.add_argument('--ENV_NAMES',
+                        type=str,
+                        nargs='+',
+                        default=REGISTERED_ENVIRONMENTS,
+                        help='Environments to benchmark')
+    parser.add_argument('--PARTIAL_OBS',
+                        type=lambda x: x == 'True',
+                        nargs='+',
+                        default=[False, True],
+                        help='Observability settings, True and/or False')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        nargs='+',
+                        default=[2 ** i for i in range(1, 10)],
+                        help='Batch sizes')
+    parser.add_argument('--NUM_STEPS',
+                        type=int,
+                        default=128,
+                        help='Steps per timed rollout')
+    parser.add_argument('--WARMUP',
+                        type=int,
+                        default=2,
+                        help='Untimed rollouts before timing')
+    parser.add_argument('--REPEATS',
+                        type=int,
+                        default=10,
+                        help='Timed rollouts per configuration')
+    parser.add_argument('--SEED',
+                        type=int,
+                        default=0,
+                        help='Random seed')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    parser.add_argument('--OUT',
+                        type=str,
+                        default='benchmark_results/fps',
+                        help='Output path prefix for the .json and .csv results')
+    parser.add_argument('--BASELINE',
+                        type=str,
+                        default=None,
+                        help='Baseline JSON to check the results against, exits non-zero on regressions')
+    parser.add_argument('--SAVE_BASELINE',
+                        type=str,
+                        default=None,
+                        help='Store the results as a new baseline JSON')
+    regression.add_threshold_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    rows = run_benchmarks(args)
+    metadata = environment_metadata()
+    write_results(rows, args.OUT, metadata)
+    print(f"Results written to {args.OUT}.json and {args.OUT}.csv")
+    if args.SAVE_BASELINE is not None:
+        regression.save_baseline(rows, args.SAVE_BASELINE, metadata)
+        print(f"Baseline written to {args.SAVE_BASELINE}")
+    if args.BASELINE is not None:
+        sys.exit(regression.check(
+            rows, args.BASELINE, regression.thresholds_from_args(args), metadata, args.VERBOSE
+        ))
+
+
+if __name__ == '__main__':
+    main()
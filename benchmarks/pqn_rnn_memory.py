@@ -0,0 +1,149 @@
+"""
+Memory and update time of PQN_RNN training for each observation storage dtype.
+
+The transition memory holds `MEMORY_WINDOW + NUM_STEPS` observations per
+environment and dominates the memory of the program. For each storage dtype
+and number of environments, a short training run is compiled and we report
+the compiled temp memory and the time per update.
+
+    python -m benchmarks.pqn_rnn_memory --NUM_ENVS 16 64 256 --OBS_DTYPES float32 uint8
+
+"""
+import argparse
+import gc
+import itertools
+
+import equinox as eqx
+import jax
+
+from popgym_arcade.baselines.pqn_rnn import make_train
+from benchmarks.common import compile_fn, environment_metadata, median_ci, time_fn, write_results
+
+# Defaults of the PQN_RNN subcommand of popgym_arcade/train.py
+DEFAULT_CONFIG = {
+    "MEMORY_TYPE": "lru",
+    "MEMORY_WINDOW": 4,
+    "NUM_STEPS": 128,
+    "EPS_START": 1,
+    "EPS_FINISH": 0.05,
+    "EPS_DECAY": 0.25,
+    "NUM_MINIBATCHES": 16,
+    "NUM_EPOCHS": 4,
+    "LR": 0.00005,
+    "MAX_GRAD_NORM": 0.5,
+    "LR_LINEAR_DECAY": True,
+    "REW_SCALE": 1,
+    "GAMMA": 0.99,
+    "LAMBDA": 0.95,
+    "WANDB_MODE": "disabled",
+    "PARTIAL": False,
+    "TEST_DURING_TRAINING": False,
+}
+
+
+def benchmark_config(
+        env_id: str,
+        obs_dtype: str,
+        num_envs: int,
+        num_updates: int = 4,
+        memory_type: str = "lru",
+        repeats: int = 3,
+        seed: int = 0,
+) -> dict:
+    """Compile and time `num_updates` PQN_RNN updates, returning a row of the results table."""
+    config = {
+        **DEFAULT_CONFIG,
+        "ENV_NAME": env_id,
+        "MEMORY_TYPE": memory_type,
+        "OBS_DTYPE": obs_dtype,
+        "NUM_ENVS": num_envs,
+    }
+    config["TOTAL_TIMESTEPS"] = config["TOTAL_TIMESTEPS_DECAY"] = num_updates * config["NUM_STEPS"] * num_envs
+    train = make_train(config)
+
+    def run(rng):
+        # The optimizer in the train state is not an array, only arrays can leave jit
+        return eqx.filter(train(rng), eqx.is_array)
+
+    rng = jax.random.PRNGKey(seed)
+    compiled, compile_time, memory = compile_fn(run, rng)
+    times = time_fn(compiled, (rng,), warmup=1, repeats=repeats)
+    run_time, _, _ = median_ci(times)
+    return {
+        "Environment": env_id,
+        "Memory Type": memory_type,
+        "Obs Dtype": obs_dtype,
+        "Num Envs": num_envs,
+        "Num Updates": num_updates,
+        # Includes the initial random steps that fill the memory window
+        "Update Time": run_time / num_updates,
+        "Compile Time": compile_time,
+        "Temp Memory": memory["temp_size_in_bytes"],
+        "Argument Memory": memory["argument_size_in_bytes"],
+        "Output Memory": memory["output_size_in_bytes"],
+    }
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="PQN_RNN transition memory benchmark")
+    parser.add_argument('--ENV_NAME',
+                        type=str,
+                        default='BattleShipEasy',
+                        help='Environment to train on')
+    parser.add_argument('--MEMORY_TYPE',
+                        type=str,
+                        default='lru',
+                        help='Memory model type')
+    parser.add_argument('--OBS_DTYPES',
+                        type=str,
+                        nargs='+',
+                        default=['float32', 'uint8'],
+                        help='Observation storage dtypes to compare')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        nargs='+',
+                        default=[16, 64, 256],
+                        help='Numbers of parallel environments, multiples of 16')
+    parser.add_argument('--NUM_UPDATES',
+                        type=int,
+                        default=4,
+                        help='Updates per timed run')
+    parser.add_argument('--REPEATS',
+                        type=int,
+                        default=3,
+                        help='Timed runs per configuration')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    parser.add_argument('--OUT',
+                        type=str,
+                        default='benchmark_results/pqn_rnn_memory',
+                        help='Output path prefix for the .json and .csv results')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    rows = []
+    for num_envs, obs_dtype in itertools.product(args.NUM_ENVS, args.OBS_DTYPES):
+        row = benchmark_config(
+            args.ENV_NAME, obs_dtype, num_envs, args.NUM_UPDATES, args.MEMORY_TYPE, args.REPEATS
+        )
+        temp = row["Temp Memory"]
+        print(
+            f"{args.ENV_NAME} - Obs: {obs_dtype}, Envs: {num_envs}, "
+            f"Temp memory: {'n/a' if temp is None else f'{temp / 2 ** 20:.1f}MiB'}, "
+            f"Update time: {row['Update Time']:.3f}s"
+        )
+        rows.append(row)
+        jax.clear_caches()
+        gc.collect()
+    write_results(rows, args.OUT, environment_metadata())
+    print(f"Results written to {args.OUT}.json and {args.OUT}.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Performance regression gate for the FPS benchmark.
+
+Compares benchmark results against a stored baseline per environment, partial
+flag and batch size. A configuration regresses when its FPS drops, or its
+compile time or temporary memory grows, by more than the given relative
+threshold. Prints a diff table and exits with a non-zero code on regressions.
+
+    python -m benchmarks.fps --PLATFORM cpu --SAVE_BASELINE benchmarks/baselines/cpu.json
+    python -m benchmarks.fps --PLATFORM cpu --BASELINE benchmarks/baselines/cpu.json
+
+or, to compare two result files without rerunning the benchmark,
+
+    python -m benchmarks.regression --BASELINE benchmarks/baselines/cpu.json --CURRENT benchmark_results/fps.json
+
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Metric, whether larger is better, and the name of its threshold argument
+METRICS = (
+    ("FPS", True, "fps"),
+    ("Compile Time", False, "compile_time"),
+    ("Temp Memory", False, "memory"),
+)
+DEFAULT_THRESHOLDS = {"fps": 0.1, "compile_time": 0.25, "memory": 0.1}
+
+
+def _key(row: Dict[str, Any]) -> Tuple[str, bool, int]:
+    return row["Environment"], row["Partial Obs"], row["Num Envs"]
+
+
+def load_results(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    with open(path) as f:
+        data = json.load(f)
+    return data.get("metadata", {}), data["results"]
+
+
+def save_baseline(rows: List[Dict[str, Any]], path: str, metadata: Dict[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"metadata": metadata, "results": rows}, f, indent=2)
+
+
+def compare(
+        current: List[Dict[str, Any]],
+        baseline: List[Dict[str, Any]],
+        thresholds: Dict[str, float] = DEFAULT_THRESHOLDS,
+) -> List[Dict[str, Any]]:
+    """
+    Compare every current configuration with its baseline.
+
+    Returns:
+        One entry per configuration and metric with the baseline and current values,
+        the relative change and whether it is a regression. Configurations missing
+        from the baseline or metrics the backend did not report are not compared.
+    """
+    baseline = {_key(row): row for row in baseline}
+    diffs = []
+    for row in current:
+        base = baseline.get(_key(row))
+        if base is None:
+            continue
+        for metric, higher_is_better, threshold_name in METRICS:
+            old, new = base.get(metric), row.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            diffs.append({
+                "key": _key(row),
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": change,
+                "regression": worse > thresholds[threshold_name],
+            })
+    return diffs
+
+
+def _format_value(metric: str, value: float) -> str:
+    if metric == "Temp Memory":
+        return f"{value / 2 ** 20:.1f}MiB"
+    if metric == "Compile Time":
+        return f"{value:.2f}s"
+    return f"{value:.0f}"
+
+
+def format_table(diffs: List[Dict[str, Any]], only_regressions: bool = False) -> str:
+    header = f"{'Environment':<22}{'Partial':<9}{'Envs':>6}  {'Metric':<14}{'Baseline':>12}{'Current':>12}{'Change':>9}"
+    lines = [header, "-" * len(header)]
+    for d in diffs:
+        if only_regressions and not d["regression"]:
+            continue
+        env_id, partial_obs, num_envs = d["key"]
+        flag = "  REGRESSION" if d["regression"] else ""
+        lines.append(
+            f"{env_id:<22}{str(partial_obs):<9}{num_envs:>6}  {d['metric']:<14}"
+            f"{_format_value(d['metric'], d['baseline']):>12}{_format_value(d['metric'], d['current']):>12}"
+            f"{100 * d['change']:>+8.1f}%{flag}"
+        )
+    return "\n".join(lines)
+
+
+def check(
+        current: List[Dict[str, Any]],
+        baseline_path: str,
+        thresholds: Dict[str, float] = DEFAULT_THRESHOLDS,
+        metadata: Dict[str, Any] = None,
+        verbose: bool = False,
+) -> int:
+    """Print the diff against a baseline file and return the process exit code."""
+    baseline_metadata, baseline = load_results(baseline_path)
+    if metadata is not None:
+        for field in ("platform", "device", "jax_version"):
+            if baseline_metadata.get(field) != metadata.get(field):
+                print(f"Warning: baseline {field} is {baseline_metadata.get(field)}, current is {metadata.get(field)}")
+    diffs = compare(current, baseline, thresholds)
+    regressions = [d for d in diffs if d["regression"]]
+    print(format_table(diffs, only_regressions=not verbose))
+    compared = len({d["key"] for d in diffs})
+    print(f"\n{compared} configurations compared, {len(regressions)} regressions")
+    return 1 if regressions else 0
+
+
+def add_threshold_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--FPS_THRESHOLD',
+                        type=float,
+                        default=DEFAULT_THRESHOLDS["fps"],
+                        help='Relative FPS drop counted as a regression')
+    parser.add_argument('--COMPILE_THRESHOLD',
+                        type=float,
+                        default=DEFAULT_THRESHOLDS["compile_time"],
+                        help='Relative compile time increase counted as a regression')
+    parser.add_argument('--MEMORY_THRESHOLD',
+                        type=float,
+                        default=DEFAULT_THRESHOLDS["memory"],
+                        help='Relative temp memory increase counted as a regression')
+    parser.add_argument('--VERBOSE',
+                        action='store_true',
+                        help='Show every compared metric, not only regressions')
+
+
+def thresholds_from_args(args) -> Dict[str, float]:
+    return {
+        "fps": args.FPS_THRESHOLD,
+        "compile_time": args.COMPILE_THRESHOLD,
+        "memory": args.MEMORY_THRESHOLD,
+    }
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare FPS benchmark results against a baseline")
+    parser.add_argument('--BASELINE',
+                        type=str,
+                        required=True,
+                        help='Baseline results JSON')
+    parser.add_argument('--CURRENT',
+                        type=str,
+                        required=True,
+                        help='Current results JSON written by benchmarks.fps')
+    add_threshold_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    metadata, current = load_results(args.CURRENT)
+    sys.exit(check(current, args.BASELINE, thresholds_from_args(args), metadata, args.VERBOSE))
+
+
+if __name__ == '__main__':
+    main()
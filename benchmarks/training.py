@@ -0,0 +1,215 @@
+"""
+Throughput, memory and return of baseline training for configuration variants.
+
+Every variant overrides the default configuration of a baseline, e.g. with
+`SHARED_ENCODER=True`. For each variant a short training run is compiled ahead
+of time, timed, and its returns are read from the metrics of the last updates.
+
+    python -m benchmarks.training --TRAIN_TYPE PPO --VARIANTS SHARED_ENCODER=False SHARED_ENCODER=True
+    python -m benchmarks.training --TRAIN_TYPE PQN --VARIANTS ENCODER=default ENCODER=nature ENCODER=space_to_depth
+    python -m benchmarks.training --PLATFORM cpu --TRAIN_TYPE PQN_RNN --VARIANTS PRECISION=fp32 PRECISION=bf16
+
+"""
+import argparse
+import ast
+import gc
+from typing import Any, Dict
+
+import equinox as eqx
+import jax
+import numpy as np
+
+from popgym_arcade.baselines import pqn, pqn_rnn, ppo, ppo_rnn
+from popgym_arcade.baselines.model.encoders import encoder_cost
+from benchmarks.common import compile_fn, environment_metadata, median_ci, time_fn, write_results
+from benchmarks.pqn_rnn_memory import DEFAULT_CONFIG as PQN_RNN_CONFIG
+
+# Defaults of the subcommands of popgym_arcade/train.py
+PPO_CONFIG = {
+    "LR": 1e-4,
+    "NUM_STEPS": 128,
+    "UPDATE_EPOCHS": 4,
+    "NUM_MINIBATCHES": 16,
+    "GAMMA": 0.99,
+    "GAE_LAMBDA": 0.95,
+    "CLIP_EPS": 0.2,
+    "ENT_COEF": 0.01,
+    "VF_COEF": 0.5,
+    "MAX_GRAD_NORM": 0.5,
+    "ANNEAL_LR": True,
+    "DEBUG": False,
+    "MEMORY_TYPE": "lru",
+}
+PQN_CONFIG = {
+    "MEMORY_TYPE": "MLP",
+    "NUM_STEPS": 128,
+    "EPS_START": 1,
+    "EPS_FINISH": 0.05,
+    "EPS_DECAY": 0.25,
+    "NUM_MINIBATCHES": 16,
+    "NUM_EPOCHS": 4,
+    "LR": 0.00005,
+    "MAX_GRAD_NORM": 0.5,
+    "LR_LINEAR_DECAY": True,
+    "REW_SCALE": 1,
+    "GAMMA": 0.99,
+    "LAMBDA": 0.95,
+}
+ALGORITHMS = {
+    "PPO": (ppo, PPO_CONFIG),
+    "PPO_RNN": (ppo_rnn, PPO_CONFIG),
+    "PQN": (pqn, PQN_CONFIG),
+    "PQN_RNN": (pqn_rnn, PQN_RNN_CONFIG),
+}
+
+
+def make_config(train_type: str, env_id: str, num_envs: int, num_updates: int, seed: int = 0, **overrides) -> dict:
+    """Default configuration of `train_type` for a run of `num_updates` updates."""
+    _, defaults = ALGORITHMS[train_type]
+    config = {
+        **defaults,
+        "TRAIN_TYPE": train_type,
+        "ENV_NAME": env_id,
+        "PARTIAL": False,
+        "SEED": seed,
+        "NUM_ENVS": num_envs,
+        "WANDB_MODE": "disabled",
+        "TEST_DURING_TRAINING": False,
+        **overrides,
+    }
+    config["TOTAL_TIMESTEPS"] = config["TOTAL_TIMESTEPS_DECAY"] = num_updates * config["NUM_STEPS"] * num_envs
+    return config
+
+
+def parse_variant(variant: str) -> Dict[str, Any]:
+    """Parse `KEY=VALUE,KEY=VALUE` into config overrides, values are Python literals or strings."""
+    overrides = {}
+    for item in filter(None, variant.split(",")):
+        key, value = item.split("=", 1)
+        try:
+            overrides[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[key] = value
+    return overrides
+
+
+def benchmark_variant(
+        train_type: str,
+        env_id: str,
+        variant: str,
+        num_envs: int = 16,
+        num_updates: int = 16,
+        num_seeds: int = 1,
+        repeats: int = 3,
+        seed: int = 0,
+) -> dict:
+    """Compile and time `num_updates` updates of a variant, returning a row of the results table."""
+    module, _ = ALGORITHMS[train_type]
+    config = make_config(train_type, env_id, num_envs, num_updates, seed, **parse_variant(variant))
+    init, train_segment, _ = module.make_train_segments(config)
+
+    def run(rngs):
+        # The optimizer in the runner state is not an array, only arrays can leave jit
+        def train(rng):
+            return eqx.filter(train_segment(init(rng), config["NUM_UPDATES"]), eqx.is_array)
+
+        return eqx.filter_vmap(train)(rngs)
+
+    rngs = jax.random.split(jax.random.PRNGKey(seed), num_seeds)
+    compiled, compile_time, memory = compile_fn(run, rngs)
+    times = time_fn(compiled, (rngs,), warmup=1, repeats=repeats)
+    run_time, run_time_low, run_time_high = median_ci(times)
+    _, metrics = compiled(rngs)
+    # Returns of the last quarter of the updates, averaged over seeds
+    returns = np.asarray(metrics["returned_episode_returns"])
+    returns = returns.reshape(returns.shape[:2] + (-1,)).mean(axis=-1)[:, -max(1, config["NUM_UPDATES"] // 4):]
+    frames = config["NUM_UPDATES"] * config["NUM_STEPS"] * num_envs * num_seeds
+    encoder = encoder_cost(config.get("ENCODER", "default"))
+    return {
+        "Train Type": train_type,
+        "Environment": env_id,
+        "Variant": variant,
+        "Num Envs": num_envs,
+        "Num Seeds": num_seeds,
+        "Num Updates": config["NUM_UPDATES"],
+        "FPS": frames / run_time,
+        "FPS CI Low": frames / run_time_high,
+        "FPS CI High": frames / run_time_low,
+        "Update Time": run_time / config["NUM_UPDATES"],
+        "Compile Time": compile_time,
+        "Temp Memory": memory["temp_size_in_bytes"],
+        "Encoder Params": encoder["params"],
+        "Encoder FLOPs": encoder["flops"],
+        "Return": float(returns.mean()),
+    }
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Baseline training throughput and return benchmark")
+    parser.add_argument('--TRAIN_TYPE',
+                        type=str,
+                        default='PPO',
+                        choices=list(ALGORITHMS),
+                        help='Baseline to train')
+    parser.add_argument('--ENV_NAME',
+                        type=str,
+                        default='CartPoleEasy',
+                        help='Environment to train on')
+    parser.add_argument('--VARIANTS',
+                        type=str,
+                        nargs='+',
+                        default=[''],
+                        help='Config overrides to compare, each as KEY=VALUE,KEY=VALUE, empty for the defaults')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        default=16,
+                        help='Number of parallel environments')
+    parser.add_argument('--NUM_UPDATES',
+                        type=int,
+                        default=16,
+                        help='Updates per timed run')
+    parser.add_argument('--NUM_SEEDS',
+                        type=int,
+                        default=1,
+                        help='Number of vmapped seeds')
+    parser.add_argument('--REPEATS',
+                        type=int,
+                        default=3,
+                        help='Timed runs per variant')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    parser.add_argument('--OUT',
+                        type=str,
+                        default='benchmark_results/training',
+                        help='Output path prefix for the .json and .csv results')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    rows = []
+    for variant in args.VARIANTS:
+        row = benchmark_variant(
+            args.TRAIN_TYPE, args.ENV_NAME, variant,
+            args.NUM_ENVS, args.NUM_UPDATES, args.NUM_SEEDS, args.REPEATS,
+        )
+        temp = row["Temp Memory"]
+        print(
+            f"{args.TRAIN_TYPE} {args.ENV_NAME} - Variant: {variant or 'default'}, "
+            f"FPS: {row['FPS']:.0f} [{row['FPS CI Low']:.0f}, {row['FPS CI High']:.0f}], "
+            f"Temp memory: {'n/a' if temp is None else f'{temp / 2 ** 20:.1f}MiB'}, "
+            f"Return: {row['Return']:.3f}"
+        )
+        rows.append(row)
+        jax.clear_caches()
+        gc.collect()
+    write_results(rows, args.OUT, environment_metadata())
+    print(f"Results written to {args.OUT}.json and {args.OUT}.csv")
+
+
+if __name__ == '__main__':
+    main()
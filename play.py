@@ -6,6 +6,8 @@ import numpy as np
 # Change these to play other games
 ENV_NAME = "BattleShipEasy"
 IS_POMDP = False
+# "numpy" steps BattleShip and MineSweeper without dispatching to XLA
+BACKEND = "jax"
 
 def to_surf(arr):
     # Convert jax arry to pygame surface
@@ -14,12 +16,17 @@ def to_surf(arr):
 
 # Create env env variant
 env, env_params = popgym_arcade.make(
-    ENV_NAME, partial_obs=IS_POMDP
+    ENV_NAME, partial_obs=IS_POMDP, backend=BACKEND
 )
 
 # Vectorize and compile the env
-env_reset = jax.jit(env.reset)
-env_step = jax.jit(env.step)
+if BACKEND == "jax":
+    env_reset = jax.jit(env.reset)
+    env_step = jax.jit(env.step)
+else:
+    # The NumPy envs draw from their own random generator
+    env_reset = lambda key, params: env.reset(None, params)
+    env_step = lambda key, state, action, params: env.step(None, state, action, params)
 
 # Initialize environment
 key = jax.random.PRNGKey(0)
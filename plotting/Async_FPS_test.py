@@ -0,0 +1,79 @@
+"""
+Compare the throughput and per-batch latency of AsyncVectorEnv against a synchronous
+jitted step loop that copies observations to NumPy every step.
+
+"""
+import csv
+import os
+import time
+
+import jax
+import numpy as np
+import popgym_arcade
+from popgym_arcade.vector import AsyncVectorEnv
+
+env_name = os.getenv("ENV_NAME", "NavigatorEasy")
+partial_obs = os.getenv("PARTIAL_OBS", "False") == "True"
+n_steps = int(os.getenv("NUM_STEPS", 256))
+batch_sizes = [int(b) for b in os.getenv("BATCH_SIZES", "16,64,256,1024").split(",")]
+rng = np.random.default_rng(0)
+
+
+def test_sync(batch_size):
+    env, env_params = popgym_arcade.make(env_name, partial_obs=partial_obs)
+    vmap_reset = jax.jit(jax.vmap(env.reset, in_axes=(0, None)))
+    vmap_step = jax.jit(jax.vmap(env.step, in_axes=(0, 0, 0, None)))
+    keys = jax.random.split(jax.random.PRNGKey(0), batch_size)
+    obs, state = vmap_reset(keys, env_params)
+    actions = rng.integers(0, env.num_actions, batch_size)
+    vmap_step(keys, state, actions, env_params)[0].block_until_ready()
+
+    latencies = []
+    start = time.time()
+    for t in range(n_steps):
+        t0 = time.time()
+        actions = rng.integers(0, env.num_actions, batch_size)
+        keys = jax.random.split(jax.random.PRNGKey(t), batch_size)
+        obs, state, reward, done, _ = vmap_step(keys, state, actions, env_params)
+        obs = np.asarray(obs)
+        latencies.append(time.time() - t0)
+    return batch_size * n_steps / (time.time() - start), np.mean(latencies)
+
+
+def test_async(batch_size):
+    # Two batches in flight: the device steps one while the host consumes the other
+    env = AsyncVectorEnv(env_name, 2 * batch_size, batch_size, partial_obs=partial_obs)
+    env.async_reset()
+    for _ in range(2):
+        obs, reward, done, info, env_ids = env.recv()
+        env.send(rng.integers(0, env.action_space.n, batch_size), env_ids)
+    # Warm up the compiled step
+    for _ in range(2):
+        obs, reward, done, info, env_ids = env.recv()
+        env.send(rng.integers(0, env.action_space.n, batch_size), env_ids)
+
+    latencies = []
+    start = time.time()
+    for _ in range(n_steps):
+        t0 = time.time()
+        obs, reward, done, info, env_ids = env.recv()
+        latencies.append(time.time() - t0)
+        env.send(rng.integers(0, env.action_space.n, batch_size), env_ids)
+    fps = batch_size * n_steps / (time.time() - start)
+    env.close()
+    return fps, np.mean(latencies)
+
+
+csv_file = 'async_fps_results.csv'
+write_header = not os.path.exists(csv_file)
+with open(csv_file, mode='a', newline='') as file:
+    writer = csv.writer(file)
+    if write_header:
+        writer.writerow(["Environment", "Partial Obs", "Mode", "Batch Size", "Num Steps", "FPS", "Latency (ms)"])
+    for batch_size in batch_sizes:
+        for mode, test in (("sync", test_sync), ("async", test_async)):
+            fps, latency = test(batch_size)
+            print(f"{env_name} - {mode} - Batch: {batch_size}, Steps: {n_steps}, FPS: {fps:.0f}, Latency: {1000 * latency:.3f}ms")
+            writer.writerow([env_name, partial_obs, mode, batch_size, n_steps, f"{fps:.0f}", f"{1000 * latency:.3f}"])
+
+print(f"Testing complete. Results appended to {csv_file}")
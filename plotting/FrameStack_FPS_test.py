@@ -0,0 +1,118 @@
+"""
+Compare the concatenating FrameStackWrapper against a ring buffer that only writes the new frame.
+
+The ring buffer hands out its raw `(num_frames, H, W, C)` buffer and leaves the
+rotation by `state.index` to the consumer, so it does the least work possible
+per step. With ENV_NAME=FrameSource (the default) the frames come from a stand-in
+env that emits a constant 256x256x3 frame, so only the stacking is timed.
+
+"""
+import os
+import time
+from functools import partial
+
+import jax
+import jax.numpy as jnp
+import popgym_arcade
+from flax import struct
+from gymnax.environments import spaces
+from popgym_arcade.wrappers import GymnaxWrapper, FrameStackWrapper
+
+env_name = os.getenv("ENV_NAME", "FrameSource")
+partial_obs = os.getenv("PARTIAL_OBS", "True") == "True"
+n_envs = int(os.getenv("NUM_ENVS", 16))
+n_steps = int(os.getenv("NUM_STEPS", 128))
+n_frames = int(os.getenv("NUM_FRAMES", 4))
+
+
+class FrameSource:
+    """Stand-in env whose step only emits a 256x256x3 frame and ends an episode every 50 steps."""
+
+    default_params = None
+
+    def reset(self, key, params=None):
+        return jnp.zeros((256, 256, 3)), jnp.array(0, dtype=jnp.int32)
+
+    def step(self, key, state, action, params=None):
+        state = state + 1
+        obs = jnp.full((256, 256, 3), (state % 13) / 13.0)
+        return obs, state, 0.0, state % 50 == 0, {}
+
+    def action_space(self, params=None):
+        return spaces.Discrete(5)
+
+
+@struct.dataclass
+class RingEnvState:
+    env_state: object
+    frames: jax.Array
+    index: int
+
+
+class RingFrameStack(GymnaxWrapper):
+    """Writes each frame in place and returns the raw buffer, the newest frame is at `state.index`."""
+
+    def __init__(self, env, num_frames):
+        super().__init__(env)
+        self.num_frames = num_frames
+
+    def _fill(self, obs):
+        return jnp.broadcast_to(obs[None], (self.num_frames, *obs.shape))
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(self, key, params=None):
+        obs, env_state = self._env.reset(key, params)
+        frames = self._fill(obs)
+        return frames, RingEnvState(env_state, frames, jnp.array(self.num_frames - 1, dtype=jnp.int32))
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(self, key, state, action, params=None):
+        obs, env_state, reward, done, info = self._env.step(key, state.env_state, action, params)
+        index = (state.index + 1) % self.num_frames
+        frames = jax.lax.dynamic_update_index_in_dim(state.frames, obs, index, axis=0)
+        frames = jnp.where(done, self._fill(obs), frames)
+        return frames, RingEnvState(env_state, frames, index), reward, done, info
+
+
+def make_rollout(env, env_params):
+    vmap_reset = jax.vmap(env.reset, in_axes=(0, None))
+    vmap_step = jax.vmap(env.step, in_axes=(0, 0, 0, None))
+    vmap_sample = jax.vmap(env.action_space(env_params).sample)
+
+    def rollout(seed):
+        obs, state = vmap_reset(jax.random.split(seed, n_envs), env_params)
+
+        def step(carry, key):
+            obs, state = carry
+            key_act, key_step = jax.random.split(key)
+            action = vmap_sample(jax.random.split(key_act, n_envs))
+            obs, state, _, _, _ = vmap_step(jax.random.split(key_step, n_envs), state, action, env_params)
+            return (obs, state), None
+
+        (obs, state), _ = jax.lax.scan(step, (obs, state), jax.random.split(seed, n_steps))
+        return obs
+
+    return jax.jit(rollout)
+
+
+def time_fps(env, env_params, repeats=5):
+    rollout = make_rollout(env, env_params)
+    rollout(jax.random.PRNGKey(0)).block_until_ready()
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        rollout(jax.random.PRNGKey(i + 1)).block_until_ready()
+        times.append(time.time() - start)
+    return n_envs * n_steps / sorted(times)[repeats // 2]
+
+
+if env_name == "FrameSource":
+    base_env, env_params = FrameSource(), None
+else:
+    base_env, env_params = popgym_arcade.make(env_name, partial_obs=partial_obs)
+for name, env in (
+        ("concatenate", FrameStackWrapper(base_env, n_frames)),
+        ("ring buffer", RingFrameStack(base_env, n_frames)),
+):
+    fps = time_fps(env, env_params)
+    print(f"{env_name} - {name} - Envs: {n_envs}, Steps: {n_steps}, Frames: {n_frames}, FPS: {fps:.0f}")
@@ -0,0 +1,88 @@
+"""
+Validate the NumPy backend frame-for-frame against the JAX environments and compare
+their per-step latency at batch size 1.
+
+"""
+import dataclasses
+import os
+import time
+
+import jax
+import numpy as np
+import popgym_arcade
+from popgym_arcade.environments.numpy_backend import NUMPY_ENVIRONMENTS
+
+n_steps = int(os.getenv("NUM_STEPS", 500))
+env_names = os.getenv("ENV_NAME", ",".join(NUMPY_ENVIRONMENTS)).split(",")
+
+
+def states_equal(a, b):
+    for field in dataclasses.fields(a):
+        x, y = getattr(a, field.name), getattr(b, field.name)
+        if not np.array_equal(np.asarray(x), np.asarray(y)):
+            return False
+    return True
+
+
+def validate(env_name, partial_obs):
+    """Step the JAX env with random actions and check every frame and transition of the NumPy env."""
+    jax_env, env_params = popgym_arcade.make(env_name, partial_obs=partial_obs)
+    np_env, _ = popgym_arcade.make(env_name, backend="numpy", partial_obs=partial_obs)
+    reset = jax.jit(jax_env.reset)
+    step = jax.jit(jax_env.step)
+    step_env = jax.jit(jax_env.step_env)
+    rng = np.random.default_rng(0)
+
+    key = jax.random.PRNGKey(0)
+    key, key_reset = jax.random.split(key)
+    obs, state = reset(key_reset, env_params)
+    for t in range(n_steps):
+        np_state = np_env.from_jax_state(state)
+        if not np.array_equal(np_env.get_obs(np_state), np.asarray(obs)):
+            raise AssertionError(f"{env_name} (partial_obs={partial_obs}): frame mismatch at step {t}")
+
+        action = int(rng.integers(np_env.num_actions))
+        key, key_step = jax.random.split(key)
+        _, jax_next, jax_reward, jax_done, _ = step_env(key_step, state, action, env_params)
+        np_next, np_reward, np_done = np_env.step_env(np_state, action)
+        if not (
+                states_equal(np_next, np_env.from_jax_state(jax_next))
+                and np.isclose(np_reward, float(jax_reward))
+                and np_done == bool(jax_done)
+        ):
+            raise AssertionError(f"{env_name} (partial_obs={partial_obs}): transition mismatch at step {t}")
+
+        obs, state, _, _, _ = step(key_step, state, action, env_params)
+    print(f"{env_name} - partial_obs={partial_obs} - {n_steps} frames match")
+
+
+def latency(env_name):
+    """Mean wall-clock time of a single-env step, including the transfer of the frame to NumPy."""
+    jax_env, env_params = popgym_arcade.make(env_name)
+    np_env, _ = popgym_arcade.make(env_name, backend="numpy")
+    rng = np.random.default_rng(0)
+    actions = rng.integers(np_env.num_actions, size=n_steps)
+
+    step = jax.jit(jax_env.step)
+    key = jax.random.PRNGKey(0)
+    obs, state = jax.jit(jax_env.reset)(key, env_params)
+    step(key, state, 0, env_params)[0].block_until_ready()
+    start = time.time()
+    for action in actions:
+        key, key_step = jax.random.split(key)
+        obs, state, _, _, _ = step(key_step, state, int(action), env_params)
+        obs = np.asarray(obs)
+    jax_latency = (time.time() - start) / n_steps
+
+    obs, state = np_env.reset()
+    start = time.time()
+    for action in actions:
+        obs, state, _, _, _ = np_env.step(None, state, int(action))
+    np_latency = (time.time() - start) / n_steps
+    print(f"{env_name} - Latency: jax {1e6 * jax_latency:.0f}us, numpy {1e6 * np_latency:.0f}us")
+
+
+for env_name in env_names:
+    for partial_obs in (False, True):
+        validate(env_name, partial_obs)
+    latency(env_name)
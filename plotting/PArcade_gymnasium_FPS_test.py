@@ -0,0 +1,59 @@
+"""
+Compute the average steps per second of popgym_arcade through the Gymnasium vector API,
+using the same harness as Atari_FPS_test.py.
+
+"""
+import csv
+import os
+import time
+
+import gymnasium as gym
+from popgym_arcade.gymnasium import register_envs
+
+register_envs()
+n_envs = int(os.getenv("NUM_ENVS", 512))
+n_steps = int(os.getenv("NUM_STEPS", 32))
+seed = int(os.getenv("SEED", 0))
+partial_obs = os.getenv("PARTIAL_OBS", "False") == "True"
+
+env_name = os.getenv("ENV_NAME", "BattleShipEasy")
+env = gym.make_vec(
+    f"popgym_arcade/{env_name}",
+    num_envs=n_envs,
+    vectorization_mode="vector_entry_point",
+    partial_obs=partial_obs,
+)
+env_params = None
+
+
+def test_multi_env_fps(env=env, env_params=env_params, seed=seed, n_envs=n_envs, n_steps=n_steps):
+    """Test FPS for multiple environments."""
+
+    obs, infos = env.reset(seed=seed)
+
+    for _ in range(n_steps):
+        _ = env.action_space.seed(seed)
+        actions = env.action_space.sample()
+        obs, rewards, terminates, truncates, infos = env.step(actions)
+
+    return obs
+
+
+# Compile reset and step outside the timed region
+test_multi_env_fps(env, env_params, seed, n_envs, 1)
+
+start = time.time()
+test_multi_env_fps(env, env_params, seed, n_envs, n_steps)
+end = time.time()
+
+runtime = end - start
+fps = n_envs * n_steps / runtime
+print(f"time: {end - start}s")
+print(f"{env_name} - Multi Env - Envs: {n_envs}, Steps: {n_steps}, FPS: {fps}")
+csv_file = 'parcade_gymnasium_fps_results.csv'
+write_header = not os.path.exists(csv_file)
+with open(csv_file, mode='a', newline='') as file:
+    writer = csv.writer(file)
+    if write_header:
+        writer.writerow(["Environment", "Partial Obs", "Num Envs", "Num Steps", "FPS", "Seed"])
+    writer.writerow([env_name, partial_obs, n_envs, n_steps, f"{fps:.0f}", seed])
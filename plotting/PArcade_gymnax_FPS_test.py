@@ -38,10 +38,15 @@ def test_multi_env_fps(env=env, env_params=env_params, seed=seed, num_envs=n_env
     seeds = jax.random.split(seed, num_envs)
     obs, states = vmap_reset(seeds, env_params)
 
-    for _ in range(num_steps):
-        action = vmap_sample(seeds)
-        obs, states, rewards, dones, _ = vmap_step(seeds, states, action, env_params)
+    # lax.scan keeps compile time independent of num_steps
+    def step(carry, key):
+        obs, states = carry
+        key_act, key_step = jax.random.split(key)
+        action = vmap_sample(jax.random.split(key_act, num_envs))
+        obs, states, rewards, dones, _ = vmap_step(jax.random.split(key_step, num_envs), states, action, env_params)
+        return (obs, states), None
 
+    (obs, states), _ = jax.lax.scan(step, (obs, states), jax.random.split(seed, num_steps))
     return obs
 
 fps = jax.jit(test_multi_env_fps)
@@ -0,0 +1,49 @@
+"""
+Measure how CPU throughput scales when the env batch is sharded across host devices.
+
+"""
+import os
+
+from popgym_arcade.sharded import set_host_device_count
+
+max_devices = int(os.getenv("NUM_DEVICES", os.cpu_count()))
+# Must happen before JAX initializes the CPU backend
+set_host_device_count(max_devices)
+
+import csv
+import time
+
+import jax
+import popgym_arcade
+from popgym_arcade.registration import REGISTERED_ENVIRONMENTS
+from popgym_arcade.sharded import make_mesh, make_sharded_rollout, shard_keys
+
+env_names = os.getenv("ENV_NAME", ",".join(REGISTERED_ENVIRONMENTS)).split(",")
+partial_obs = os.getenv("PARTIAL_OBS", "False") == "True"
+n_envs = int(os.getenv("NUM_ENVS", 512))
+n_steps = int(os.getenv("NUM_STEPS", 128))
+
+device_counts = [2 ** i for i in range(max_devices.bit_length()) if 2 ** i <= max_devices]
+devices = jax.devices("cpu")
+
+csv_file = 'sharded_fps_results.csv'
+write_header = not os.path.exists(csv_file)
+with open(csv_file, mode='a', newline='') as file:
+    writer = csv.writer(file)
+    if write_header:
+        writer.writerow(["Environment", "Partial Obs", "Num Devices", "Num Envs", "Num Steps", "FPS"])
+    for env_name in env_names:
+        env, env_params = popgym_arcade.make(env_name, partial_obs=partial_obs)
+        for n_devices in device_counts:
+            mesh = make_mesh(devices[:n_devices])
+            rollout = make_sharded_rollout(env, env_params, mesh, n_steps)
+            rollout(shard_keys(jax.random.PRNGKey(0), n_envs, mesh)).block_until_ready()
+
+            keys = shard_keys(jax.random.PRNGKey(1), n_envs, mesh)
+            start = time.time()
+            rollout(keys).block_until_ready()
+            fps = n_envs * n_steps / (time.time() - start)
+            print(f"{env_name} - Devices: {n_devices}, Envs: {n_envs}, Steps: {n_steps}, FPS: {fps:.0f}")
+            writer.writerow([env_name, partial_obs, n_devices, n_envs, n_steps, f"{fps:.0f}"])
+
+print(f"Testing complete. Results appended to {csv_file}")
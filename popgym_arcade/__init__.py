@@ -1 +1,2 @@
 from popgym_arcade.registration import make
+from popgym_arcade.rollouts import init_rollout, rollout
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import jax
+from jaxlib.xla_extension import XlaRuntimeError
+
+import popgym_arcade
+from popgym_arcade.rollouts import init_rollout, rollout
+
+
+DEFAULT_DIR = "autotune_results"
+
+
+def _result_path(directory: str, env_id: str, partial_obs: bool) -> str:
+    return os.path.join(directory, f"{env_id}_Partial={partial_obs}.json")
+
+
+def measure(
+        env_id: str,
+        num_envs: int,
+        partial_obs: bool = False,
+        num_steps: int = 128,
+        num_iters: int = 5,
+) -> Dict[str, float]:
+    """
+    Measure the steady-state throughput and compiled memory of a random-action rollout.
+
+    Args:
+        env_id: Registered environment name.
+        num_envs: Number of parallel environments.
+        partial_obs: Whether to use the POMDP variant.
+        num_steps: Steps per rollout.
+        num_iters: Number of timed rollouts after warmup, the median is reported.
+
+    Returns:
+        Frames per second, compile time and the sizes reported by `memory_analysis()` in bytes.
+    """
+    env, env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+
+    def policy(carry, obs, last_done, key):
+        action = jax.random.randint(key, last_done.shape, 0, env.num_actions)
+        return carry, action, None
+
+    def run(state):
+        state, _ = rollout(env, policy, num_steps, state, env_params)
+        # Only the carried state is returned so the trajectory is never materialized
+        return state
+
+    state = init_rollout(env, jax.random.PRNGKey(0), num_envs, params=env_params)
+    start = time.perf_counter()
+    compiled = jax.jit(run, donate_argnums=0).lower(state).compile()
+    compile_time = time.perf_counter() - start
+
+    state = jax.block_until_ready(compiled(state))
+    times = []
+    for _ in range(num_iters):
+        start = time.perf_counter()
+        state = jax.block_until_ready(compiled(state))
+        times.append(time.perf_counter() - start)
+
+    result = {
+        "num_envs": num_envs,
+        "fps": num_envs * num_steps / statistics.median(times),
+        "compile_time": compile_time,
+    }
+    memory = compiled.memory_analysis()
+    for name in ("temp_size_in_bytes", "argument_size_in_bytes", "output_size_in_bytes", "generated_code_size_in_bytes"):
+        result[name] = getattr(memory, name, None) if memory is not None else None
+    return result
+
+
+def find_knee(results: List[Dict[str, float]], tolerance: float = 0.1) -> int:
+    """Smallest batch size whose throughput is within `tolerance` of the best one."""
+    best = max(r["fps"] for r in results)
+    return min(r["num_envs"] for r in results if r["fps"] >= (1 - tolerance) * best)
+
+
+def autotune(
+        env_id: str,
+        partial_obs: bool = False,
+        min_envs: int = 1,
+        max_envs: int = 8192,
+        num_steps: int = 128,
+        num_iters: int = 5,
+        tolerance: float = 0.1,
+        max_memory_gb: Optional[float] = None,
+        directory: Optional[str] = DEFAULT_DIR,
+) -> dict:
+    """
+    Sweep `num_envs` over powers of two and report where throughput saturates.
+
+    The sweep stops early once the compiled rollout would need more than
+    `max_memory_gb` of temporary memory, or when the device runs out of memory.
+
+    Args:
+        env_id: Registered environment name.
+        partial_obs: Whether to use the POMDP variant.
+        min_envs: Smallest batch size.
+        max_envs: Largest batch size.
+        num_steps: Steps per rollout.
+        num_iters: Timed rollouts per batch size.
+        tolerance: Relative FPS loss accepted in exchange for a smaller batch.
+        max_memory_gb: Temporary memory budget of the compiled rollout.
+        directory: Directory the JSON report is written to, `None` to skip writing.
+
+    Returns:
+        The report, with the per-batch-size measurements and the knee as `num_envs`.
+    """
+    results = []
+    num_envs = min_envs
+    while num_envs <= max_envs:
+        try:
+            result = measure(env_id, num_envs, partial_obs, num_steps, num_iters)
+        except XlaRuntimeError as e:
+            if "RESOURCE_EXHAUSTED" not in str(e):
+                raise
+            print(f"{env_id} - Envs: {num_envs}, out of memory")
+            break
+        results.append(result)
+        print(
+            f"{env_id} - Envs: {num_envs}, FPS: {result['fps']:.0f}, "
+            f"Temp memory: {result['temp_size_in_bytes']}, Compile: {result['compile_time']:.1f}s"
+        )
+        temp = result["temp_size_in_bytes"]
+        if max_memory_gb is not None and temp is not None and temp > max_memory_gb * 2 ** 30:
+            break
+        num_envs *= 2
+
+    if not results:
+        raise RuntimeError(f"{env_id} - Out of memory with the smallest batch size of {min_envs} envs, nothing to tune")
+    report = {
+        "env_id": env_id,
+        "partial_obs": partial_obs,
+        "device": jax.devices()[0].device_kind,
+        "jax_version": jax.__version__,
+        "num_steps": num_steps,
+        "tolerance": tolerance,
+        "num_envs": find_knee(results, tolerance),
+        "results": results,
+    }
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        with open(_result_path(directory, env_id, partial_obs), "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def load_num_envs(env_id: str, partial_obs: bool = False, directory: str = DEFAULT_DIR) -> int:
+    """Read the autotuned `num_envs` for an environment."""
+    path = _result_path(directory, env_id, partial_obs)
+    if not os.path.exists(path):
+        raise ValueError(
+            f"No autotune results for {env_id} (partial_obs={partial_obs}) in {directory}, "
+            f"run python -m popgym_arcade.autotune --env {env_id} first"
+        )
+    with open(path) as f:
+        return json.load(f)["num_envs"]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Find the env batch size where throughput saturates")
+    parser.add_argument('--ENV_NAME', '--env',
+                        type=str,
+                        default='BattleShipEasy',
+                        help='Environment name')
+    parser.add_argument('--PARTIAL',
+                        action='store_true',
+                        help='Partial Observations')
+    parser.add_argument('--MIN_ENVS',
+                        type=int,
+                        default=1,
+                        help='Smallest number of environments')
+    parser.add_argument('--MAX_ENVS',
+                        type=int,
+                        default=8192,
+                        help='Largest number of environments')
+    parser.add_argument('--NUM_STEPS',
+                        type=int,
+                        default=128,
+                        help='Steps per timed rollout')
+    parser.add_argument('--NUM_ITERS',
+                        type=int,
+                        default=5,
+                        help='Timed rollouts per batch size')
+    parser.add_argument('--TOLERANCE',
+                        type=float,
+                        default=0.1,
+                        help='Relative FPS loss accepted for a smaller batch')
+    parser.add_argument('--MAX_MEMORY_GB',
+                        type=float,
+                        default=None,
+                        help='Stop the sweep above this much temporary memory')
+    parser.add_argument('--OUT_DIR',
+                        type=str,
+                        default=DEFAULT_DIR,
+                        help='Output directory')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    report = autotune(
+        args.ENV_NAME,
+        partial_obs=args.PARTIAL,
+        min_envs=args.MIN_ENVS,
+        max_envs=args.MAX_ENVS,
+        num_steps=args.NUM_STEPS,
+        num_iters=args.NUM_ITERS,
+        tolerance=args.TOLERANCE,
+        max_memory_gb=args.MAX_MEMORY_GB,
+        directory=args.OUT_DIR,
+    )
+    print(f"{args.ENV_NAME} - Knee at {report['num_envs']} envs")
+
+
+if __name__ == '__main__':
+    main()
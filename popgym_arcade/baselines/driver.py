@@ -0,0 +1,167 @@
+"""
+Training driver that runs the update loop as a sequence of compiled segments.
+
+`train` is vmapped over seeds, so a `lax.cond` inside the update loop turns
+into a select and both branches run on every update. Work that should only
+happen every few updates, like the greedy test rollout, a checkpoint or
+logging, is scheduled here on the host between segments instead. The runner
+state is donated to each segment so its buffers are updated in place.
+"""
+import os
+import warnings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import orbax.checkpoint as ocp
+
+from popgym_arcade.baselines.metrics import make_writer
+
+
+def segment_lengths(num_updates: int, segment: int, start: int = 0) -> List[int]:
+    """
+    Split the updates from `start` to `num_updates` into segments ending at multiples of `segment`.
+
+    With `segment <= 0` the remaining updates are a single segment. Every
+    segment but the first after an unaligned `start` and the last is
+    `segment` long, so at most two segment lengths compile.
+    """
+    boundaries = {num_updates}
+    if segment > 0:
+        boundaries.update(range(segment, num_updates, segment))
+    boundaries = [start] + sorted(b for b in boundaries if b > start)
+    return [end - begin for begin, end in zip(boundaries[:-1], boundaries[1:])]
+
+
+def snap_intervals(segment: int, *intervals: int) -> Tuple[int, ...]:
+    """
+    Round every positive interval to a non-zero multiple of `segment`, so it ends on a segment boundary.
+
+    With `segment <= 0` the smallest positive interval is the segment length.
+    Returns the segment length followed by the rounded intervals, intervals
+    that are zero or negative stay disabled.
+    """
+    if segment <= 0:
+        segment = min((i for i in intervals if i > 0), default=0)
+    if segment <= 0:
+        return (segment, *intervals)
+    return (segment, *(max(segment, round(i / segment) * segment) if i > 0 else i for i in intervals))
+
+
+def run_name(config: Dict[str, Any]) -> str:
+    return '{}_{}_{}_Partial={}_SEED={}'.format(
+        config["TRAIN_TYPE"], config.get("MEMORY_TYPE", ""), config["ENV_NAME"], config["PARTIAL"], config["SEED"]
+    )
+
+
+def checkpoint_dir(config: Dict[str, Any]) -> str:
+    """`CHECKPOINT_DIR` or a directory named after the run, as an absolute path."""
+    return os.path.abspath(config.get("CHECKPOINT_DIR") or os.path.join("checkpoints", run_name(config)))
+
+
+def _split(runner_state) -> Tuple[List[jax.Array], Any]:
+    # Only the array leaves are checkpointed, the optimizer and other static parts come from init
+    dynamic, static = eqx.partition(runner_state, eqx.is_array)
+    leaves, treedef = jax.tree.flatten(dynamic)
+    return leaves, (treedef, static)
+
+
+def _merge(leaves: List[jax.Array], treedef_and_static) -> Any:
+    treedef, static = treedef_and_static
+    return eqx.combine(jax.tree.unflatten(treedef, leaves), static)
+
+
+def run_segments(
+        config: Dict[str, Any],
+        init: Callable,
+        train_segment: Callable,
+        test: Optional[Callable],
+        rngs: jax.Array,
+) -> Dict[str, Any]:
+    """
+    Train all seeds as compiled segments, testing and checkpointing between them.
+
+    Args:
+        config: Training configuration.
+            Segments are the smaller of `SEGMENT_UPDATES` and `LOG_INTERVAL` updates long,
+            values of zero are ignored. The metrics are handed to the sinks in `METRICS_SINKS`
+            after every segment, see `metrics.make_writer`.
+            With `TEST_DURING_TRAINING`, `test` runs every `TEST_INTERVAL * NUM_UPDATES` updates.
+            With `CHECKPOINT_INTERVAL > 0`, the runner state is saved asynchronously every
+            `CHECKPOINT_INTERVAL` updates and at the end of training, to `CHECKPOINT_DIR`.
+            Both intervals are rounded to multiples of the segment length, with a warning, or set it
+            if neither `SEGMENT_UPDATES` nor `LOG_INTERVAL` is.
+            With `RESUME`, training continues from the latest checkpoint, if any.
+        init: `init(rng) -> runner_state` for a single seed.
+        train_segment: `train_segment(runner_state, num_updates) -> (runner_state, metrics)`.
+        test: `test(train_state, rng) -> metrics`, the train state is the first
+            element of the runner state. `None` if the algorithm has no test rollouts.
+        rngs: One key per seed.
+
+    Returns:
+        The final runner state and the metrics of every update run by this call,
+        stacked as (num_seeds, num_updates), as returned by `train`.
+    """
+    init_vjit = eqx.filter_jit(eqx.filter_vmap(init))
+    # The number of updates is static, a shorter last segment compiles once more
+    segment_vjit = eqx.filter_jit(eqx.filter_vmap(train_segment), donate="all")
+    testing = config.get("TEST_DURING_TRAINING", False) and test is not None
+    test_interval = max(1, int(config["NUM_UPDATES"] * config["TEST_INTERVAL"])) if testing else 0
+    if testing:
+        test_vjit = eqx.filter_jit(eqx.filter_vmap(test))
+    # Every distinct segment length recompiles the update, so testing and
+    # checkpointing happen at multiples of a single segment length
+    segment = min((i for i in (config.get("SEGMENT_UPDATES", 0), config.get("LOG_INTERVAL", 0)) if i > 0), default=0)
+    requested = {"TEST_INTERVAL": test_interval, "CHECKPOINT_INTERVAL": config.get("CHECKPOINT_INTERVAL", 0)}
+    segment, *snapped = snap_intervals(segment, *requested.values())
+    for (name, interval), snapped_interval in zip(requested.items(), snapped):
+        if snapped_interval != interval:
+            warnings.warn(
+                f"{name} of {interval} updates is rounded to {snapped_interval}, "
+                f"a multiple of the segment length of {segment} updates"
+            )
+    test_interval, checkpoint_interval = snapped
+
+    runner_state = init_vjit(rngs)
+    n_updates = 0
+    manager = None
+    if checkpoint_interval > 0 or config.get("RESUME", False):
+        manager = ocp.CheckpointManager(
+            checkpoint_dir(config),
+            options=ocp.CheckpointManagerOptions(max_to_keep=2, enable_async_checkpointing=True),
+        )
+        if config.get("RESUME", False) and manager.latest_step() is not None:
+            n_updates = manager.latest_step()
+            leaves, treedef_and_static = _split(runner_state)
+            restored = manager.restore(
+                n_updates, args=ocp.args.StandardRestore([jax.ShapeDtypeStruct(x.shape, x.dtype) for x in leaves])
+            )
+            runner_state = _merge(restored, treedef_and_static)
+            print(f"Resuming from update {n_updates} of {config['NUM_UPDATES']}")
+
+    metrics = []
+    writer = make_writer(config, run_name(config))
+    for num_updates in segment_lengths(config["NUM_UPDATES"], segment, start=n_updates):
+        runner_state, segment_metrics = segment_vjit(runner_state, num_updates)
+        metrics.append(segment_metrics)
+        if writer is not None:
+            writer.write(segment_metrics, n_updates)
+        n_updates += num_updates
+        if testing and (n_updates % test_interval == 0 or n_updates == config["NUM_UPDATES"]):
+            test_rngs = jax.vmap(jax.random.fold_in, in_axes=(0, None))(rngs, n_updates)
+            test_metrics = test_vjit(runner_state[0], test_rngs)
+            if writer is not None:
+                writer.log({f"test_{k}": float(jnp.mean(v)) for k, v in test_metrics.items()}, n_updates)
+        if checkpoint_interval > 0 and (n_updates % checkpoint_interval == 0 or n_updates == config["NUM_UPDATES"]):
+            # Blocks only for the device to host copy, so the buffers can be donated to the next segment
+            manager.save(n_updates, args=ocp.args.StandardSave(_split(runner_state)[0]))
+
+    if manager is not None:
+        manager.wait_until_finished()
+        manager.close()
+    if writer is not None:
+        writer.close()
+    if metrics:
+        metrics = jax.tree.map(lambda *x: jnp.concatenate(x, axis=1), *metrics)
+    return {"runner_state": runner_state, "metrics": metrics}
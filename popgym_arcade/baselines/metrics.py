@@ -0,0 +1,189 @@
+"""
+Buffered metrics logging that never blocks the training loop.
+
+The metrics of every update stay on device until the end of a compiled
+segment, see `popgym_arcade.baselines.driver.run_segments`. The driver then
+hands the whole segment to a `MetricsWriter`, which starts a single
+asynchronous device to host copy and returns. A background thread waits for
+the copy, turns it into one row per update and writes the rows in batches to
+every sink, e.g. local JSONL or Parquet files and W&B.
+"""
+import json
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import jax
+import numpy as np
+import wandb
+
+Row = Dict[str, Any]
+
+
+class Sink:
+    """Destination of metric rows, `write` is only ever called from the writer thread."""
+
+    def write(self, rows: List[Row]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JSONLSink(Sink):
+    """Appends one JSON object per row to `path`."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "a")
+
+    def write(self, rows: List[Row]) -> None:
+        for row in rows:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetSink(Sink):
+    """
+    Writes every batch of rows as a part file of a Parquet dataset in `directory`.
+
+    Requires `pyarrow`, installed with the `parquet` extra. Rows of a batch may have different keys, missing values are null.
+    """
+
+    def __init__(self, directory: str):
+        import pyarrow.parquet
+        import pyarrow
+
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.part = len([f for f in os.listdir(directory) if f.endswith(".parquet")])
+
+    def write(self, rows: List[Row]) -> None:
+        table = self.pa.Table.from_pylist(rows)
+        self.pq.write_table(table, os.path.join(self.directory, f"part-{self.part:05d}.parquet"))
+        self.part += 1
+
+
+class WandbSink(Sink):
+    """Logs rows to the current W&B run, which can be offline, at the step of each row."""
+
+    def write(self, rows: List[Row]) -> None:
+        for row in rows:
+            row = dict(row)
+            wandb.log(row, step=row.pop("update"))
+
+
+class StdoutSink(Sink):
+    """Prints the last row of every batch."""
+
+    def write(self, rows: List[Row]) -> None:
+        print(", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in rows[-1].items()))
+
+
+class MetricsWriter:
+    """
+    Writes metrics to sinks from a background thread.
+
+    If a sink raises, the thread stops and the exception is raised again by
+    the next call to `write`, `log` or `close`.
+
+    Args:
+        sinks: Sinks every batch of rows is written to.
+        log_all_seeds: Also write the metrics of every seed as `seed<i>/<name>`,
+            by default only the mean over seeds is written.
+    """
+
+    def __init__(self, sinks: Sequence[Sink], log_all_seeds: bool = False):
+        self.sinks = list(sinks)
+        self.log_all_seeds = log_all_seeds
+        self.queue = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, metrics: Dict[str, jax.Array], start: int) -> None:
+        """
+        Queue the metrics of a segment of updates without waiting for the device.
+
+        Args:
+            metrics: Metrics of shape (num_seeds, num_updates, ...), extra axes are averaged.
+            start: Number of updates before the segment, the first row is logged at `start + 1`.
+        """
+        self._raise_error()
+        for x in jax.tree.leaves(metrics):
+            x.copy_to_host_async()
+        self.queue.put((metrics, start))
+
+    def log(self, row: Row, update: int) -> None:
+        """Queue a single row of host values, e.g. test metrics, after the metrics queued before it."""
+        self._raise_error()
+        self.queue.put(([{**row, "update": update}], None))
+
+    def close(self) -> None:
+        """Write the queued metrics and close every sink."""
+        self.queue.put(None)
+        self.thread.join()
+        for sink in self.sinks:
+            sink.close()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError("Writing the training metrics failed") from self.error
+
+    def _rows(self, metrics: Dict[str, jax.Array], start: int) -> List[Row]:
+        metrics = {k: np.asarray(v) for k, v in metrics.items()}
+        num_updates = next(iter(metrics.values())).shape[1]
+        rows = [{"update": start + i + 1} for i in range(num_updates)]
+        for k, v in metrics.items():
+            v = v.reshape(v.shape[:2] + (-1,)).mean(axis=-1)
+            for i, row in enumerate(rows):
+                row[k] = float(v[:, i].mean())
+                if self.log_all_seeds:
+                    row.update({f"seed{s}/{k}": float(v[s, i]) for s in range(v.shape[0])})
+        return rows
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            metrics, start = item
+            try:
+                rows = metrics if start is None else self._rows(metrics, start)
+                for sink in self.sinks:
+                    sink.write(rows)
+            except BaseException as e:
+                self.error = e
+                return
+
+
+def make_writer(config: Dict[str, Any], name: str) -> Optional[MetricsWriter]:
+    """
+    Build the writer for the sinks in `METRICS_SINKS`, or `None` without sinks.
+
+    `METRICS_SINKS` is a list of `jsonl`, `parquet`, `wandb` and `stdout`. By
+    default metrics go to W&B unless `WANDB_MODE` is `disabled`, and to stdout
+    with `DEBUG`. Local files are written to `METRICS_DIR/<name>`.
+    """
+    sink_names = config.get("METRICS_SINKS")
+    if sink_names is None:
+        sink_names = ["wandb"] if config.get("WANDB_MODE", "disabled") != "disabled" else []
+        if config.get("DEBUG", False):
+            sink_names.append("stdout")
+    path = os.path.join(config.get("METRICS_DIR") or "metrics", name)
+    sink_types = {
+        "jsonl": lambda: JSONLSink(path + ".jsonl"),
+        "parquet": lambda: ParquetSink(path),
+        "wandb": WandbSink,
+        "stdout": StdoutSink,
+    }
+    sinks = [sink_types[sink_name]() for sink_name in sink_names]
+    if not sinks:
+        return None
+    return MetricsWriter(sinks, log_all_seeds=config.get("WANDB_LOG_ALL_SEEDS", False))
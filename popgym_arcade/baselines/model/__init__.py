@@ -4,6 +4,17 @@ from popgym_arcade.baselines.model.builder import (
     ActorCritic,
     ActorCriticRNN
 )
+from popgym_arcade.baselines.model.encoders import (
+    ENCODERS,
+    Encoder,
+    make_encoder,
+    encoder_cost,
+)
+from popgym_arcade.baselines.model.precision import (
+    PRECISIONS,
+    cast,
+    cast_memory,
+)
 from popgym_arcade.baselines.model.memorax import (
     get_residual_memory_model,
     add_batch_dim,
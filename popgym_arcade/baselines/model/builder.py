@@ -3,38 +3,40 @@ import equinox.nn as nn
 import jax
 import jax.numpy as jnp
 from jaxtyping import PRNGKeyArray, Array
-from typing import Tuple
+from typing import Any, Optional, Tuple
 from distreqx import distributions
+from popgym_arcade.baselines.model.encoders import Encoder, make_encoder
 from popgym_arcade.baselines.model.memorax import get_residual_memory_model
+from popgym_arcade.baselines.model.precision import PRECISIONS, cast, cast_memory
 
 
 class ActorCritic(eqx.Module):
+    """
+    CNN + MLP actor and critic.
+
+    With `shared_encoder`, the actor and critic trunks read the embedding of a
+    single CNN, which halves the cost of encoding the observations. Otherwise
+    `critic_cnn` is a separate CNN. `encoder` names the CNN in `encoders.ENCODERS`.
+    `precision` names the compute dtype in `precision.PRECISIONS`.
+    """
     action_dim: int = 5
-    actor_cnn: nn.Sequential
+    actor_cnn: Encoder
     actor_trunk: nn.Sequential
-    critic_cnn: nn.Sequential
+    critic_cnn: Optional[Encoder]
     critic_trunk: nn.Sequential
+    shared_encoder: bool = eqx.field(static=True)
+    compute_dtype: Any = eqx.field(static=True)
 
-    def __init__(self, key: PRNGKeyArray):
+    def __init__(
+            self, key: PRNGKeyArray, shared_encoder: bool = False, encoder: str = "default", precision: str = "fp32"
+    ):
+        self.shared_encoder = shared_encoder
+        self.compute_dtype = PRECISIONS[precision]
         key_array = jax.random.split(key, 14)
-        self.actor_cnn = nn.Sequential(
-            [
-                nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=key_array[0]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=key_array[1]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=key_array[2]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=key_array[3]),
-                nn.Lambda(jax.nn.leaky_relu),
-            ]
-        )
+        self.actor_cnn = make_encoder(encoder, key_array[0], key_array[0:4])
         self.actor_trunk = nn.Sequential(
             [
-                nn.Linear(in_features=512, out_features=256, key=key_array[4]),
+                nn.Linear(in_features=self.actor_cnn.out_features, out_features=256, key=key_array[4]),
                 nn.LayerNorm(shape=256),
                 nn.Lambda(jax.nn.leaky_relu),
                 nn.Linear(in_features=256, out_features=256, key=key_array[5]),
@@ -44,24 +46,10 @@ class ActorCritic(eqx.Module):
             ]
         )
 
-        self.critic_cnn = nn.Sequential(
-            [
-                nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=key_array[7]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=key_array[8]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=key_array[9]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=key_array[10]),
-                nn.Lambda(jax.nn.leaky_relu),
-            ]
-        )
+        self.critic_cnn = None if shared_encoder else make_encoder(encoder, key_array[7], key_array[7:11])
         self.critic_trunk = nn.Sequential(
             [
-                nn.Linear(in_features=512, out_features=256, key=key_array[11]),
+                nn.Linear(in_features=self.actor_cnn.out_features, out_features=256, key=key_array[11]),
                 nn.LayerNorm(shape=256),
                 nn.Lambda(jax.nn.leaky_relu),
                 nn.Linear(in_features=256, out_features=256, key=key_array[12]),
@@ -72,47 +60,57 @@ class ActorCritic(eqx.Module):
         )
 
     def __call__(self, x: Array) -> Tuple:
-        x = x.transpose((0, 3, 1, 2))
-        actor_embedding = eqx.filter_vmap(self.actor_cnn)(x)
-        critic_embedding = eqx.filter_vmap(self.critic_cnn)(x)
-
+        dtype = self.compute_dtype
+        x = x.transpose((0, 3, 1, 2)).astype(dtype)
+        actor_embedding = eqx.filter_vmap(cast(self.actor_cnn, dtype))(x)
         actor_embedding = actor_embedding.reshape(actor_embedding.shape[0], -1)
-        critic_embedding = critic_embedding.reshape(critic_embedding.shape[0], -1)
+        if self.shared_encoder:
+            critic_embedding = actor_embedding
+        else:
+            critic_embedding = eqx.filter_vmap(cast(self.critic_cnn, dtype))(x)
+            critic_embedding = critic_embedding.reshape(critic_embedding.shape[0], -1)
 
-        actor_mean = eqx.filter_vmap(self.actor_trunk)(actor_embedding)
-        critic = eqx.filter_vmap(self.critic_trunk)(critic_embedding)
-        pi = distributions.Categorical(logits=actor_mean)
-        return pi, jnp.squeeze(critic, axis=-1)
+        actor_mean = eqx.filter_vmap(cast(self.actor_trunk, dtype))(actor_embedding)
+        critic = eqx.filter_vmap(cast(self.critic_trunk, dtype))(critic_embedding)
+        # The losses are computed in float32
+        pi = distributions.Categorical(logits=actor_mean.astype(jnp.float32))
+        return pi, jnp.squeeze(critic, axis=-1).astype(jnp.float32)
 
 
 class ActorCriticRNN(eqx.Module):
+    """
+    CNN + memory + MLP actor and critic.
+
+    With `shared_encoder`, the actor and critic read the embedding of a single
+    CNN and keep separate memory models and trunks. Otherwise `critic_cnn` is
+    a separate CNN. `encoder` names the CNN in `encoders.ENCODERS`. `precision`
+    names the compute dtype in `precision.PRECISIONS`, see `precision.cast_memory`
+    for which memory models run in it.
+    """
     action_dim: int = 5
-    actor_cnn: nn.Sequential
+    actor_cnn: Encoder
     actor_rnn: eqx.Module
     actor_trunk: nn.Sequential
-    critic_cnn: nn.Sequential
+    critic_cnn: Optional[Encoder]
     critic_rnn: eqx.Module
     critic_trunk: nn.Sequential
+    shared_encoder: bool = eqx.field(static=True)
+    compute_dtype: Any = eqx.field(static=True)
 
-    def __init__(self, key: PRNGKeyArray, rnn_type: str = "lru"):
+    def __init__(
+            self,
+            key: PRNGKeyArray,
+            rnn_type: str = "lru",
+            shared_encoder: bool = False,
+            encoder: str = "default",
+            precision: str = "fp32",
+    ):
+        self.shared_encoder = shared_encoder
+        self.compute_dtype = PRECISIONS[precision]
         key_array = jax.random.split(key, 14)
-        self.actor_cnn = nn.Sequential(
-            [
-                nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=key_array[0]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=key_array[1]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=key_array[2]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=key_array[3]),
-                nn.Lambda(jax.nn.leaky_relu),
-            ]
-        )
+        self.actor_cnn = make_encoder(encoder, key_array[0], key_array[0:4])
         self.actor_rnn = get_residual_memory_model(
-            input=512,
+            input=self.actor_cnn.out_features,
             hidden=512,
             output=256,
             num_layers=1,
@@ -127,23 +125,9 @@ class ActorCriticRNN(eqx.Module):
                 nn.Linear(in_features=256, out_features=self.action_dim, key=key_array[12]),
             ]
         )
-        self.critic_cnn = nn.Sequential(
-            [
-                nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=key_array[6]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=key_array[7]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=key_array[8]),
-                nn.Lambda(jax.nn.leaky_relu),
-                nn.MaxPool2d(kernel_size=2, stride=2),
-                nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=key_array[9]),
-                nn.Lambda(jax.nn.leaky_relu),
-            ]
-        )
+        self.critic_cnn = None if shared_encoder else make_encoder(encoder, key_array[6], key_array[6:10])
         self.critic_rnn = get_residual_memory_model(
-            input=512,
+            input=self.actor_cnn.out_features,
             hidden=512,
             output=256,
             num_layers=1,
@@ -161,25 +145,31 @@ class ActorCriticRNN(eqx.Module):
 
     def __call__(self, actor_state, critic_state, x):
         inputs, dones = x
-        inputs = inputs.transpose((0, 1, 4, 2, 3))
-        actor_embedding = eqx.filter_vmap(eqx.filter_vmap(self.actor_cnn))(inputs)
-        critic_embedding = eqx.filter_vmap(eqx.filter_vmap(self.critic_cnn))(inputs)
-
+        dtype = self.compute_dtype
+        inputs = inputs.transpose((0, 1, 4, 2, 3)).astype(dtype)
+        actor_embedding = eqx.filter_vmap(eqx.filter_vmap(cast(self.actor_cnn, dtype)))(inputs)
         actor_embedding = actor_embedding.reshape((actor_embedding.shape[0], actor_embedding.shape[1], -1))
-        critic_embedding = critic_embedding.reshape((critic_embedding.shape[0], critic_embedding.shape[1], -1))
+        if self.shared_encoder:
+            critic_embedding = actor_embedding
+        else:
+            critic_embedding = eqx.filter_vmap(eqx.filter_vmap(cast(self.critic_cnn, dtype)))(inputs)
+            critic_embedding = critic_embedding.reshape((critic_embedding.shape[0], critic_embedding.shape[1], -1))
         actor_rnn_in = (actor_embedding, dones)
         critic_rnn_in = (critic_embedding, dones)
-        actor_state, actor_embedding = eqx.filter_vmap(self.actor_rnn, in_axes=(0, 1), out_axes=(0, 1))(actor_state,
-                                                                                                        actor_rnn_in)
+        actor_rnn = cast_memory(self.actor_rnn, dtype)
+        critic_rnn = cast_memory(self.critic_rnn, dtype)
+        actor_state, actor_embedding = eqx.filter_vmap(actor_rnn, in_axes=(0, 1), out_axes=(0, 1))(actor_state,
+                                                                                                   actor_rnn_in)
         actor_state = eqx.filter_vmap(self.actor_rnn.latest_recurrent_state, in_axes=0)(actor_state)
-        critic_state, critic_embedding = eqx.filter_vmap(self.critic_rnn, in_axes=(0, 1), out_axes=(0, 1))(critic_state,
-                                                                                                           critic_rnn_in)
+        critic_state, critic_embedding = eqx.filter_vmap(critic_rnn, in_axes=(0, 1), out_axes=(0, 1))(critic_state,
+                                                                                                      critic_rnn_in)
         critic_state = eqx.filter_vmap(self.critic_rnn.latest_recurrent_state, in_axes=0)(critic_state)
-        actor_mean = eqx.filter_vmap(eqx.filter_vmap(self.actor_trunk))(actor_embedding)
-        pi = distributions.Categorical(logits=actor_mean)
+        actor_mean = eqx.filter_vmap(eqx.filter_vmap(cast(self.actor_trunk, dtype)))(actor_embedding)
+        # The losses are computed in float32
+        pi = distributions.Categorical(logits=actor_mean.astype(jnp.float32))
         # pi = distrax.Categorical(logits=actor_mean)
-        critic = eqx.filter_vmap(eqx.filter_vmap(self.critic_trunk))(critic_embedding)
-        return actor_state, critic_state, pi, jnp.squeeze(critic, axis=-1)
+        critic = eqx.filter_vmap(eqx.filter_vmap(cast(self.critic_trunk, dtype)))(critic_embedding)
+        return actor_state, critic_state, pi, jnp.squeeze(critic, axis=-1).astype(jnp.float32)
 
     def initialize_carry(self, key: PRNGKeyArray):
         key_init = jax.random.split(key, 2)
@@ -191,27 +181,17 @@ class ActorCriticRNN(eqx.Module):
 class QNetwork(eqx.Module):
     """CNN + MLP"""
     action_dim: int
-    cnn: nn.Sequential
+    cnn: Encoder
     trunk: nn.Sequential
+    compute_dtype: Any = eqx.field(static=True)
 
-    def __init__(self, action_dim: int, key: PRNGKeyArray):
+    def __init__(self, action_dim: int, key: PRNGKeyArray, encoder: str = "default", precision: str = "fp32"):
         self.action_dim = action_dim
+        self.compute_dtype = PRECISIONS[precision]
         keys = jax.random.split(key, 7)
-        self.cnn = nn.Sequential([
-            nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=keys[0]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=keys[1]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=keys[2]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=keys[3]),
-            nn.Lambda(jax.nn.leaky_relu),
-        ])
+        self.cnn = make_encoder(encoder, keys[0], keys[0:4])
         self.trunk = nn.Sequential([
-            nn.Linear(in_features=512, out_features=256, key=keys[4]),
+            nn.Linear(in_features=self.cnn.out_features, out_features=256, key=keys[4]),
             nn.LayerNorm(shape=256),
             nn.Lambda(jax.nn.leaky_relu),
             nn.Linear(in_features=256, out_features=256, key=keys[5]),
@@ -221,38 +201,36 @@ class QNetwork(eqx.Module):
         ])
 
     def __call__(self, x: jax.Array):
-        x = x.transpose((0, 3, 1, 2))
-        x = eqx.filter_vmap(self.cnn)(x)
+        dtype = self.compute_dtype
+        x = x.transpose((0, 3, 1, 2)).astype(dtype)
+        x = eqx.filter_vmap(cast(self.cnn, dtype))(x)
         x = x.reshape(x.shape[0], -1)
-        x = eqx.filter_vmap(self.trunk)(x)
-        return x
+        x = eqx.filter_vmap(cast(self.trunk, dtype))(x)
+        return x.astype(jnp.float32)
 
 
 class QNetworkRNN(eqx.Module):
     """CNN + MLP"""
     action_dim: int
-    cnn: nn.Sequential
+    cnn: Encoder
     rnn: eqx.Module
     trunk: nn.Sequential
+    compute_dtype: Any = eqx.field(static=True)
 
-    def __init__(self, action_dim: int, key: PRNGKeyArray, rnn_type: str = "lru"):
+    def __init__(
+            self,
+            action_dim: int,
+            key: PRNGKeyArray,
+            rnn_type: str = "lru",
+            encoder: str = "default",
+            precision: str = "fp32",
+    ):
         self.action_dim = action_dim
+        self.compute_dtype = PRECISIONS[precision]
         keys = jax.random.split(key, 8)
-        self.cnn = nn.Sequential([
-            nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=keys[0]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=keys[1]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=keys[2]),
-            nn.Lambda(jax.nn.leaky_relu),
-            nn.MaxPool2d(kernel_size=2, stride=2),
-            nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=keys[3]),
-            nn.Lambda(jax.nn.leaky_relu),
-        ])
+        self.cnn = make_encoder(encoder, keys[0], keys[0:4])
         self.rnn = get_residual_memory_model(
-            input=517,
+            input=self.cnn.out_features + action_dim,
             hidden=512,
             output=256,
             num_layers=1,
@@ -270,22 +248,24 @@ class QNetworkRNN(eqx.Module):
         ])
 
     def __call__(self, hidden_state, x, done, last_action):
-        x = x.transpose((0, 1, 4, 2, 3))
+        dtype = self.compute_dtype
+        x = x.transpose((0, 1, 4, 2, 3)).astype(dtype)
         # x = eqx.filter_vmap(eqx.filter_vmap(nn.LayerNorm(shape=(3, 256, 256))))(x)
-        x = eqx.filter_vmap(eqx.filter_vmap(self.cnn))(x)
+        x = eqx.filter_vmap(eqx.filter_vmap(cast(self.cnn, dtype)))(x)
 
         x = x.reshape((x.shape[0], x.shape[1], -1))
 
-        last_action = jax.nn.one_hot(last_action, self.action_dim)
+        last_action = jax.nn.one_hot(last_action, self.action_dim, dtype=dtype)
         x = jnp.concatenate([x, last_action], axis=-1)
         rnn_in = (x, done)
 
-        hidden_state, x = eqx.filter_vmap(self.rnn, in_axes=(0, 1), out_axes=(0, 1))(hidden_state, rnn_in)
+        rnn = cast_memory(self.rnn, dtype)
+        hidden_state, x = eqx.filter_vmap(rnn, in_axes=(0, 1), out_axes=(0, 1))(hidden_state, rnn_in)
         hidden_state = eqx.filter_vmap(self.rnn.latest_recurrent_state, in_axes=0)(hidden_state)
 
-        q_vals = eqx.filter_vmap(eqx.filter_vmap(self.trunk))(x)
+        q_vals = eqx.filter_vmap(eqx.filter_vmap(cast(self.trunk, dtype)))(x)
 
-        return hidden_state, q_vals
+        return hidden_state, q_vals.astype(jnp.float32)
 
     def initialize_carry(self, key: PRNGKeyArray):
         key_init = jax.random.split(key, 1)
@@ -0,0 +1,176 @@
+"""
+Registry of the CNN encoders the baseline models embed observations with.
+
+Every encoder maps a single (3, 256, 256) observation to a flat embedding of
+`out_features` and is selected by name with `make_encoder`:
+
+- `default`: 7x7 stride-2 stem followed by 3x3 stride-2 convs and max pools up to 512 channels.
+- `nature`: the Nature-DQN CNN on observations resized to 84x84.
+- `impala`: the IMPALA ResNet on observations resized to 64x64.
+- `space_to_depth`: 4x4 space-to-depth followed by 3x3 stride-2 convs and global average pooling.
+"""
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import equinox as eqx
+import equinox.nn as nn
+import jax
+import jax.numpy as jnp
+from jaxtyping import Array, PRNGKeyArray
+
+OBS_SHAPE = (3, 256, 256)
+
+
+class Encoder(eqx.Module):
+    """Applies `layers` to a (C, H, W) observation and flattens the result."""
+    layers: nn.Sequential
+    out_features: int = eqx.field(static=True)
+
+    def __call__(self, x: Array) -> Array:
+        return self.layers(x).reshape(-1)
+
+
+class ResidualBlock(eqx.Module):
+    conv0: nn.Conv2d
+    conv1: nn.Conv2d
+
+    def __init__(self, channels: int, key: PRNGKeyArray):
+        keys = jax.random.split(key, 2)
+        self.conv0 = nn.Conv2d(channels, channels, kernel_size=3, padding=1, key=keys[0])
+        self.conv1 = nn.Conv2d(channels, channels, kernel_size=3, padding=1, key=keys[1])
+
+    def __call__(self, x: Array, *, key=None) -> Array:
+        return x + self.conv1(jax.nn.relu(self.conv0(jax.nn.relu(x))))
+
+
+def resize(size: int) -> nn.Lambda:
+    return nn.Lambda(lambda x: jax.image.resize(x, (x.shape[0], size, size), method="bilinear"))
+
+
+def space_to_depth(block: int) -> nn.Lambda:
+    def fn(x):
+        c, h, w = x.shape
+        x = x.reshape(c, h // block, block, w // block, block)
+        return x.transpose(0, 2, 4, 1, 3).reshape(c * block * block, h // block, w // block)
+
+    return nn.Lambda(fn)
+
+
+def default_encoder(key: PRNGKeyArray, layer_keys: Optional[PRNGKeyArray] = None) -> Encoder:
+    keys = jax.random.split(key, 4) if layer_keys is None else layer_keys
+    layers = nn.Sequential([
+        nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=keys[0]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.MaxPool2d(kernel_size=2, stride=2),
+        nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, key=keys[1]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.MaxPool2d(kernel_size=2, stride=2),
+        nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, key=keys[2]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.MaxPool2d(kernel_size=2, stride=2),
+        nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, key=keys[3]),
+        nn.Lambda(jax.nn.leaky_relu),
+    ])
+    return Encoder(layers, 512)
+
+
+def nature_encoder(key: PRNGKeyArray) -> Encoder:
+    keys = jax.random.split(key, 4)
+    layers = nn.Sequential([
+        resize(84),
+        nn.Conv2d(in_channels=3, out_channels=32, kernel_size=8, stride=4, key=keys[0]),
+        nn.Lambda(jax.nn.relu),
+        nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, stride=2, key=keys[1]),
+        nn.Lambda(jax.nn.relu),
+        nn.Conv2d(in_channels=64, out_channels=64, kernel_size=3, stride=1, key=keys[2]),
+        nn.Lambda(jax.nn.relu),
+        nn.Lambda(lambda x: x.reshape(-1)),
+        nn.Linear(in_features=64 * 7 * 7, out_features=512, key=keys[3]),
+        nn.Lambda(jax.nn.relu),
+    ])
+    return Encoder(layers, 512)
+
+
+def impala_encoder(key: PRNGKeyArray, channels: Sequence[int] = (16, 32, 32)) -> Encoder:
+    keys = jax.random.split(key, 3 * len(channels) + 1)
+    layers = [resize(64)]
+    in_channels, size = 3, 64
+    for i, out_channels in enumerate(channels):
+        layers += [
+            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1, key=keys[3 * i]),
+            nn.MaxPool2d(kernel_size=3, stride=2, padding=1),
+            ResidualBlock(out_channels, keys[3 * i + 1]),
+            ResidualBlock(out_channels, keys[3 * i + 2]),
+        ]
+        in_channels, size = out_channels, size // 2
+    layers += [
+        nn.Lambda(jax.nn.relu),
+        nn.Lambda(lambda x: x.reshape(-1)),
+        nn.Linear(in_features=in_channels * size * size, out_features=256, key=keys[-1]),
+        nn.Lambda(jax.nn.relu),
+    ]
+    return Encoder(nn.Sequential(layers), 256)
+
+
+def space_to_depth_encoder(key: PRNGKeyArray) -> Encoder:
+    keys = jax.random.split(key, 4)
+    layers = nn.Sequential([
+        space_to_depth(4),
+        nn.Conv2d(in_channels=48, out_channels=64, kernel_size=3, stride=2, padding=1, key=keys[0]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.Conv2d(in_channels=64, out_channels=128, kernel_size=3, stride=2, padding=1, key=keys[1]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.Conv2d(in_channels=128, out_channels=256, kernel_size=3, stride=2, padding=1, key=keys[2]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.Conv2d(in_channels=256, out_channels=512, kernel_size=3, stride=2, padding=1, key=keys[3]),
+        nn.Lambda(jax.nn.leaky_relu),
+        nn.Lambda(lambda x: x.mean(axis=(1, 2))),
+    ])
+    return Encoder(layers, 512)
+
+
+ENCODERS: Dict[str, Callable[[PRNGKeyArray], Encoder]] = {
+    "default": default_encoder,
+    "nature": nature_encoder,
+    "impala": impala_encoder,
+    "space_to_depth": space_to_depth_encoder,
+}
+
+
+def make_encoder(name: str, key: PRNGKeyArray, layer_keys: Optional[PRNGKeyArray] = None) -> Encoder:
+    """
+    Build the encoder `name` from `key`.
+
+    `layer_keys` are the keys of the four conv layers of the default encoder,
+    which the baseline models pass so that it keeps their original initialization.
+    The other encoders ignore them.
+    """
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder {name}, expected one of {list(ENCODERS)}")
+    if name == "default":
+        return default_encoder(key, layer_keys)
+    return ENCODERS[name](key)
+
+
+def encoder_cost(name: str) -> Dict[str, Any]:
+    """
+    Parameter count and FLOPs per observation of an encoder.
+
+    FLOPs come from the XLA cost model of the compiled encoder and are `None`
+    where the backend does not report them.
+    """
+    encoder = make_encoder(name, jax.random.PRNGKey(0))
+    dynamic, static = eqx.partition(encoder, eqx.is_array)
+    params = sum(x.size for x in jax.tree.leaves(dynamic))
+    obs = jax.ShapeDtypeStruct(OBS_SHAPE, jnp.float32)
+    apply = jax.jit(lambda dynamic, x: eqx.combine(dynamic, static)(x))
+    analysis = apply.lower(dynamic, obs).compile().cost_analysis()
+    # Older jax versions return one dict per device
+    if isinstance(analysis, (list, tuple)):
+        analysis = analysis[0] if analysis else {}
+    return {"params": params, "flops": (analysis or {}).get("flops"), "out_features": encoder.out_features}
+
+
+def format_encoder_cost(name: str) -> str:
+    cost = encoder_cost(name)
+    flops = "n/a" if cost["flops"] is None else f"{cost['flops'] / 1e9:.3f} GFLOPs"
+    return f"Encoder {name}: {cost['params'] / 1e6:.2f}M params, {flops} per observation, {cost['out_features']} features"
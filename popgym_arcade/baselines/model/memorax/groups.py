@@ -125,6 +125,8 @@ class Resettable(BinaryAlgebra):
             initial_state: RecurrentState,
         ):
             assert initial_state.ndim == current_state.ndim
+            # Keep the dtype of the state, e.g. bfloat16, instead of promoting it to the initial state
+            initial_state = initial_state.astype(current_state.dtype)
             out = current_state * jnp.logical_not(start) + initial_state * start
             return out
 
@@ -0,0 +1,89 @@
+"""
+Mixed precision for the baseline models.
+
+Parameters and optimizer state always stay in float32. For the forward pass,
+a model casts a copy of its layers to the compute dtype, e.g. bfloat16, so
+convolutions and matmuls run in low precision while gradients flow back into
+the float32 parameters through the casts. LayerNorm, the numerically sensitive
+recurrent cells of the memory models (e.g. the complex LRU recurrence) and the
+outputs fed into the losses stay in float32. The gated and MLP cells in
+`COMPUTE_DTYPE_CELLS` run in the compute dtype.
+"""
+from typing import Any
+
+import equinox as eqx
+import equinox.nn as nn
+import jax
+import jax.numpy as jnp
+from jaxtyping import Array
+
+from popgym_arcade.baselines.model.memorax.magmas import Elman, GRU, LSTM, MGU
+from popgym_arcade.baselines.model.memorax.semigroups import MLP
+
+PRECISIONS = {"fp32": jnp.float32, "bf16": jnp.bfloat16}
+# Recurrent cells that are stable in low precision, every other cell runs in float32
+COMPUTE_DTYPE_CELLS = (Elman, GRU, LSTM, MGU, MLP)
+
+
+class Float32(eqx.Module):
+    """Runs `layer` in float32 and casts its output back to the dtype of the input."""
+    layer: eqx.Module
+
+    def __call__(self, x: Array, *, key=None) -> Array:
+        return self.layer(x.astype(jnp.float32)).astype(x.dtype)
+
+
+class Float32Memory(eqx.Module):
+    """Runs a recurrent cell on a float32 copy of its input, so its state stays float32."""
+    layer: eqx.Module
+
+    def __call__(self, h, x):
+        emb, start = x
+        h, out = self.layer(h, (emb.astype(jnp.float32), start))
+        return h, out.astype(emb.dtype)
+
+
+class Float32State(eqx.Module):
+    """Runs a recurrent cell in the dtype of its input and returns its states in float32."""
+    layer: eqx.Module
+
+    def __call__(self, h, x):
+        emb, start = x
+        h = jax.tree.map(lambda s: _cast_array(s, emb.dtype), h)
+        h, out = self.layer(h, x)
+        return jax.tree.map(lambda s: _cast_array(s, jnp.float32), h), out
+
+
+def _cast_array(x: Any, dtype) -> Any:
+    if eqx.is_inexact_array(x) and not jnp.iscomplexobj(x):
+        return x.astype(dtype)
+    return x
+
+
+def cast(module: eqx.Module, dtype) -> eqx.Module:
+    """Copy of `module` computing in `dtype`, its LayerNorms run in float32."""
+    if dtype == jnp.float32:
+        return module
+    is_norm = lambda m: isinstance(m, nn.LayerNorm)
+    module = jax.tree.map(lambda m: Float32(m) if is_norm(m) else m, module, is_leaf=is_norm)
+    is_float32 = lambda m: isinstance(m, Float32)
+    return jax.tree.map(lambda m: m if is_float32(m) else _cast_array(m, dtype), module, is_leaf=is_float32)
+
+
+def cast_memory(model: eqx.Module, dtype) -> eqx.Module:
+    """
+    Copy of a `ResidualModel` computing its projections and feed-forward blocks in `dtype`.
+
+    Cells in `COMPUTE_DTYPE_CELLS` also run in `dtype`, their recurrent states
+    are kept in float32 between calls. Every other cell keeps its float32
+    parameters and runs on float32 inputs. Use the copy for `__call__` only,
+    the carry helpers belong to the original model.
+    """
+    if dtype == jnp.float32:
+        return model
+    cast_model = cast(model, dtype)
+    layers = [
+        Float32State(cast_layer) if isinstance(layer, COMPUTE_DTYPE_CELLS) else Float32Memory(layer)
+        for layer, cast_layer in zip(model.layers, cast_model.layers)
+    ]
+    return eqx.tree_at(lambda m: m.layers, cast_model, layers)
@@ -11,6 +11,7 @@ import popgym_arcade
 from popgym_arcade.wrappers import LogWrapper
 from popgym_arcade.baselines.model import add_batch_dim
 from popgym_arcade.baselines.model import ActorCriticRNN
+from popgym_arcade.baselines.driver import run_segments
 from popgym_arcade.baselines.utils import filter_scan
 
 
@@ -24,9 +25,13 @@ class Transition(NamedTuple):
     info: jnp.ndarray
 
 
-def make_train(config):
+def make_train_segments(config):
+    """
+    Build the training loop as `init(rng) -> runner_state`, `train_segment(runner_state, num_updates)`
+    and `test`, which is `None` for PPO, see `popgym_arcade.baselines.driver.run_segments`.
+    """
     config["NUM_UPDATES"] = (
-        config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"]
+        int(config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"])
     )
     config["MINIBATCH_SIZE"] = (
         config["NUM_ENVS"] * config["NUM_STEPS"] // config["NUM_MINIBATCHES"]
@@ -50,10 +55,16 @@ def make_train(config):
                          * config["UPDATE_EPOCHS"],
     )
 
-    def train(rng):
+    def init(rng):
         # INIT NETWORK
         rng, _rng, rng_init = jax.random.split(rng, 3)
-        network = ActorCriticRNN(key=_rng, rnn_type=config["MEMORY_TYPE"])
+        network = ActorCriticRNN(
+            key=_rng,
+            rnn_type=config["MEMORY_TYPE"],
+            shared_encoder=config.get("SHARED_ENCODER", False),
+            encoder=config.get("ENCODER", "default"),
+            precision=config.get("PRECISION", "fp32"),
+        )
         actor_init_hstate, critic_init_hstate = network.initialize_carry(key=rng_init)
         actor_init_hstate = add_batch_dim(actor_init_hstate, config["NUM_ENVS"])
         critic_init_hstate = add_batch_dim(critic_init_hstate, config["NUM_ENVS"])
@@ -73,171 +84,158 @@ def make_train(config):
         reset_rng = jax.random.split(_rng, config["NUM_ENVS"])
         obsv, env_state = jax.vmap(env.reset, in_axes=(0, None))(reset_rng, env_params)
 
-        # TRAIN LOOP
-        def _update_step(runner_state, unused):
-            # COLLECT TRAJECTORIES
-            def _env_step(runner_state, unused):
-                network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng = runner_state
+        rng, _rng = jax.random.split(rng)
+        return (
+            network,
+            opt_state,
+            tx,
+            env_state,
+            obsv,
+            jnp.zeros((config["NUM_ENVS"]), dtype=bool),
+            actor_init_hstate,
+            critic_init_hstate,
+            _rng,
+        )
 
-                rng, _rng = jax.random.split(rng)
+    # TRAIN LOOP
+    def _update_step(runner_state, unused):
+        # COLLECT TRAJECTORIES
+        def _env_step(runner_state, unused):
+            network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng = runner_state
 
-                # SELECT ACTION
-                ac_in = (last_obs[np.newaxis, :], last_done[np.newaxis, :])
-                actor_hstate, critic_hstate, pi, value = network(actor_hstate, critic_hstate, ac_in)
-                action = pi.sample(key=_rng)
-                log_prob = pi.log_prob(action)
+            rng, _rng = jax.random.split(rng)
 
-                value, action, log_prob = (
-                    value.squeeze(0),
-                    action.squeeze(0),
-                    log_prob.squeeze(0),
-                )
-                # STEP ENV
-                rng, _rng = jax.random.split(rng)
-                rng_step = jax.random.split(_rng, config["NUM_ENVS"])
-                obsv, env_state, reward, done, info = jax.vmap(
-                    env.step, in_axes=(0, 0, 0, None)
-                )(rng_step, env_state, action, env_params)
-                transition = Transition(
-                    last_done, action, value, reward, log_prob, last_obs, info
+            # SELECT ACTION
+            ac_in = (last_obs[np.newaxis, :], last_done[np.newaxis, :])
+            actor_hstate, critic_hstate, pi, value = network(actor_hstate, critic_hstate, ac_in)
+            action = pi.sample(key=_rng)
+            log_prob = pi.log_prob(action)
+
+            value, action, log_prob = (
+                value.squeeze(0),
+                action.squeeze(0),
+                log_prob.squeeze(0),
+            )
+            # STEP ENV
+            rng, _rng = jax.random.split(rng)
+            rng_step = jax.random.split(_rng, config["NUM_ENVS"])
+            obsv, env_state, reward, done, info = jax.vmap(
+                env.step, in_axes=(0, 0, 0, None)
+            )(rng_step, env_state, action, env_params)
+            transition = Transition(
+                last_done, action, value, reward, log_prob, last_obs, info
+            )
+            runner_state = (network, opt_state, tx, env_state, obsv, done, actor_hstate, critic_hstate, rng)
+            return runner_state, transition
+
+        actor_initial_hstate = runner_state[-3]
+        critic_initial_hstate = runner_state[-2]
+        runner_state, traj_batch = filter_scan(
+            _env_step, runner_state, None, config["NUM_STEPS"]
+        )
+
+        # CALCULATE ADVANTAGE
+        network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng = runner_state
+        ac_in = (last_obs[np.newaxis, :], last_done[np.newaxis, :])
+        _, _, _, last_val = network(actor_hstate, critic_hstate, ac_in)
+        last_val = last_val.squeeze(0)
+        def _calculate_gae(traj_batch, last_val, last_done):
+            def _get_advantages(carry, transition):
+                gae, next_value, next_done = carry
+                done, value, reward = transition.done, transition.value, transition.reward
+                delta = reward + config["GAMMA"] * next_value * (1 - next_done) - value
+                gae = delta + config["GAMMA"] * config["GAE_LAMBDA"] * (1 - next_done) * gae
+                return (gae, value, done), gae
+            _, advantages = jax.lax.scan(_get_advantages, (jnp.zeros_like(last_val), last_val, last_done), traj_batch, reverse=True, unroll=16)
+            return advantages, advantages + traj_batch.value
+        advantages, targets = _calculate_gae(traj_batch, last_val, last_done)
+
+        # UPDATE NETWORK
+        def _update_epoch(update_state, unused):
+            def _update_minbatch(carry, minibatch_idx):
+                train_state, batch = carry
+                # Gather the minibatch envs from the unshuffled batch
+                actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets = jax.tree_util.tree_map(
+                    lambda x: jnp.take(x, minibatch_idx, axis=1), batch
                 )
-                runner_state = (network, opt_state, tx, env_state, obsv, done, actor_hstate, critic_hstate, rng)
-                return runner_state, transition
+                network, opt_state, tx = train_state
+                def _loss_fn(network, actor_init_hstate, critic_init_hstate, traj_batch, gae, targets):
+                    # RERUN NETWORK
 
-            actor_initial_hstate = runner_state[-3]
-            critic_initial_hstate = runner_state[-2]
-            runner_state, traj_batch = filter_scan(
-                _env_step, runner_state, None, config["NUM_STEPS"]
-            )
+                    actor_hstate_med = jax.tree.map(lambda s: s[0], actor_init_hstate)
+                    critic_hstate_med = jax.tree.map(lambda s: s[0], critic_init_hstate)
 
-            # CALCULATE ADVANTAGE
-            network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng = runner_state
-            ac_in = (last_obs[np.newaxis, :], last_done[np.newaxis, :])
-            _, _, _, last_val = network(actor_hstate, critic_hstate, ac_in)
-            last_val = last_val.squeeze(0)
-            def _calculate_gae(traj_batch, last_val, last_done):
-                def _get_advantages(carry, transition):
-                    gae, next_value, next_done = carry
-                    done, value, reward = transition.done, transition.value, transition.reward
-                    delta = reward + config["GAMMA"] * next_value * (1 - next_done) - value
-                    gae = delta + config["GAMMA"] * config["GAE_LAMBDA"] * (1 - next_done) * gae
-                    return (gae, value, done), gae
-                _, advantages = jax.lax.scan(_get_advantages, (jnp.zeros_like(last_val), last_val, last_done), traj_batch, reverse=True, unroll=16)
-                return advantages, advantages + traj_batch.value
-            advantages, targets = _calculate_gae(traj_batch, last_val, last_done)
-
-            # UPDATE NETWORK
-            def _update_epoch(update_state, unused):
-                def _update_minbatch(train_state, batch_info):
-                    actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets = batch_info
-                    network, opt_state, tx = train_state
-                    def _loss_fn(network, actor_init_hstate, critic_init_hstate, traj_batch, gae, targets):
-                        # RERUN NETWORK
-
-                        actor_hstate_med = jax.tree.map(lambda s: s[0], actor_init_hstate)
-                        critic_hstate_med = jax.tree.map(lambda s: s[0], critic_init_hstate)
-
-                        _, _, pi, value = network(
-                            actor_hstate_med, critic_hstate_med, (traj_batch.obs, traj_batch.done)
-                        )
-                        log_prob = pi.log_prob(traj_batch.action)
-
-                        # CALCULATE VALUE LOSS
-                        value_pred_clipped = traj_batch.value + (
-                            value - traj_batch.value
-                        ).clip(-config["CLIP_EPS"], config["CLIP_EPS"])
-                        value_losses = jnp.square(value - targets)
-                        value_losses_clipped = jnp.square(value_pred_clipped - targets)
-                        value_loss = (
-                            0.5 * jnp.maximum(value_losses, value_losses_clipped).mean()
-                        )
+                    _, _, pi, value = network(
+                        actor_hstate_med, critic_hstate_med, (traj_batch.obs, traj_batch.done)
+                    )
+                    log_prob = pi.log_prob(traj_batch.action)
+
+                    # CALCULATE VALUE LOSS
+                    value_pred_clipped = traj_batch.value + (
+                        value - traj_batch.value
+                    ).clip(-config["CLIP_EPS"], config["CLIP_EPS"])
+                    value_losses = jnp.square(value - targets)
+                    value_losses_clipped = jnp.square(value_pred_clipped - targets)
+                    value_loss = (
+                        0.5 * jnp.maximum(value_losses, value_losses_clipped).mean()
+                    )
 
-                        # CALCULATE ACTOR LOSS
-                        ratio = jnp.exp(log_prob - traj_batch.log_prob)
-                        gae = (gae - gae.mean()) / (gae.std() + 1e-8)
-                        loss_actor1 = ratio * gae
-                        loss_actor2 = (
-                            jnp.clip(
-                                ratio,
-                                1.0 - config["CLIP_EPS"],
-                                1.0 + config["CLIP_EPS"],
-                            )
-                            * gae
+                    # CALCULATE ACTOR LOSS
+                    ratio = jnp.exp(log_prob - traj_batch.log_prob)
+                    gae = (gae - gae.mean()) / (gae.std() + 1e-8)
+                    loss_actor1 = ratio * gae
+                    loss_actor2 = (
+                        jnp.clip(
+                            ratio,
+                            1.0 - config["CLIP_EPS"],
+                            1.0 + config["CLIP_EPS"],
                         )
-                        loss_actor = -jnp.minimum(loss_actor1, loss_actor2)
-                        loss_actor = loss_actor.mean()
-                        entropy = pi.entropy().mean()
-
-                        total_loss = (
-                            loss_actor
-                            + config["VF_COEF"] * value_loss
-                            - config["ENT_COEF"] * entropy
-                        )
-                        return total_loss, (value_loss, loss_actor, entropy)
-
-                    (total_loss, _), grads = eqx.filter_value_and_grad(_loss_fn, has_aux=True)(
-                        network, actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets)
-                    updates, new_opt_state = tx.update(
-                        grads,
-                        opt_state,
-                        eqx.filter(network, eqx.is_array),
+                        * gae
                     )
-                    new_network = eqx.apply_updates(network, updates)
-                    new_train_state = (new_network, new_opt_state, tx)
-                    return new_train_state, total_loss
-                (
-                    network,
-                    opt_state,
-                    tx,
-                    actor_init_hstate,
-                    critic_init_hstate,
-                    traj_batch,
-                    advantages,
-                    targets,
-                    rng,
-                ) = update_state
-
-                rng, _rng = jax.random.split(rng)
-                permutation = jax.random.permutation(_rng, config["NUM_ENVS"])
-                batch = (actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets)
-
-                shuffled_batch = jax.tree_util.tree_map(
-                    lambda x: jnp.take(x, permutation, axis=1), batch
-                )
+                    loss_actor = -jnp.minimum(loss_actor1, loss_actor2)
+                    loss_actor = loss_actor.mean()
+                    entropy = pi.entropy().mean()
+
+                    total_loss = (
+                        loss_actor
+                        + config["VF_COEF"] * value_loss
+                        - config["ENT_COEF"] * entropy
+                    )
+                    return total_loss, (value_loss, loss_actor, entropy)
 
-                minibatches = jax.tree_util.tree_map(
-                    lambda x: jnp.swapaxes(
-                        jnp.reshape(
-                            x,
-                            [x.shape[0], config["NUM_MINIBATCHES"], -1]
-                            + list(x.shape[2:]),
-                        ),
-                        1,
-                        0,
-                    ),
-                    shuffled_batch,
-                )
-                train_state = (network, opt_state, tx)
-                train_state, total_loss = filter_scan(
-                    _update_minbatch, train_state, minibatches
-                )
-                network, opt_state, tx = train_state
-                update_state = (
-                    network,
+                (total_loss, _), grads = eqx.filter_value_and_grad(_loss_fn, has_aux=True)(
+                    network, actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets)
+                updates, new_opt_state = tx.update(
+                    grads,
                     opt_state,
-                    tx,
-                    actor_init_hstate,
-                    critic_init_hstate,
-                    traj_batch,
-                    advantages,
-                    targets,
-                    rng,
+                    eqx.filter(network, eqx.is_array),
                 )
-                return update_state, total_loss
+                new_network = eqx.apply_updates(network, updates)
+                new_train_state = (new_network, new_opt_state, tx)
+                return (new_train_state, batch), total_loss
+            (
+                network,
+                opt_state,
+                tx,
+                actor_init_hstate,
+                critic_init_hstate,
+                traj_batch,
+                advantages,
+                targets,
+                rng,
+            ) = update_state
 
-            actor_init_hstate = jax.tree.map(lambda a: jnp.expand_dims(a, axis=0), actor_initial_hstate)
-            critic_init_hstate = jax.tree.map(lambda a: jnp.expand_dims(a, axis=0), critic_initial_hstate)
-            # init_hstate = initial_hstate[None, :]  # TBH
+            rng, _rng = jax.random.split(rng)
+            # Only the env indices are shuffled, each minibatch is gathered inside the scan
+            permutation = jax.random.permutation(_rng, config["NUM_ENVS"])
+            minibatch_idxs = permutation.reshape(config["NUM_MINIBATCHES"], -1)
+            batch = (actor_init_hstate, critic_init_hstate, traj_batch, advantages, targets)
+
+            train_state = (network, opt_state, tx)
+            (train_state, _), total_loss = filter_scan(
+                _update_minbatch, (train_state, batch), minibatch_idxs
+            )
+            network, opt_state, tx = train_state
             update_state = (
                 network,
                 opt_state,
@@ -249,54 +247,56 @@ def make_train(config):
                 targets,
                 rng,
             )
-            update_state, loss_info = filter_scan(
-                _update_epoch, update_state, None, config["UPDATE_EPOCHS"]
-            )
-            network = update_state[0]
-            opt_state = update_state[1]
-            tx = update_state[2]
-            metric = traj_batch.info
-            rng = update_state[-1]
-            if config.get("DEBUG"):
-
-                def callback(info):
-                    return_values = info["returned_episode_returns"][
-                        info["returned_episode"]
-                    ]
-                    timesteps = (
-                        info["timestep"][info["returned_episode"]] * config["NUM_ENVS"]
-                    )
-                    for t in range(len(timesteps)):
-                        log_dict = {
-                            "global step": timesteps[t],
-                            "episodic return": return_values[t],
-                        }
-                        print(
-                            f"global step={timesteps[t]}, episodic return={return_values[t]}"
-                        )
-                        if timesteps[t] % 100 == 0:
-                            wandb.log(log_dict)
-
-                jax.debug.callback(callback, metric)
+            return update_state, total_loss
 
-            runner_state = (network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng)
-            return runner_state, metric
-
-        rng, _rng = jax.random.split(rng)
-        runner_state = (
+        actor_init_hstate = jax.tree.map(lambda a: jnp.expand_dims(a, axis=0), actor_initial_hstate)
+        critic_init_hstate = jax.tree.map(lambda a: jnp.expand_dims(a, axis=0), critic_initial_hstate)
+        # init_hstate = initial_hstate[None, :]  # TBH
+        update_state = (
             network,
             opt_state,
             tx,
-            env_state,
-            obsv,
-            jnp.zeros((config["NUM_ENVS"]), dtype=bool),
             actor_init_hstate,
             critic_init_hstate,
-            _rng,
+            traj_batch,
+            advantages,
+            targets,
+            rng,
         )
-        runner_state, metric = filter_scan(
-            _update_step, runner_state, None, config["NUM_UPDATES"]
+        update_state, loss_info = filter_scan(
+            _update_epoch, update_state, None, config["UPDATE_EPOCHS"]
         )
+        network = update_state[0]
+        opt_state = update_state[1]
+        tx = update_state[2]
+        # Averages over the episodes that ended during the rollout
+        done = traj_batch.info["returned_episode"]
+        num_episodes = done.sum()
+        metric = {
+            "returned_episode_returns": jnp.where(done, traj_batch.info["returned_episode_returns"], 0).sum()
+                                        / jnp.maximum(num_episodes, 1),
+            "returned_episode_lengths": jnp.where(done, traj_batch.info["returned_episode_lengths"], 0).sum()
+                                        / jnp.maximum(num_episodes, 1),
+            "returned_episodes": num_episodes,
+            "total_loss": loss_info.mean(),
+        }
+        rng = update_state[-1]
+
+        runner_state = (network, opt_state, tx, env_state, last_obs, last_done, actor_hstate, critic_hstate, rng)
+        return runner_state, metric
+
+    def train_segment(runner_state, num_updates):
+        """Run `num_updates` updates, returns the new runner state and the metrics of every update."""
+        return filter_scan(_update_step, runner_state, None, num_updates)
+
+    return init, train_segment, None
+
+
+def make_train(config):
+    init, train_segment, _ = make_train_segments(config)
+
+    def train(rng):
+        runner_state, metric = train_segment(init(rng), config["NUM_UPDATES"])
         return {"runner_state": runner_state, "metric": metric}
 
     return train
@@ -372,8 +372,7 @@ def ppo_rnn_run(config):
     rng = jax.random.PRNGKey(config["SEED"])
     t0 = time.time()
     rng_array = jax.random.split(rng, config["NUM_SEEDS"])
-    train_vjit = eqx.filter_jit(eqx.filter_vmap(make_train(config)))
-    outs = jax.block_until_ready(train_vjit(rng_array))
+    outs = jax.block_until_ready(run_segments(config, *make_train_segments(config), rng_array))
     print(f"Took {time.time() - t0} seconds to complete.")
     runner_state = outs["runner_state"]
     network = runner_state[0]
@@ -385,7 +384,13 @@ def ppo_rnn_run(config):
         '{}_{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["MEMORY_TYPE"], config["ENV_NAME"],
                                                        config["PARTIAL"], config["SEED"]), network_squeezed)
     rng, _rng = jax.random.split(rng)
-    network = ActorCriticRNN(_rng, config["MEMORY_TYPE"])
+    network = ActorCriticRNN(
+        _rng,
+        config["MEMORY_TYPE"],
+        shared_encoder=config.get("SHARED_ENCODER", False),
+        encoder=config.get("ENCODER", "default"),
+        precision=config.get("PRECISION", "fp32"),
+    )
     model = eqx.tree_deserialise_leaves(
         '{}_{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["MEMORY_TYPE"], config["ENV_NAME"],
                                                        config["PARTIAL"], config["SEED"]), network)
@@ -9,6 +9,7 @@ import optax
 import equinox as eqx
 
 import popgym_arcade
+from popgym_arcade.baselines.driver import run_segments
 from popgym_arcade.baselines.model import QNetwork
 from popgym_arcade.wrappers import LogWrapper
 import wandb
@@ -89,13 +90,17 @@ class TrainState(State):
     grad_steps: jnp.ndarray
 
 
-def make_train(config):
+def make_train_segments(config):
+    """
+    Build the training loop as `init(rng) -> runner_state`, `train_segment(runner_state, num_updates)`
+    and `test(train_state, rng)`, see `popgym_arcade.baselines.driver.run_segments`.
+    """
     config["NUM_UPDATES"] = (
-            config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"]
+            int(config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"])
     )
 
     config["NUM_UPDATES_DECAY"] = (
-            config["TOTAL_TIMESTEPS_DECAY"] // config["NUM_STEPS"] // config["NUM_ENVS"]
+            int(config["TOTAL_TIMESTEPS_DECAY"] // config["NUM_STEPS"] // config["NUM_ENVS"])
     )
 
     assert (config["NUM_STEPS"] * config["NUM_ENVS"]) % config[
@@ -104,9 +109,7 @@ def make_train(config):
 
     env, env_params = popgym_arcade.make(config["ENV_NAME"], partial_obs=config["PARTIAL"])
     env = LogWrapper(env)
-    # config["TEST_NUM_STEPS"] = config.get(
-    #     "TEST_NUM_STEPS", env_params.max_steps_in_episode
-    # )
+    config["TEST_NUM_STEPS"] = config.get("TEST_NUM_STEPS", 500)
     vmap_reset = lambda n_envs: lambda rng: jax.vmap(env.reset, in_axes=(0, None))(
         jax.random.split(rng, n_envs), env_params
     )
@@ -130,23 +133,26 @@ def make_train(config):
         )
         return chosed_actions
 
-    def train(rng):
-        original_rng = rng[0]
-        eps_scheduler = optax.linear_schedule(
-            config["EPS_START"],
-            config["EPS_FINISH"],
-            (config["EPS_DECAY"]) * config["NUM_UPDATES_DECAY"] * config["NUM_MINIBATCHES"],
-        )
+    eps_scheduler = optax.linear_schedule(
+        config["EPS_START"],
+        config["EPS_FINISH"],
+        (config["EPS_DECAY"]) * config["NUM_UPDATES_DECAY"] * config["NUM_MINIBATCHES"],
+    )
 
-        lr_scheduler = optax.linear_schedule(
-            init_value=config["LR"],
-            end_value=5e-7,
-            transition_steps=(config["NUM_UPDATES_DECAY"]) * config["NUM_MINIBATCHES"] * config["NUM_EPOCHS"],
-        )
+    lr_scheduler = optax.linear_schedule(
+        init_value=config["LR"],
+        end_value=5e-7,
+        transition_steps=(config["NUM_UPDATES_DECAY"]) * config["NUM_MINIBATCHES"] * config["NUM_EPOCHS"],
+    )
 
-        lr = lr_scheduler if config.get("LR_LINEAR_DECAY", False) else config["LR"]
+    lr = lr_scheduler if config.get("LR_LINEAR_DECAY", False) else config["LR"]
+
+    def init(rng):
+        original_rng = rng[0]
         rng, _rng = jax.random.split(rng)
-        network = QNetwork(5, rng)
+        network = QNetwork(
+            5, rng, encoder=config.get("ENCODER", "default"), precision=config.get("PRECISION", "fp32")
+        )
         opt = optax.chain(
             optax.clip_by_global_norm(config["MAX_GRAD_NORM"]),
             optax.radam(learning_rate=lr),
@@ -163,238 +169,217 @@ def make_train(config):
             grad_steps=jnp.array(0),
         )
 
-        # TRAINING LOOP
-        def _update_step(runner_state, unused):
-
-            train_state, obsv, env_state, test_metrics, rng = runner_state
-
-            # SAMPLE PHASE
-            def _step_env(carry, _):
-                train_state, last_obs, env_state, test_metrics, rng = carry
-                rng, rng_a, rng_s = jax.random.split(rng, 3)
-                q_vals = train_state.model(last_obs)
-
-                # different eps for each env
-                _rngs = jax.random.split(rng_a, config["NUM_ENVS"])
-                eps = jnp.full(config["NUM_ENVS"], eps_scheduler(train_state.n_updates))
-                new_action = jax.vmap(eps_greedy_exploration)(_rngs, q_vals, eps)
-
-                new_obs, new_env_state, reward, new_done, info = vmap_step(
-                    config["NUM_ENVS"]
-                )(rng_s, env_state, new_action)
-
-                transition = Transition(
-                    obs=last_obs,
-                    action=new_action,
-                    reward=config.get("REW_SCALE", 1) * reward,
-                    done=new_done,
-                    next_obs=new_obs,
-                    q_val=q_vals,
-                    infos=info,
-                )
-                carry = (train_state, new_obs, new_env_state, test_metrics, rng)
-                return carry, transition
+        rng, _rng = jax.random.split(rng)
+        obsv, env_state = vmap_reset(config["NUM_ENVS"])(_rng)
 
-            # step the env
-            rng, _rng = jax.random.split(rng)
-            runner_state, transitions = filter_scan(
-                _step_env,
-                runner_state,
-                None,
-                config["NUM_STEPS"],
+        rng, _rng = jax.random.split(rng)
+        return (train_state, obsv, env_state, original_rng, _rng)
+
+    # TRAINING LOOP
+    def _update_step(runner_state, unused):
+
+        train_state, obsv, env_state, original_rng, rng = runner_state
+
+        # SAMPLE PHASE
+        def _step_env(carry, _):
+            train_state, last_obs, env_state, original_rng, rng = carry
+            rng, rng_a, rng_s = jax.random.split(rng, 3)
+            q_vals = train_state.model(last_obs)
+
+            # different eps for each env
+            _rngs = jax.random.split(rng_a, config["NUM_ENVS"])
+            eps = jnp.full(config["NUM_ENVS"], eps_scheduler(train_state.n_updates))
+            new_action = jax.vmap(eps_greedy_exploration)(_rngs, q_vals, eps)
+
+            new_obs, new_env_state, reward, new_done, info = vmap_step(
+                config["NUM_ENVS"]
+            )(rng_s, env_state, new_action)
+
+            transition = Transition(
+                obs=last_obs,
+                action=new_action,
+                reward=config.get("REW_SCALE", 1) * reward,
+                done=new_done,
+                next_obs=new_obs,
+                q_val=q_vals,
+                infos=info,
             )
-            train_state, obsv, env_state, test_metrics, rng = runner_state
-
-            train_state = train_state.replace(
-                timesteps=train_state.timesteps + config["NUM_STEPS"] * config["NUM_ENVS"]
-            )  # update timesteps count
+            carry = (train_state, new_obs, new_env_state, original_rng, rng)
+            return carry, transition
 
-            last_q = train_state.model(transitions.next_obs[-1])
-            last_q = jnp.max(last_q, axis=-1)
+        # step the env
+        rng, _rng = jax.random.split(rng)
+        runner_state, transitions = filter_scan(
+            _step_env,
+            runner_state,
+            None,
+            config["NUM_STEPS"],
+        )
+        train_state, obsv, env_state, original_rng, rng = runner_state
 
-            def _get_target(lambda_returns_and_next_q, transition):
-                lambda_returns, next_q = lambda_returns_and_next_q
-                target_bootstrap = (
-                        transition.reward + config["GAMMA"] * (1 - transition.done) * next_q
-                )
-                delta = lambda_returns - next_q
-                lambda_returns = (
-                        target_bootstrap + config["GAMMA"] * config["LAMBDA"] * delta
-                )
-                lambda_returns = (
-                                         1 - transition.done
-                                 ) * lambda_returns + transition.done * transition.reward
-                next_q = jnp.max(transition.q_val, axis=-1)
-                return (lambda_returns, next_q), lambda_returns
-
-            last_q = last_q * (1 - transitions.done[-1])
-            lambda_returns = transitions.reward[-1] + config["GAMMA"] * last_q
-            _, targets = jax.lax.scan(
-                _get_target,
-                (lambda_returns, last_q),
-                jax.tree.map(lambda x: x[:-1], transitions),
-                reverse=True,
-            )
-            lambda_targets = jnp.concatenate((targets, lambda_returns[np.newaxis]))
-
-            # NETWORKS UPDATE
-            def _learn_epoch(carry, _):
-                update_state, rng = carry
-                train_state, lambda_targets, transitions = update_state
-
-                def _learn_phase(carry, minibatch_and_target):
-                    train_state, rng = carry
-                    minibatch, target = minibatch_and_target
-
-                    def _loss_fn(network):
-                        # (batch_size*2, num_actions)
-                        q_vals = network(minibatch.obs)
-                        chosen_action_qvals = jnp.take_along_axis(
-                            q_vals,
-                            jnp.expand_dims(minibatch.action, axis=-1),
-                            axis=-1,
-                        ).squeeze(axis=-1)
-
-                        loss = 0.5 * jnp.square(chosen_action_qvals - target).mean()
-
-                        return loss, chosen_action_qvals
-
-                    (loss, qvals), grads = eqx.filter_value_and_grad(
-                        _loss_fn, has_aux=True
-                    )(train_state.model)
-                    updates, new_opt_state = train_state.opt.update(
-                        grads,
-                        train_state.opt_state,
-                        eqx.filter(train_state.model, eqx.is_array),  # TODO is_inexact_array
-                    )
-                    new_network = eqx.apply_updates(train_state.model, updates)
-                    new_train_state = train_state.replace(
-                        model=new_network,
-                        opt_state=new_opt_state,
-                        grad_steps=train_state.grad_steps + 1,
-                    )
-                    # update_state = (new_train_state, lambda_targets, transitions)
-                    return (new_train_state, rng), (loss, qvals)
-
-                def preprocess_transition(x, rng):
-                    x = x.reshape(
-                        -1, *x.shape[2:]
-                    )  # num_steps*num_envs (batch_size), ...
-                    x = jax.random.permutation(rng, x)  # shuffle the transitions
-                    x = x.reshape(
-                        config["NUM_MINIBATCHES"], -1, *x.shape[1:]
-                    )  # num_mini_updates, batch_size/num_mini_updates, ...
-                    return x
-
-                rng, _rng = jax.random.split(rng)
-                minibatches = jax.tree_util.tree_map(
-                    lambda x: preprocess_transition(x, _rng), transitions
-                )  # num_actors*num_envs (batch_size), ...
-                targets = jax.tree.map(
-                    lambda x: preprocess_transition(x, _rng), lambda_targets
-                )
+        train_state = train_state.replace(
+            timesteps=train_state.timesteps + config["NUM_STEPS"] * config["NUM_ENVS"]
+        )  # update timesteps count
 
-                rng, _rng = jax.random.split(rng)
-                (train_state, rng), (loss, qvals) = filter_scan(
-                    _learn_phase, (train_state, rng), (minibatches, targets)
-                )
-                update_state = (train_state, lambda_targets, transitions)
-                return (update_state, rng), (loss, qvals)
+        last_q = train_state.model(transitions.next_obs[-1])
+        last_q = jnp.max(last_q, axis=-1)
 
-            rng, _rng = jax.random.split(rng)
-            update_state = (train_state, lambda_targets, transitions)
-            (update_state, rng), (loss, qvals) = filter_scan(
-                _learn_epoch, (update_state, rng), None, config["NUM_EPOCHS"]
+        def _get_target(lambda_returns_and_next_q, transition):
+            lambda_returns, next_q = lambda_returns_and_next_q
+            target_bootstrap = (
+                    transition.reward + config["GAMMA"] * (1 - transition.done) * next_q
             )
-            train_state, lambda_targets, transitions = update_state
-            train_state = train_state.replace(n_updates=train_state.n_updates + 1)
-            metrics = {
-                "env_step": train_state.timesteps,
-                "update_steps": train_state.n_updates,
-                "grad_steps": train_state.grad_steps,
-                "td_loss": loss.mean(),
-                "qvals": qvals.mean(),
-            }
-            metrics.update({k: v.mean() for k, v in transitions.infos.items()})
-
-            if config.get("TEST_DURING_TRAINING", False):
-                rng, _rng = jax.random.split(rng)
-                test_metrics = jax.lax.cond(
-                    train_state.n_updates % int(config["NUM_UPDATES"] * config["TEST_INTERVAL"]) == 0,
-                    lambda _: get_test_metrics(train_state.model, _rng),
-                    lambda _: test_metrics,
-                    operand=None,
-                )
-                metrics.update({f"test_{k}": v for k, v in test_metrics.items()})
-
-            # report on wandb if required
-            if config["WANDB_MODE"] != "disabled":
-
-                def callback(metrics, original_rng):
-                    if config.get("WANDB_LOG_ALL_SEEDS", False):
-                        metrics.update(
-                            {
-                                f"rng{int(original_rng)}/{k}": v
-                                for k, v in metrics.items()
-                            }
-                        )
-                    wandb.log(metrics, step=metrics["update_steps"])
-
-                jax.debug.callback(callback, metrics, original_rng)
+            delta = lambda_returns - next_q
+            lambda_returns = (
+                    target_bootstrap + config["GAMMA"] * config["LAMBDA"] * delta
+            )
+            lambda_returns = (
+                                     1 - transition.done
+                             ) * lambda_returns + transition.done * transition.reward
+            next_q = jnp.max(transition.q_val, axis=-1)
+            return (lambda_returns, next_q), lambda_returns
+
+        last_q = last_q * (1 - transitions.done[-1])
+        lambda_returns = transitions.reward[-1] + config["GAMMA"] * last_q
+        _, targets = jax.lax.scan(
+            _get_target,
+            (lambda_returns, last_q),
+            jax.tree.map(lambda x: x[:-1], transitions),
+            reverse=True,
+        )
+        lambda_targets = jnp.concatenate((targets, lambda_returns[np.newaxis]))
 
-            runner_state = (train_state, obsv, env_state, test_metrics, rng)
+        # NETWORKS UPDATE
+        def _learn_epoch(carry, _):
+            update_state, rng = carry
+            train_state, lambda_targets, transitions = update_state
 
-            return runner_state, metrics
+            def _learn_phase(carry, minibatch_idx):
+                train_state, batch, rng = carry
+                # Gather the minibatch from the unshuffled transitions
+                minibatch, target = jax.tree_util.tree_map(
+                    lambda x: jnp.take(x, minibatch_idx, axis=0), batch
+                )
 
-        def get_test_metrics(network, rng):
+                def _loss_fn(network):
+                    # (batch_size*2, num_actions)
+                    q_vals = network(minibatch.obs)
+                    chosen_action_qvals = jnp.take_along_axis(
+                        q_vals,
+                        jnp.expand_dims(minibatch.action, axis=-1),
+                        axis=-1,
+                    ).squeeze(axis=-1)
+
+                    loss = 0.5 * jnp.square(chosen_action_qvals - target).mean()
+
+                    return loss, chosen_action_qvals
+
+                (loss, qvals), grads = eqx.filter_value_and_grad(
+                    _loss_fn, has_aux=True
+                )(train_state.model)
+                updates, new_opt_state = train_state.opt.update(
+                    grads,
+                    train_state.opt_state,
+                    eqx.filter(train_state.model, eqx.is_array),  # TODO is_inexact_array
+                )
+                new_network = eqx.apply_updates(train_state.model, updates)
+                new_train_state = train_state.replace(
+                    model=new_network,
+                    opt_state=new_opt_state,
+                    grad_steps=train_state.grad_steps + 1,
+                )
+                # update_state = (new_train_state, lambda_targets, transitions)
+                return (new_train_state, batch, rng), (loss, qvals)
 
-            if not config.get("TEST_DURING_TRAINING", False):
-                return None
+            batch = jax.tree_util.tree_map(
+                lambda x: x.reshape(-1, *x.shape[2:]), (transitions, lambda_targets)
+            )  # num_steps*num_envs (batch_size), ...
 
-            def _env_step(carry, _):
-                env_state, last_obs, rng = carry
-                rng, _rng = jax.random.split(rng)
-                q_vals = network(last_obs)
-                eps = jnp.full(config["TEST_NUM_ENVS"], config["EPS_TEST"])
-                action = jax.vmap(eps_greedy_exploration)(
-                    jax.random.split(_rng, config["TEST_NUM_ENVS"]), q_vals, eps
-                )
-                new_obs, new_env_state, reward, done, info = vmap_step(
-                    config["TEST_NUM_ENVS"]
-                )(_rng, env_state, action)
-                return (new_env_state, new_obs, rng), info
+            # shuffle the indices only, each minibatch is gathered inside the scan
+            rng, _rng = jax.random.split(rng)
+            minibatch_idxs = jax.random.permutation(
+                _rng, config["NUM_STEPS"] * config["NUM_ENVS"]
+            ).reshape(
+                config["NUM_MINIBATCHES"], -1
+            )  # num_mini_updates, batch_size/num_mini_updates
 
             rng, _rng = jax.random.split(rng)
-            init_obs, env_state = vmap_reset(config["TEST_NUM_ENVS"])(_rng)
-            _, infos = filter_scan(
-                _env_step, (env_state, init_obs, _rng), None, config["TEST_NUM_STEPS"]
-            )
-            # return mean of done infos
-            done_infos = jax.tree.map(
-                lambda x: jnp.nanmean(
-                    jnp.where(
-                        infos["returned_episode"],
-                        x,
-                        jnp.nan,
-                    )
-                ),
-                infos,
+            (train_state, _, rng), (loss, qvals) = filter_scan(
+                _learn_phase, (train_state, batch, rng), minibatch_idxs
             )
-            return done_infos
+            update_state = (train_state, lambda_targets, transitions)
+            return (update_state, rng), (loss, qvals)
 
         rng, _rng = jax.random.split(rng)
-        test_metrics = get_test_metrics(train_state.model, _rng)
+        update_state = (train_state, lambda_targets, transitions)
+        (update_state, rng), (loss, qvals) = filter_scan(
+            _learn_epoch, (update_state, rng), None, config["NUM_EPOCHS"]
+        )
+        train_state, lambda_targets, transitions = update_state
+        train_state = train_state.replace(n_updates=train_state.n_updates + 1)
+        metrics = {
+            "env_step": train_state.timesteps,
+            "update_steps": train_state.n_updates,
+            "grad_steps": train_state.grad_steps,
+            "td_loss": loss.mean(),
+            "qvals": qvals.mean(),
+        }
+        metrics.update({k: v.mean() for k, v in transitions.infos.items()})
+
+        runner_state = (train_state, obsv, env_state, original_rng, rng)
+
+        return runner_state, metrics
+
+    def get_test_metrics(train_state, rng):
+        # run by the driver between segments, not inside the vmapped update loop
+        if not config.get("TEST_DURING_TRAINING", False):
+            return None
+
+        network = train_state.model
+
+        def _env_step(carry, _):
+            env_state, last_obs, rng = carry
+            rng, _rng = jax.random.split(rng)
+            q_vals = network(last_obs)
+            eps = jnp.full(config["TEST_NUM_ENVS"], config["EPS_TEST"])
+            action = jax.vmap(eps_greedy_exploration)(
+                jax.random.split(_rng, config["TEST_NUM_ENVS"]), q_vals, eps
+            )
+            new_obs, new_env_state, reward, done, info = vmap_step(
+                config["TEST_NUM_ENVS"]
+            )(_rng, env_state, action)
+            return (new_env_state, new_obs, rng), info
 
         rng, _rng = jax.random.split(rng)
-        obsv, env_state = vmap_reset(config["NUM_ENVS"])(_rng)
+        init_obs, env_state = vmap_reset(config["TEST_NUM_ENVS"])(_rng)
+        _, infos = filter_scan(
+            _env_step, (env_state, init_obs, _rng), None, config["TEST_NUM_STEPS"]
+        )
+        # return mean of done infos
+        done_infos = jax.tree.map(
+            lambda x: jnp.nanmean(
+                jnp.where(
+                    infos["returned_episode"],
+                    x,
+                    jnp.nan,
+                )
+            ),
+            infos,
+        )
+        return done_infos
 
-        # train
-        rng, _rng = jax.random.split(rng)
-        runner_state = (train_state, obsv, env_state, test_metrics, _rng)
+    def train_segment(runner_state, num_updates):
+        """Run `num_updates` updates, returns the new runner state and the metrics of every update."""
+        return filter_scan(_update_step, runner_state, None, num_updates)
 
-        runner_state, metrics = filter_scan(
-            _update_step, runner_state, None, config["NUM_UPDATES"]
-        )
+    return init, train_segment, get_test_metrics
+
+
+def make_train(config):
+    init, train_segment, _ = make_train_segments(config)
+
+    def train(rng):
+        runner_state, metrics = train_segment(init(rng), config["NUM_UPDATES"])
         return {"runner_state": runner_state, "metrics": metrics}
 
     return train
@@ -454,8 +439,7 @@ def single_run(config):
 
     t0 = time.time()
     rngs = jax.random.split(rng, config["NUM_SEEDS"])
-    train_vjit = eqx.filter_jit(eqx.filter_vmap(make_train(config)))
-    outs = jax.block_until_ready(train_vjit(rngs))
+    outs = jax.block_until_ready(run_segments(config, *make_train_segments(config), rngs))
     print(f"Took {time.time() - t0} seconds to complete.")
 
     # evaluate
@@ -470,7 +454,9 @@ def single_run(config):
         '{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["ENV_NAME"], config["PARTIAL"],
                                                     config["SEED"]), network_squeezed)
     rng, _rng = jax.random.split(rng)
-    network = QNetwork(5, key=_rng)
+    network = QNetwork(
+        5, key=_rng, encoder=config.get("ENCODER", "default"), precision=config.get("PRECISION", "fp32")
+    )
     model = eqx.tree_deserialise_leaves(
         '{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["ENV_NAME"], config["PARTIAL"],
                                                     config["SEED"]), network)
@@ -495,8 +481,7 @@ def tune(default_config):
         print("running experiment with params:", config)
         rng = jax.random.PRNGKey(config["SEED"])
         rngs = jax.random.split(rng, config["NUM_SEEDS"])
-        train_vjit = jax.jit(jax.vmap(make_train(config)))
-        outs = jax.block_until_ready(train_vjit(rngs))
+        outs = jax.block_until_ready(run_segments(config, *make_train_segments(config), rngs))
         # return outs
 
     sweep_config = {
@@ -9,6 +9,7 @@ import optax
 import equinox as eqx
 import popgym_arcade
 from popgym_arcade.wrappers import LogWrapper
+from popgym_arcade.baselines.driver import run_segments
 from popgym_arcade.baselines.model import add_batch_dim
 from popgym_arcade.baselines.model import QNetworkRNN
 import wandb
@@ -47,8 +48,21 @@ class BoltzmannActor(eqx.Module):
         return jax.random.categorical(key, logits / temperature)
 
 
+def store_obs(obs: chex.Array, obs_dtype: str) -> chex.Array:
+    """Quantize observations in [0, 1] to uint8 for the transition memory, or keep them as float32."""
+    if obs_dtype == "uint8":
+        return jnp.round(obs * 255).astype(jnp.uint8)
+    return obs
+
+
+def load_obs(obs: chex.Array) -> chex.Array:
+    """Inverse of `store_obs`, returns float32 observations in [0, 1]."""
+    if obs.dtype == jnp.uint8:
+        return obs.astype(jnp.float32) / 255
+    return obs
+
+
 class Transition(NamedTuple):
-    last_hs: chex.Array
     obs: chex.Array
     action: chex.Array
     reward: chex.Array
@@ -90,24 +104,33 @@ class TrainState(State):
     grad_steps: jnp.ndarray
 
 
-def make_train(config):
+def make_train_segments(config):
+    """
+    Build the training loop as `init(rng) -> runner_state`, `train_segment(runner_state, num_updates)`
+    and `test(train_state, rng)`, see `popgym_arcade.baselines.driver.run_segments`.
+    """
+    config["OBS_DTYPE"] = config.get("OBS_DTYPE", "float32")
+    assert config["OBS_DTYPE"] in ("float32", "uint8"), "OBS_DTYPE must be float32 or uint8"
     config["NUM_UPDATES"] = (
-            config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"]
+            int(config["TOTAL_TIMESTEPS"] // config["NUM_STEPS"] // config["NUM_ENVS"])
     )
 
     config["NUM_UPDATES_DECAY"] = (
-            config["TOTAL_TIMESTEPS_DECAY"] // config["NUM_STEPS"] // config["NUM_ENVS"]
+            int(config["TOTAL_TIMESTEPS_DECAY"] // config["NUM_STEPS"] // config["NUM_ENVS"])
     )
 
     assert (config["NUM_STEPS"] * config["NUM_ENVS"]) % config[
         "NUM_MINIBATCHES"
     ] == 0, "NUM_MINIBATCHES must divide NUM_STEPS*NUM_ENVS"
+    config["CHURN_EVAL"] = config.get("CHURN_EVAL", False)
+    config["CHURN_INTERVAL"] = config.get("CHURN_INTERVAL", 1)
+    config["CHURN_NUM_ENVS"] = min(config.get("CHURN_NUM_ENVS", 16), config["NUM_ENVS"])
+    # The memory window of the next update must start inside the current rollout
+    assert config["NUM_STEPS"] >= config["MEMORY_WINDOW"], "NUM_STEPS must be at least MEMORY_WINDOW"
 
     env, env_params = popgym_arcade.make(config["ENV_NAME"], partial_obs=config["PARTIAL"])
     env = LogWrapper(env)
-    # config["TEST_NUM_STEPS"] = config.get(
-    #     "TEST_NUM_STEPS", env_params.max_steps_in_episode
-    # )
+    config["TEST_NUM_STEPS"] = config.get("TEST_NUM_STEPS", 500)
     vmap_reset = lambda n_envs: lambda rng: jax.vmap(env.reset, in_axes=(0, None))(
         jax.random.split(rng, n_envs), env_params
     )
@@ -131,25 +154,32 @@ def make_train(config):
         )
         return chosed_actions
 
-    def train(rng):
-        original_rng = rng[0]
-        eps_scheduler = optax.linear_schedule(
-            config["EPS_START"],
-            config["EPS_FINISH"],
-            (config["EPS_DECAY"]) * config["NUM_UPDATES_DECAY"] * config["NUM_MINIBATCHES"],
-        )
+    eps_scheduler = optax.linear_schedule(
+        config["EPS_START"],
+        config["EPS_FINISH"],
+        (config["EPS_DECAY"]) * config["NUM_UPDATES_DECAY"] * config["NUM_MINIBATCHES"],
+    )
 
-        lr_scheduler = optax.linear_schedule(
-            init_value=config["LR"],
-            end_value=5e-7,
-            transition_steps=(config["NUM_UPDATES_DECAY"])
-                             * config["NUM_MINIBATCHES"]
-                             * config["NUM_EPOCHS"],
-        )
-        lr = lr_scheduler if config.get("LR_LINEAR_DECAY", False) else config["LR"]
+    lr_scheduler = optax.linear_schedule(
+        init_value=config["LR"],
+        end_value=5e-7,
+        transition_steps=(config["NUM_UPDATES_DECAY"])
+                         * config["NUM_MINIBATCHES"]
+                         * config["NUM_EPOCHS"],
+    )
+    lr = lr_scheduler if config.get("LR_LINEAR_DECAY", False) else config["LR"]
+
+    def init(rng):
+        original_rng = rng[0]
         rng, _rng, rng_init = jax.random.split(rng, 3)
 
-        network = QNetworkRNN(5, rng, config["MEMORY_TYPE"])
+        network = QNetworkRNN(
+            5,
+            rng,
+            config["MEMORY_TYPE"],
+            encoder=config.get("ENCODER", "default"),
+            precision=config.get("PRECISION", "fp32"),
+        )
 
         hidden_state = network.initialize_carry(key=rng_init)
         hidden_state = add_batch_dim(hidden_state, config["NUM_ENVS"])
@@ -170,342 +200,6 @@ def make_train(config):
             grad_steps=jnp.array(0),
         )
 
-        # TRAINING LOOP
-        def _update_step(runner_state, unused):
-
-            train_state, memory_transitions, expl_state, test_metrics, rng = runner_state
-
-            # SAMPLE PHASE
-            def _step_env(runner_state, _):
-                train_state, memory_transitions, expl_state, test_metrics, rng = runner_state
-                hs, last_obs, last_done, last_action, env_state = expl_state
-                rng, rng_a, rng_s = jax.random.split(rng, 3)
-
-                _obs = last_obs[np.newaxis]  # (1 (dummy time), num_envs, obs_size)
-                _done = last_done[np.newaxis]  # (1 (dummy time), num_envs)
-                _last_action = last_action[np.newaxis]  # (1 (dummy time), num_envs)
-
-                new_hs, q_vals = train_state.model(
-                    hs,
-                    _obs,
-                    _done,
-                    _last_action,
-                )  # (num_envs, hidden_size), (1, num_envs, num_actions)
-                q_vals = q_vals.squeeze(axis=0)  # (num_envs, num_actions) remove the time dim
-
-                _rngs = jax.random.split(rng_a, config["NUM_ENVS"])
-                eps = jnp.full(config["NUM_ENVS"], eps_scheduler(train_state.n_updates))
-                new_action = eqx.filter_vmap(eps_greedy_exploration)(_rngs, q_vals, eps)
-
-                new_obs, new_env_state, reward, new_done, info = vmap_step(
-                    config["NUM_ENVS"]
-                )(rng_s, env_state, new_action)
-
-                transition = Transition(
-                    last_hs=hs,
-                    obs=last_obs,
-                    action=new_action,
-                    reward=config.get("REW_SCALE", 1) * reward,
-                    done=new_done,
-                    last_done=last_done,
-                    last_action=last_action,
-                    q_vals=q_vals,
-                    infos=info,
-                )
-                new_expl_state = (new_hs, new_obs, new_done, new_action, new_env_state)
-                runner_state = (train_state, memory_transitions, new_expl_state, test_metrics, rng)
-                return runner_state, transition
-
-            # step the env
-            rng, _rng = jax.random.split(rng)
-            runner_state, transitions = filter_scan(
-                _step_env,
-                runner_state,
-                None,
-                config["NUM_STEPS"],
-            )
-            train_state, memory_transitions, expl_state, test_metrics, rng = runner_state
-            expl_state = tuple(expl_state)
-
-            train_state = train_state.replace(
-                timesteps=train_state.timesteps + config["NUM_STEPS"] * config["NUM_ENVS"]
-            )  # update timesteps count
-
-            # insert the transitions into the memory
-            memory_transitions = jax.tree.map(
-                lambda x, y: jnp.concatenate([x[config["NUM_STEPS"]:], y], axis=0),
-                memory_transitions,
-                transitions,
-            )
-
-            # NETWORKS UPDATE
-            def _learn_epoch(carry, _):
-                update_state, rng = carry
-                train_state, memory_transitions = update_state
-
-                def _learn_phase(carry, minibatch):
-                    # minibatch shape: num_steps, batch_size, ...
-                    # with batch_size = num_envs/num_minibatches
-
-                    train_state, rng = carry
-                    # hs = minibatch.last_hs[0]  # hs of oldest step (batch_size, hidden_size)
-                    hs = jax.tree.map(lambda hs: hs[0], minibatch.last_hs)
-                    agent_in = (
-                        minibatch.obs,
-                        minibatch.last_done,
-                        minibatch.last_action,
-                    )
-
-                    def _compute_targets(last_q, q_vals, reward, done):
-                        def _get_target(lambda_returns_and_next_q, rew_q_done):
-                            reward, q, done = rew_q_done
-                            lambda_returns, next_q = lambda_returns_and_next_q
-                            target_bootstrap = (
-                                    reward + config["GAMMA"] * (1 - done) * next_q
-                            )
-                            delta = lambda_returns - next_q
-                            lambda_returns = (
-                                    target_bootstrap
-                                    + config["GAMMA"] * config["LAMBDA"] * delta
-                            )
-                            lambda_returns = (1 - done) * lambda_returns + done * reward
-                            next_q = jnp.max(q, axis=-1)
-                            return (lambda_returns, next_q), lambda_returns
-
-                        lambda_returns = reward[-1] + config["GAMMA"] * (1 - done[-1]) * last_q
-                        last_q = jnp.max(q_vals[-1], axis=-1)
-                        _, targets = jax.lax.scan(
-                            _get_target,
-                            (lambda_returns, last_q),
-                            jax.tree.map(lambda x: x[:-1], (reward, q_vals, done)),
-                            reverse=True,
-                        )
-                        targets = jnp.concatenate([targets, lambda_returns[np.newaxis]])
-                        return targets
-
-                    def _loss_fn(network):
-                        # hs = jax.tree.map(lambda x: jnp.squeeze(x, axis=0), hs)
-                        hidden_state, q_vals = network(
-                            hs,
-                            *agent_in,
-                        )  # (num_steps, batch_size, num_actions)
-                        # lambda returns are computed using NUM_STEPS as the horizon, and optimizing from t=0 to NUM_STEPS-1
-                        target_q_vals = jax.lax.stop_gradient(q_vals)
-                        last_q = target_q_vals[-1].max(axis=-1)
-                        target = _compute_targets(
-                            last_q,  # q_vals at t=NUM_STEPS-1
-                            target_q_vals[:-1],
-                            minibatch.reward[:-1],
-                            minibatch.done[:-1],
-                        ).reshape(
-                            -1
-                        )  # (num_steps-1*batch_size,)
-
-                        chosen_action_qvals = jnp.take_along_axis(
-                            q_vals,
-                            jnp.expand_dims(minibatch.action, axis=-1),
-                            axis=-1,
-                        ).squeeze(axis=-1)  # (num_steps, num_agents, batch_size,)
-                        chosen_action_qvals = chosen_action_qvals[:-1].reshape(-1)  # (num_steps-1*batch_size,)
-
-                        loss = 0.5 * jnp.square(chosen_action_qvals - target).mean()
-                        return loss, chosen_action_qvals
-
-                    (loss, qvals), grads = eqx.filter_value_and_grad(
-                        _loss_fn, has_aux=True
-                    )(train_state.model)
-                    updates, new_opt_state = train_state.opt.update(
-                        grads, train_state.opt_state, eqx.filter(train_state.model, eqx.is_array),
-                        # TODO is_inexact_array
-                    )
-                    new_network = eqx.apply_updates(train_state.model, updates)
-                    new_train_state = train_state.replace(
-                        model=new_network,
-                        opt_state=new_opt_state,
-                        grad_steps=train_state.grad_steps + 1,
-                    )
-                    hidden_state, q_vals_new = new_network(
-                        hs,
-                        *agent_in,
-                    )
-                    return (new_train_state, rng), (loss, qvals, q_vals_new)
-
-                def preprocess_transition(x, rng):
-                    # x: (num_steps, num_envs, ...)
-                    x = jax.random.permutation(
-                        rng, x, axis=1
-                    )  # shuffle the transitions
-                    x = x.reshape(
-                        x.shape[0], config["NUM_MINIBATCHES"], -1, *x.shape[2:]
-                    )  # num_steps, minibatches, batch_size/num_minbatches,
-                    x = jnp.swapaxes(x, 0, 1)  # (minibatches, num_steps, batch_size/num_minbatches, ...)
-                    return x
-
-                rng, _rng = jax.random.split(rng)
-                minibatches = jax.tree_util.tree_map(
-                    lambda x: preprocess_transition(x, _rng),
-                    memory_transitions,
-                )  # num_minibatches, num_steps+memory_window, batch_size/num_minbatches, ...
-
-                rng, _rng = jax.random.split(rng)
-                (train_state, rng), (loss, qvals, qvals_new) = filter_scan(
-                    _learn_phase, (train_state, rng), minibatches
-                )
-
-                update_state = (train_state, memory_transitions)
-                return (update_state, rng), (loss, qvals, qvals_new)
-
-            rng, _rng = jax.random.split(rng)
-            update_state = (train_state, memory_transitions)
-            (update_state, rng), (loss, qvals, qvals_new) = filter_scan(
-                _learn_epoch, (update_state, rng), None, config["NUM_EPOCHS"]
-            )
-            train_state, memory_transitions = update_state
-            train_state = train_state.replace(n_updates=train_state.n_updates + 1)
-            metrics = {
-                "env_step": train_state.timesteps,
-                "update_steps": train_state.n_updates,
-                "grad_steps": train_state.grad_steps,
-                "td_loss": loss.mean(),
-                "qvals": qvals.mean(),
-            }
-            metrics.update({k: v.mean() for k, v in transitions.infos.items()})
-            last_action = jnp.argmax(qvals[-1], axis=-1)
-            new_action = jnp.argmax(qvals_new[-1], axis=-1)
-            churn_ratio = (last_action != new_action).mean()
-            metrics["churn_ratio"] = churn_ratio
-            
-            # jax.debug.print("Metrics: {}", metrics)
-            # write info to file
-            with open("metrics.txt", "a") as f:
-                f.write(f"churn_ratio: {churn_ratio}\n")
-            jax.debug.print("churn_ratio: {}", churn_ratio) 
-            # action: (128+4, 16)
-
-            # print(f"memory_transitions.shape: {memory_transitions}")
-            # jax.debug.print("transitions: {}", transitions)
-            # metrics = transitions.infos
-            if config.get("TEST_DURING_TRAINING", False):
-                rng, _rng = jax.random.split(rng)
-                test_metrics = jax.lax.cond(
-                    train_state.n_updates
-                    % int(config["NUM_UPDATES"] * config["TEST_INTERVAL"])
-                    == 0,
-                    lambda _: get_test_metrics(train_state, _rng),
-                    lambda _: test_metrics,
-                    operand=None,
-                )
-                metrics.update({f"test_{k}": v for k, v in test_metrics.items()})
-
-            # report on wandb if required
-            if config["WANDB_MODE"] != "disabled":
-
-                def callback(metrics, original_rng):
-                    if config.get("WANDB_LOG_ALL_SEEDS", False):
-                        metrics.update(
-                            {
-                                f"rng{int(original_rng)}/{k}": v
-                                for k, v in metrics.items()
-                            }
-                        )
-                    wandb.log(metrics, step=metrics["update_steps"])
-
-                jax.debug.callback(callback, metrics, original_rng)
-                # jax.debug.print("Timesteps: {}, Returns: {}", metrics['env_step'], transitions.infos['returned_episode_returns'].mean())
-            # if config["WANDB_MODE"] != "disabled":
-
-            #     def callback(info):
-            #         return_values = info["returned_episode_returns"][
-            #             info["returned_episode"]
-            #         ]
-            #         timesteps = (
-            #             info["timestep"][info["returned_episode"]] * config["NUM_ENVS"]
-            #         )
-            #         for t in range(len(timesteps)):
-            #             log_dict = {
-            #                 "global step": timesteps[t],
-            #                 "episodic return": return_values[t],
-            #             }
-            #             print(
-            #                 f"global step={timesteps[t]}, episodic return={return_values[t]}"
-            #             )
-            #             if timesteps[t] % 100 == 0:
-            #                 wandb.log(log_dict)
-
-            #     jax.debug.callback(callback, metrics)
-
-            runner_state = (train_state, memory_transitions, tuple(expl_state), test_metrics, rng)
-
-            return runner_state, metrics
-
-        def get_test_metrics(train_state, rng):
-
-            if not config.get("TEST_DURING_TRAINING", False):
-                return None
-
-            def _greedy_env_step(carry, _):
-                train_state, step_state = carry
-                hs, last_obs, last_done, last_action, env_state, rng = step_state
-                rng, rng_a, rng_s = jax.random.split(rng, 3)
-                _obs = last_obs[np.newaxis]  # (1 (dummy time), num_envs, obs_size)
-                _done = last_done[np.newaxis]  # (1 (dummy time), num_envs)
-                _last_action = last_action[np.newaxis]  # (1 (dummy time), num_envs)
-                new_hs, q_vals = train_state.model(
-                    hs,
-                    _obs,
-                    _done,
-                    _last_action,
-                )  # (num_envs, hidden_size), (1, num_envs, num_actions)
-                q_vals = q_vals.squeeze(axis=0)  # (num_envs, num_actions) remove the time dim
-                eps = jnp.full(config["TEST_NUM_ENVS"], config["EPS_TEST"])
-                new_action = jax.vmap(eps_greedy_exploration)(
-                    jax.random.split(rng_a, config["TEST_NUM_ENVS"]), q_vals, eps
-                )
-                new_obs, new_env_state, reward, new_done, info = vmap_step(
-                    config["TEST_NUM_ENVS"]
-                )(rng_s, env_state, new_action)
-                step_state = (new_hs, new_obs, new_done, new_action, new_env_state, rng)
-                carry = (train_state, step_state)
-                return carry, info
-
-            rng, _rng = jax.random.split(rng)
-            init_obs, env_state = vmap_reset(config["TEST_NUM_ENVS"])(_rng)
-            init_done = jnp.zeros((config["TEST_NUM_ENVS"]), dtype=bool)
-            init_action = jnp.zeros((config["TEST_NUM_ENVS"]), dtype=int)
-            # initialise_carry_fn = partial(network.apply, method="initialize_carry", mutable=["batch_stats"])
-            # init_hs = initialise_carry_fn({"params":train_state.params})
-            # init_hs = init_hs[0]
-            init_hs = train_state.model.initialize_carry(key=_rng)
-            init_hs = add_batch_dim(init_hs, config["TEST_NUM_ENVS"])
-
-            step_state = (
-                init_hs,
-                init_obs,
-                init_done,
-                init_action,
-                env_state,
-                _rng,
-            )
-            carry = (train_state, step_state)
-            carry, infos = filter_scan(
-                _greedy_env_step, carry, None, config["TEST_NUM_STEPS"]
-            )
-            # return mean of done infos
-            done_infos = jax.tree.map(
-                lambda x: jnp.nanmean(
-                    jnp.where(
-                        infos["returned_episode"],
-                        x,
-                        jnp.nan,
-                    )
-                ),
-                infos,
-            )
-            return done_infos
-
-        rng, _rng = jax.random.split(rng)
-        test_metrics = get_test_metrics(train_state, _rng)
-
         rng, _rng = jax.random.split(rng)
         obs, env_state = vmap_reset(config["NUM_ENVS"])(_rng)
         init_dones = jnp.zeros((config["NUM_ENVS"]), dtype=bool)
@@ -519,10 +213,14 @@ def make_train(config):
         # expl_state = add_batch_dim(expl_state, 1, 1)
 
         # step randomly to have the initial memory window
-        def _random_step(carry, _):
+        def _random_step(carry, step):
             _carry, rng = carry
-            train_state, expl_state = _carry
+            train_state, expl_state, window_hs = _carry
             hs, last_obs, last_done, last_action, env_state = expl_state
+            # The first update drops the oldest NUM_STEPS transitions of this memory
+            window_hs = jax.tree.map(
+                lambda h, w: jnp.where(step == config["NUM_STEPS"], h, w), hs, window_hs
+            )
             rng, rng_a, rng_s = jax.random.split(rng, 3)
             _obs = last_obs[np.newaxis]  # (1 (dummy time), num_envs, obs_size)
             _done = last_done[np.newaxis]  # (1 (dummy time), num_envs)
@@ -541,8 +239,7 @@ def make_train(config):
                 config["NUM_ENVS"]
             )(rng_s, env_state, new_action)
             transition = Transition(
-                last_hs=hs,
-                obs=last_obs,
+                obs=store_obs(last_obs, config["OBS_DTYPE"]),
                 action=new_action,
                 reward=config.get("REW_SCALE", 1) * reward,
                 done=new_done,
@@ -552,29 +249,344 @@ def make_train(config):
                 infos=info,
             )
             new_expl_state = (new_hs, new_obs, new_done, new_action, new_env_state)
-            _carry = (train_state, new_expl_state)
+            _carry = (train_state, new_expl_state, window_hs)
             carry = (_carry, rng)
             return carry, transition
 
         rng, _rng = jax.random.split(rng)
-        _carry = (train_state, expl_state)
+        _carry = (train_state, expl_state, hidden_state)
         (_carry, rng), memory_transitions = filter_scan(
             _random_step,
             (_carry, _rng),
-            None,
-            config["MEMORY_WINDOW"] + config["NUM_STEPS"],
+            jnp.arange(config["MEMORY_WINDOW"] + config["NUM_STEPS"]),
         )
-        train_state, expl_state = _carry
+        train_state, expl_state, memory_hs = _carry
         expl_state = tuple(expl_state)
+        if config["MEMORY_WINDOW"] == 0:
+            # The scan never reaches step NUM_STEPS, the next memory starts at the current state
+            memory_hs = expl_state[0]
 
         # train
         rng, _rng = jax.random.split(rng)
-        runner_state = (train_state, memory_transitions, expl_state, test_metrics, _rng)
+        runner_state = (train_state, memory_transitions, memory_hs, expl_state, original_rng, _rng)
+        return runner_state
+
+    # TRAINING LOOP
+    def _update_step(runner_state, step):
+
+        # memory_hs is the hidden state at the oldest step of the memory once the new
+        # rollout is inserted. Only this one is kept instead of one per transition.
+        train_state, memory_transitions, memory_hs, expl_state, original_rng, rng = runner_state
+        # The memory of the next update starts MEMORY_WINDOW steps before the end of this rollout
+        window_start = config["NUM_STEPS"] - config["MEMORY_WINDOW"]
+
+        # SAMPLE PHASE
+        def _step_env(carry, step):
+            runner_state, window_hs = carry
+            train_state, memory_transitions, memory_hs, expl_state, original_rng, rng = runner_state
+            hs, last_obs, last_done, last_action, env_state = expl_state
+            window_hs = jax.tree.map(
+                lambda h, w: jnp.where(step == window_start, h, w), hs, window_hs
+            )
+            rng, rng_a, rng_s = jax.random.split(rng, 3)
+
+            _obs = last_obs[np.newaxis]  # (1 (dummy time), num_envs, obs_size)
+            _done = last_done[np.newaxis]  # (1 (dummy time), num_envs)
+            _last_action = last_action[np.newaxis]  # (1 (dummy time), num_envs)
+
+            new_hs, q_vals = train_state.model(
+                hs,
+                _obs,
+                _done,
+                _last_action,
+            )  # (num_envs, hidden_size), (1, num_envs, num_actions)
+            q_vals = q_vals.squeeze(axis=0)  # (num_envs, num_actions) remove the time dim
+
+            _rngs = jax.random.split(rng_a, config["NUM_ENVS"])
+            eps = jnp.full(config["NUM_ENVS"], eps_scheduler(train_state.n_updates))
+            new_action = eqx.filter_vmap(eps_greedy_exploration)(_rngs, q_vals, eps)
+
+            new_obs, new_env_state, reward, new_done, info = vmap_step(
+                config["NUM_ENVS"]
+            )(rng_s, env_state, new_action)
+
+            transition = Transition(
+                obs=store_obs(last_obs, config["OBS_DTYPE"]),
+                action=new_action,
+                reward=config.get("REW_SCALE", 1) * reward,
+                done=new_done,
+                last_done=last_done,
+                last_action=last_action,
+                q_vals=q_vals,
+                infos=info,
+            )
+            new_expl_state = (new_hs, new_obs, new_done, new_action, new_env_state)
+            runner_state = (train_state, memory_transitions, memory_hs, new_expl_state, original_rng, rng)
+            return (runner_state, window_hs), transition
+
+        # step the env
+        rng, _rng = jax.random.split(rng)
+        (runner_state, window_hs), transitions = filter_scan(
+            _step_env,
+            (runner_state, expl_state[0]),
+            jnp.arange(config["NUM_STEPS"]),
+        )
+        train_state, memory_transitions, memory_hs, expl_state, original_rng, rng = runner_state
+        expl_state = tuple(expl_state)
+        if window_start == config["NUM_STEPS"]:
+            # The scan never reaches window_start, the next memory starts after this rollout
+            window_hs = expl_state[0]
+
+        train_state = train_state.replace(
+            timesteps=train_state.timesteps + config["NUM_STEPS"] * config["NUM_ENVS"]
+        )  # update timesteps count
+
+        # insert the transitions into the memory
+        memory_transitions = jax.tree.map(
+            lambda x, y: jnp.concatenate([x[config["NUM_STEPS"]:], y], axis=0),
+            memory_transitions,
+            transitions,
+        )
+
+        # NETWORKS UPDATE
+        def _learn_epoch(carry, _):
+            update_state, rng = carry
+            train_state, memory_transitions, memory_hs = update_state
+
+            def _learn_phase(carry, minibatch_idx):
+                # minibatch shape: num_steps, batch_size, ...
+                # with batch_size = num_envs/num_minibatches
+                # hs is the hidden state of the oldest step (batch_size, hidden_size)
+
+                train_state, memory, rng = carry
+                # gather the minibatch envs from the unshuffled memory
+                minibatch = jax.tree_util.tree_map(
+                    lambda x: jnp.take(x, minibatch_idx, axis=1), memory[0]
+                )
+                hs = jax.tree_util.tree_map(
+                    lambda x: jnp.take(x, minibatch_idx, axis=0), memory[1]
+                )
+                agent_in = (
+                    load_obs(minibatch.obs),
+                    minibatch.last_done,
+                    minibatch.last_action,
+                )
+
+                def _compute_targets(last_q, q_vals, reward, done):
+                    def _get_target(lambda_returns_and_next_q, rew_q_done):
+                        reward, q, done = rew_q_done
+                        lambda_returns, next_q = lambda_returns_and_next_q
+                        target_bootstrap = (
+                                reward + config["GAMMA"] * (1 - done) * next_q
+                        )
+                        delta = lambda_returns - next_q
+                        lambda_returns = (
+                                target_bootstrap
+                                + config["GAMMA"] * config["LAMBDA"] * delta
+                        )
+                        lambda_returns = (1 - done) * lambda_returns + done * reward
+                        next_q = jnp.max(q, axis=-1)
+                        return (lambda_returns, next_q), lambda_returns
+
+                    lambda_returns = reward[-1] + config["GAMMA"] * (1 - done[-1]) * last_q
+                    last_q = jnp.max(q_vals[-1], axis=-1)
+                    _, targets = jax.lax.scan(
+                        _get_target,
+                        (lambda_returns, last_q),
+                        jax.tree.map(lambda x: x[:-1], (reward, q_vals, done)),
+                        reverse=True,
+                    )
+                    targets = jnp.concatenate([targets, lambda_returns[np.newaxis]])
+                    return targets
+
+                def _loss_fn(network):
+                    # hs = jax.tree.map(lambda x: jnp.squeeze(x, axis=0), hs)
+                    hidden_state, q_vals = network(
+                        hs,
+                        *agent_in,
+                    )  # (num_steps, batch_size, num_actions)
+                    # lambda returns are computed using NUM_STEPS as the horizon, and optimizing from t=0 to NUM_STEPS-1
+                    target_q_vals = jax.lax.stop_gradient(q_vals)
+                    last_q = target_q_vals[-1].max(axis=-1)
+                    target = _compute_targets(
+                        last_q,  # q_vals at t=NUM_STEPS-1
+                        target_q_vals[:-1],
+                        minibatch.reward[:-1],
+                        minibatch.done[:-1],
+                    ).reshape(
+                        -1
+                    )  # (num_steps-1*batch_size,)
+
+                    chosen_action_qvals = jnp.take_along_axis(
+                        q_vals,
+                        jnp.expand_dims(minibatch.action, axis=-1),
+                        axis=-1,
+                    ).squeeze(axis=-1)  # (num_steps, num_agents, batch_size,)
+                    chosen_action_qvals = chosen_action_qvals[:-1].reshape(-1)  # (num_steps-1*batch_size,)
+
+                    loss = 0.5 * jnp.square(chosen_action_qvals - target).mean()
+                    return loss, chosen_action_qvals
+
+                (loss, qvals), grads = eqx.filter_value_and_grad(
+                    _loss_fn, has_aux=True
+                )(train_state.model)
+                updates, new_opt_state = train_state.opt.update(
+                    grads, train_state.opt_state, eqx.filter(train_state.model, eqx.is_array),
+                    # TODO is_inexact_array
+                )
+                new_network = eqx.apply_updates(train_state.model, updates)
+                new_train_state = train_state.replace(
+                    model=new_network,
+                    opt_state=new_opt_state,
+                    grad_steps=train_state.grad_steps + 1,
+                )
+                return (new_train_state, memory, rng), (loss, qvals)
+
+            # shuffle the env indices only, each minibatch is gathered inside the scan
+            rng, _rng = jax.random.split(rng)
+            minibatch_idxs = jax.random.permutation(_rng, config["NUM_ENVS"]).reshape(
+                config["NUM_MINIBATCHES"], -1
+            )  # num_minibatches, batch_size/num_minbatches
+
+            rng, _rng = jax.random.split(rng)
+            (train_state, _, rng), (loss, qvals) = filter_scan(
+                _learn_phase, (train_state, (memory_transitions, memory_hs), rng), minibatch_idxs
+            )
+
+            update_state = (train_state, memory_transitions, memory_hs)
+            return (update_state, rng), (loss, qvals)
+
+        def _greedy_actions(model):
+            # greedy actions on the memory of the first CHURN_NUM_ENVS envs
+            churn_memory = jax.tree.map(lambda x: x[:, :config["CHURN_NUM_ENVS"]], memory_transitions)
+            churn_hs = jax.tree.map(lambda x: x[:config["CHURN_NUM_ENVS"]], memory_hs)
+            _, q_vals = model(
+                churn_hs,
+                load_obs(churn_memory.obs),
+                churn_memory.last_done,
+                churn_memory.last_action,
+            )
+            return jnp.argmax(q_vals, axis=-1)
+
+        old_model = train_state.model
+        rng, _rng = jax.random.split(rng)
+        update_state = (train_state, memory_transitions, memory_hs)
+        (update_state, rng), (loss, qvals) = filter_scan(
+            _learn_epoch, (update_state, rng), None, config["NUM_EPOCHS"]
+        )
+        train_state, memory_transitions, _ = update_state
+
+        if config["CHURN_EVAL"]:
+            # fraction of greedy actions changed by this update, nan when not measured.
+            # The predicate uses the step within the segment, which unlike n_updates is not
+            # batched over seeds, so the cond is not turned into a select that runs both branches
+            churn_ratio = jax.lax.cond(
+                step % config["CHURN_INTERVAL"] == 0,
+                lambda _: (_greedy_actions(old_model) != _greedy_actions(train_state.model)).mean(),
+                lambda _: jnp.array(jnp.nan, dtype=jnp.float32),
+                operand=None,
+            )
 
-        runner_state, metrics = filter_scan(
-            _update_step, runner_state, None, config["NUM_UPDATES"]
+        memory_hs = window_hs
+        train_state = train_state.replace(n_updates=train_state.n_updates + 1)
+        metrics = {
+            "env_step": train_state.timesteps,
+            "update_steps": train_state.n_updates,
+            "grad_steps": train_state.grad_steps,
+            "td_loss": loss.mean(),
+            "qvals": qvals.mean(),
+        }
+        metrics.update({k: v.mean() for k, v in transitions.infos.items()})
+        if config["CHURN_EVAL"]:
+            metrics["churn_ratio"] = churn_ratio
+
+        # jax.debug.print("Metrics: {}", metrics)
+
+        # print(f"memory_transitions.shape: {memory_transitions}")
+        # jax.debug.print("transitions: {}", transitions)
+        # metrics = transitions.infos
+
+        runner_state = (train_state, memory_transitions, memory_hs, tuple(expl_state), original_rng, rng)
+
+        return runner_state, metrics
+
+    def get_test_metrics(train_state, rng):
+        # run by the driver between segments, not inside the vmapped update loop
+        if not config.get("TEST_DURING_TRAINING", False):
+            return None
+
+        def _greedy_env_step(carry, _):
+            train_state, step_state = carry
+            hs, last_obs, last_done, last_action, env_state, rng = step_state
+            rng, rng_a, rng_s = jax.random.split(rng, 3)
+            _obs = last_obs[np.newaxis]  # (1 (dummy time), num_envs, obs_size)
+            _done = last_done[np.newaxis]  # (1 (dummy time), num_envs)
+            _last_action = last_action[np.newaxis]  # (1 (dummy time), num_envs)
+            new_hs, q_vals = train_state.model(
+                hs,
+                _obs,
+                _done,
+                _last_action,
+            )  # (num_envs, hidden_size), (1, num_envs, num_actions)
+            q_vals = q_vals.squeeze(axis=0)  # (num_envs, num_actions) remove the time dim
+            eps = jnp.full(config["TEST_NUM_ENVS"], config["EPS_TEST"])
+            new_action = jax.vmap(eps_greedy_exploration)(
+                jax.random.split(rng_a, config["TEST_NUM_ENVS"]), q_vals, eps
+            )
+            new_obs, new_env_state, reward, new_done, info = vmap_step(
+                config["TEST_NUM_ENVS"]
+            )(rng_s, env_state, new_action)
+            step_state = (new_hs, new_obs, new_done, new_action, new_env_state, rng)
+            carry = (train_state, step_state)
+            return carry, info
+
+        rng, _rng = jax.random.split(rng)
+        init_obs, env_state = vmap_reset(config["TEST_NUM_ENVS"])(_rng)
+        init_done = jnp.zeros((config["TEST_NUM_ENVS"]), dtype=bool)
+        init_action = jnp.zeros((config["TEST_NUM_ENVS"]), dtype=int)
+        # initialise_carry_fn = partial(network.apply, method="initialize_carry", mutable=["batch_stats"])
+        # init_hs = initialise_carry_fn({"params":train_state.params})
+        # init_hs = init_hs[0]
+        init_hs = train_state.model.initialize_carry(key=_rng)
+        init_hs = add_batch_dim(init_hs, config["TEST_NUM_ENVS"])
+
+        step_state = (
+            init_hs,
+            init_obs,
+            init_done,
+            init_action,
+            env_state,
+            _rng,
+        )
+        carry = (train_state, step_state)
+        carry, infos = filter_scan(
+            _greedy_env_step, carry, None, config["TEST_NUM_STEPS"]
         )
+        # return mean of done infos
+        done_infos = jax.tree.map(
+            lambda x: jnp.nanmean(
+                jnp.where(
+                    infos["returned_episode"],
+                    x,
+                    jnp.nan,
+                )
+            ),
+            infos,
+        )
+        return done_infos
+
+    def train_segment(runner_state, num_updates):
+        """Run `num_updates` updates, returns the new runner state and the metrics of every update."""
+        return filter_scan(_update_step, runner_state, jnp.arange(num_updates))
+
+    return init, train_segment, get_test_metrics
+
 
+def make_train(config):
+    init, train_segment, _ = make_train_segments(config)
+
+    def train(rng):
+        runner_state, metrics = train_segment(init(rng), config["NUM_UPDATES"])
         return {"runner_state": runner_state, "metrics": metrics}
 
     return train
@@ -658,8 +670,7 @@ def single_run(config):
 
     t0 = time.time()
     rngs = jax.random.split(rng, config["NUM_SEEDS"])
-    train_vjit = eqx.filter_jit(eqx.filter_vmap(make_train(config)))
-    outs = jax.block_until_ready(train_vjit(rngs))
+    outs = jax.block_until_ready(run_segments(config, *make_train_segments(config), rngs))
     print(f"Took {time.time() - t0} seconds to complete.")
 
     # evaluate
@@ -672,7 +683,13 @@ def single_run(config):
 
     eqx.tree_serialise_leaves('{}_{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["MEMORY_TYPE"], config["ENV_NAME"], config["PARTIAL"], config["SEED"]), network_squeezed)
     rng, _rng = jax.random.split(rng)
-    network = QNetworkRNN(5, _rng, config["MEMORY_TYPE"])
+    network = QNetworkRNN(
+        5,
+        _rng,
+        config["MEMORY_TYPE"],
+        encoder=config.get("ENCODER", "default"),
+        precision=config.get("PRECISION", "fp32"),
+    )
     model = eqx.tree_deserialise_leaves('{}_{}_{}_model_Partial={}_SEED={}.pkl'.format(config["TRAIN_TYPE"], config["MEMORY_TYPE"], config["ENV_NAME"], config["PARTIAL"], config["SEED"]), network)
 
     evaluate(model, config)
@@ -696,8 +713,7 @@ def tune(default_config):
         t0 = time.time()
         rng = jax.random.PRNGKey(config["SEED"])
         rngs = jax.random.split(rng, config["NUM_SEEDS"])
-        train_vjit = eqx.filter_jit(eqx.filter_vmap(make_train(config)))
-        outs = jax.block_until_ready(train_vjit(rngs))
+        outs = jax.block_until_ready(run_segments(config, *make_train_segments(config), rngs))
         print(f"Took {time.time() - t0} seconds to complete.")
 
     sweep_config = {
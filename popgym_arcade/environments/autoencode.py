@@ -348,9 +348,10 @@ class AutoEncode(environment.Environment):
         
         return draw_sub_canvas(small_canva, large_canva)
 
-    def get_obs(self, state: EnvState) -> chex.Array:
+    def get_obs(self, state: EnvState, params=None, key=None) -> chex.Array:
         """Returns observation from the state."""
-        obs = self.render(state)
+        with jax.named_scope("render"):
+            obs = self.render(state)
         return obs
 
     def action_space(self, params: Optional[EnvParams] = None) -> spaces.Discrete:
@@ -345,7 +345,8 @@ class BattleShip(environment.Environment):
 
     def get_obs(self, state, params=None, key=None) -> chex.Array:
         """Get the observation from the current state."""
-        return self.render(state)
+        with jax.named_scope("render"):
+            return self.render(state)
 
     @functools.partial(jax.jit, static_argnums=(0,))
     def render(self, state) -> chex.Array:
@@ -292,7 +292,8 @@ class CartPole(environment.Environment[EnvState, EnvParams]):
         Returns:
             A `chex.Array` representing the observation.
         """
-        return self.render(state, params, key=key)
+        with jax.named_scope("render"):
+            return self.render(state, params, key=key)
 
     @functools.partial(jax.jit, static_argnums=(0,))
     def render(
@@ -392,9 +392,10 @@ class CountRecall(environment.Environment):
         
         return large_canva
 
-    def get_obs(self, state: EnvState) -> chex.Array:
+    def get_obs(self, state: EnvState, params=None, key=None) -> chex.Array:
         """Returns observation from the state."""
-        obs = self.render(state)
+        with jax.named_scope("render"):
+            obs = self.render(state)
         return obs
 
     def action_space(self, params: Optional[EnvParams] = None) -> spaces.Discrete:
@@ -310,7 +310,8 @@ class MineSweeper(environment.Environment):
         return self.get_obs(state), state
 
     def get_obs(self, state: EnvState, params=None, key=None) -> chex.Array:
-        return self.render(state)
+        with jax.named_scope("render"):
+            return self.render(state)
 
     @functools.partial(jax.jit, static_argnums=(0,))
     def render(self, state) -> chex.Array:
@@ -424,7 +424,8 @@ class Navigator(environment.Environment):
         return obs, state
 
     def get_obs(self, state, params=None, key=None) -> chex.Array:
-        return self.render(state)
+        with jax.named_scope("render"):
+            return self.render(state)
 
 
 
@@ -0,0 +1,915 @@
+"""
+Pure-NumPy single-environment backend for low-latency interactive use.
+
+The game dynamics are ported to NumPy and frames are composed from pixels that
+the JAX renderer draws once at construction, so stepping never dispatches to XLA.
+The frames of the grid games decompose into independent cells and are composed
+from tiles, see `TileRenderer`. The card games paint the sprites of their JAX
+templates in the same order as the JAX renderer, see `NumpyCardEnvironment`.
+CartPole is out of scope, see `UNSUPPORTED_GAMES`.
+"""
+import dataclasses
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnax.environments import spaces
+from jax import lax
+
+from popgym_arcade.environments import autoencode, battleship, countrecall, minesweeper, navigator
+from popgym_arcade.environments.draw_utils import (draw_club,
+                                            draw_diamond,
+                                            draw_heart,
+                                            draw_number,
+                                            draw_spade,
+                                            draw_str)
+
+# Flat pixel indices of a frame and the colors drawn on them
+Sprite = Tuple[np.ndarray, np.ndarray]
+
+
+def _diff(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Flat indices of the pixels that differ between two frames."""
+    return np.flatnonzero(np.any(a != b, axis=-1))
+
+
+class TileRenderer:
+    """
+    Compose frames of a grid game from tiles pre-rendered by its JAX renderer.
+
+    A frame is a static background plus independent regions: one per board cell,
+    whose pixels only depend on whether the cursor is on the cell and which mark
+    the cell shows, and one for the score. The pixel support of every region and
+    every appearance it can take are extracted from the JAX renderer once, so a
+    frame is composed by copying the few regions that differ from the background.
+
+    Args:
+        render: JAX render function of a single state.
+        make_state: `make_state(cursor, marks, score)` returns a JAX state with the
+            cursor on the flat cell index `cursor`, cell marks `marks` of shape
+            `(num_cells,)` where 0 is blank, and score `score`.
+        num_cells: Number of board cells.
+        num_marks: Number of mark values per cell, including blank.
+        max_score: Largest score that can be displayed.
+        batch_size: Number of states rendered per JAX call while building the tiles.
+    """
+
+    def __init__(self, render, make_state, num_cells: int, num_marks: int, max_score: int, batch_size: int = 64):
+        self.num_cells = num_cells
+        self.num_marks = num_marks
+        self._render = jax.jit(jax.vmap(render))
+        self._batch_size = batch_size
+        blank = np.zeros(num_cells, dtype=np.int32)
+
+        def other_cursors(c):
+            a1 = 0 if c != 0 else 1
+            a2 = num_cells - 1 if c != num_cells - 1 else num_cells - 2
+            return a1, a2
+
+        # Blank board with the cursor on each cell
+        cursor_frames = self._render_states([make_state(c, blank, 0) for c in range(num_cells)])
+
+        # Marked cells with and without the cursor on them
+        on_states, off_states = [], []
+        for c in range(num_cells):
+            a1, _ = other_cursors(c)
+            for m in range(1, num_marks):
+                marks = blank.copy()
+                marks[c] = m
+                on_states.append(make_state(c, marks, 0))
+                off_states.append(make_state(a1, marks, 0))
+        on_frames = self._render_states(on_states).reshape((num_cells, num_marks - 1) + cursor_frames.shape[1:])
+        off_frames = self._render_states(off_states).reshape((num_cells, num_marks - 1) + cursor_frames.shape[1:])
+
+        self.supports: List[np.ndarray] = []
+        self.tiles: List[np.ndarray] = []
+        for c in range(num_cells):
+            a1, a2 = other_cursors(c)
+            # Pixels that change with the cursor on this cell but not on the others
+            support = np.intersect1d(
+                _diff(cursor_frames[c], cursor_frames[a1]),
+                _diff(cursor_frames[c], cursor_frames[a2]),
+            )
+            for m in range(num_marks - 1):
+                support = np.union1d(support, _diff(on_frames[c, m], cursor_frames[c]))
+                support = np.union1d(support, _diff(off_frames[c, m], cursor_frames[a1]))
+            # tiles[c][cursor, mark] holds the pixels of the cell's support
+            tile = np.empty((2, num_marks, support.size, 3), dtype=cursor_frames.dtype)
+            tile[0, 0] = cursor_frames[a1].reshape(-1, 3)[support]
+            tile[1, 0] = cursor_frames[c].reshape(-1, 3)[support]
+            tile[0, 1:] = off_frames[c].reshape(num_marks - 1, -1, 3)[:, support]
+            tile[1, 1:] = on_frames[c].reshape(num_marks - 1, -1, 3)[:, support]
+            self.supports.append(support)
+            self.tiles.append(tile)
+
+        score_frames = self._render_states([make_state(0, blank, s) for s in range(max_score + 1)])
+        self.score_support = np.unique(np.concatenate(
+            [_diff(score_frames[s], score_frames[0]) for s in range(max_score + 1)]
+        ))
+        self.score_tiles = score_frames.reshape(max_score + 1, -1, 3)[:, self.score_support]
+
+        all_supports = np.concatenate(self.supports + [self.score_support])
+        if np.unique(all_supports).size != all_supports.size:
+            raise ValueError("Frame regions overlap and cannot be composed from independent tiles")
+
+        # Background: every cell blank and without the cursor, score zero
+        self.frame_shape = cursor_frames.shape[1:]
+        background = cursor_frames[0].reshape(-1, 3).copy()
+        background[self.supports[0]] = self.tiles[0][0, 0]
+        self.background = background
+
+    def _render_states(self, states: List[Any]) -> np.ndarray:
+        frames = []
+        for i in range(0, len(states), self._batch_size):
+            batch = jax.tree.map(lambda *x: jnp.stack(x), *states[i:i + self._batch_size])
+            frames.append(np.asarray(self._render(batch)))
+        return np.concatenate(frames)
+
+    def __call__(self, cursor: int, marks: np.ndarray, score: int) -> np.ndarray:
+        frame = self.background.copy()
+        for c in np.union1d(np.flatnonzero(marks), [cursor]):
+            frame[self.supports[c]] = self.tiles[c][int(c == cursor), marks[c]]
+        if score > 0:
+            frame[self.score_support] = self.score_tiles[score]
+        return frame.reshape(self.frame_shape)
+
+
+def _sprites(frames: np.ndarray, background: np.ndarray) -> List[Sprite]:
+    """The pixels of every frame that differ from `background`, with their colors."""
+    background = background.reshape(-1, background.shape[-1])
+    sprites = []
+    for frame in frames:
+        frame = frame.reshape(-1, frame.shape[-1])
+        pixels = np.flatnonzero(np.any(frame != background, axis=-1))
+        sprites.append((pixels, frame[pixels]))
+    return sprites
+
+
+def _draw_sprites(draw: Callable, values: Sequence[int], shape: Tuple[int, ...], batch_size: int = 64) -> List[Sprite]:
+    """
+    Sprites of `draw(value, canvas)` for every value.
+
+    The values are drawn on a canvas whose color no drawing uses, so every pixel
+    that `draw` sets is part of the sprite, whatever its color.
+    """
+    sentinel = jnp.full(shape, -1.0, dtype=jnp.float32)
+    draw_batch = jax.jit(jax.vmap(draw, in_axes=(0, None)))
+    sprites = []
+    for i in range(0, len(values), batch_size):
+        frames = draw_batch(jnp.asarray(values[i:i + batch_size], dtype=jnp.int32), sentinel)
+        sprites.extend(_sprites(np.asarray(frames), np.asarray(sentinel)))
+    return sprites
+
+
+def _place_block(rng: np.random.Generator, board: np.ndarray, size: int) -> None:
+    """Place a horizontal or vertical block of ones of length `size` uniformly over the free spots."""
+    n = board.shape[0]
+    spots = []
+    for row in range(n):
+        for col in range(n):
+            if col + size <= n and not board[row, col:col + size].any():
+                spots.append((row, col, 0))
+            if row + size <= n and not board[row:row + size, col].any():
+                spots.append((row, col, 1))
+    row, col, direction = spots[rng.integers(len(spots))]
+    if direction == 0:
+        board[row, col:col + size] = 1
+    else:
+        board[row:row + size, col] = 1
+
+
+class NumpyEnvironment:
+    """
+    Single-env NumPy counterpart of a game with the `gymnax` reset/step interface.
+
+    Keys are `np.random.Generator`s instead of JAX PRNG keys; when a key is
+    omitted the environment's own generator is used. Episodes auto-reset on `done`
+    like in `gymnax`. The random boards and decks follow the same distribution as
+    the JAX version but come from a different random stream.
+
+    Subclasses set `frame_shape` and implement `reset_env(rng)`,
+    `step_env(state, action) -> (state, reward, done)`, `get_obs(state)` and the
+    conversions `to_jax_state` and `from_jax_state`.
+    """
+
+    def __init__(self, jax_env, partial_obs: bool = False, seed: int = 0):
+        self.jax_env = jax_env
+        self.partial_obs = partial_obs
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def default_params(self):
+        return None
+
+    @property
+    def name(self) -> str:
+        return self.jax_env.name
+
+    @property
+    def num_actions(self) -> int:
+        return self.action_space().n
+
+    def action_space(self, params=None) -> spaces.Discrete:
+        return self.jax_env.action_space(params)
+
+    def observation_space(self, params=None) -> spaces.Box:
+        return spaces.Box(0.0, 1.0, self.frame_shape, dtype=jnp.float32)
+
+    def reset(self, key: Optional[np.random.Generator] = None, params=None) -> Tuple[np.ndarray, Any]:
+        state = self.reset_env(self.rng if key is None else key)
+        return self.get_obs(state), state
+
+    def step(self, key: Optional[np.random.Generator], state: Any, action: int, params=None):
+        state, reward, done = self.step_env(state, int(action))
+        if done:
+            # The terminal frame is never returned, so it is not rendered
+            obs, state = self.reset(key)
+        else:
+            obs = self.get_obs(state)
+        return obs, state, reward, done, {}
+
+
+class NumpyGridEnvironment(NumpyEnvironment):
+    """Grid game whose frames are composed by a `TileRenderer`."""
+
+    # Units of `state.score` per score drawn on the frame
+    score_unit = 1
+    # Number of states the JAX renderer draws at once while building the tiles
+    render_batch_size = 64
+
+    def __init__(self, jax_env, partial_obs: bool = False, seed: int = 0):
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+        self.board_size = jax_env.board_size
+        self.renderer = TileRenderer(
+            jax_env.render,
+            self.make_jax_state,
+            self.board_size * self.board_size,
+            self.num_marks,
+            self.max_score,
+            batch_size=self.render_batch_size,
+        )
+        # Renders the views where only the cursor cell shows its mark
+        self.partial_renderer = self.renderer
+        self.frame_shape = self.renderer.frame_shape
+
+    def get_obs(self, state: Any, params=None, key=None) -> np.ndarray:
+        cursor = state.action_x * self.board_size + state.action_y
+        marks = self.cell_marks(state)
+        renderer = self.renderer
+        if self.partial_view(state):
+            visible = np.zeros_like(marks)
+            visible[cursor] = marks[cursor]
+            marks = visible
+            renderer = self.partial_renderer
+        return renderer(cursor, marks, state.score // self.score_unit)
+
+    def _move(self, state: Any, action: int) -> Any:
+        x, y = state.action_x, state.action_y
+        if action == 0:
+            y = max(y - 1, 0)
+        elif action == 1:
+            y = min(y + 1, self.board_size - 1)
+        elif action == 2:
+            x = max(x - 1, 0)
+        elif action == 3:
+            x = min(x + 1, self.board_size - 1)
+        return dataclasses.replace(state, action_x=x, action_y=y, timestep=state.timestep + 1)
+
+
+@dataclasses.dataclass
+class BattleShipState:
+    action_x: int
+    action_y: int
+    board: np.ndarray
+    guesses: np.ndarray
+    hits: int
+    score: int
+    timestep: int
+
+
+class NumpyBattleShip(NumpyGridEnvironment):
+    """NumPy version of `popgym_arcade.environments.battleship.BattleShip`."""
+
+    def __init__(self, board_size: int, partial_obs: bool = False, seed: int = 0):
+        jax_env = battleship.BattleShip(board_size, partial_obs=partial_obs)
+        self.ship_sizes = jax_env.ship_sizes
+        self.needed_hits = jax_env.needed_hits
+        self.reward_hit = jax_env.reward_hit
+        self.reward_repeated_hit = jax_env.reward_repeated_hit
+        self.reward_miss = jax_env.reward_miss
+        self.max_episode_length = jax_env.max_episode_length
+        # 0: not guessed, 1: hit ship (X), 2: hit water (O)
+        self.num_marks = 3
+        self.max_score = self.needed_hits
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+
+    def make_jax_state(self, cursor: int, marks: np.ndarray, score: int) -> battleship.EnvState:
+        shape = (self.board_size, self.board_size)
+        return battleship.EnvState(
+            action_x=jnp.asarray(cursor // self.board_size, dtype=jnp.int32),
+            action_y=jnp.asarray(cursor % self.board_size, dtype=jnp.int32),
+            board=jnp.asarray((marks == 1).reshape(shape), dtype=jnp.float32),
+            guesses=jnp.asarray((marks > 0).reshape(shape), dtype=jnp.float32),
+            hits=jnp.asarray(0, dtype=jnp.int32),
+            score=jnp.asarray(score, dtype=jnp.int32),
+            timestep=jnp.asarray(1, dtype=jnp.int32),
+        )
+
+    def to_jax_state(self, state: BattleShipState) -> battleship.EnvState:
+        return battleship.EnvState(
+            action_x=jnp.asarray(state.action_x, dtype=jnp.int32),
+            action_y=jnp.asarray(state.action_y, dtype=jnp.int32),
+            board=jnp.asarray(state.board, dtype=jnp.float32),
+            guesses=jnp.asarray(state.guesses, dtype=jnp.float32),
+            hits=jnp.asarray(state.hits, dtype=jnp.int32),
+            score=jnp.asarray(state.score, dtype=jnp.int32),
+            timestep=jnp.asarray(state.timestep, dtype=jnp.int32),
+        )
+
+    def from_jax_state(self, state: battleship.EnvState) -> BattleShipState:
+        return BattleShipState(
+            action_x=int(state.action_x),
+            action_y=int(state.action_y),
+            board=np.asarray(state.board, dtype=np.float32),
+            guesses=np.asarray(state.guesses, dtype=np.float32),
+            hits=int(state.hits),
+            score=int(state.score),
+            timestep=int(state.timestep),
+        )
+
+    def cell_marks(self, state: BattleShipState) -> np.ndarray:
+        marks = np.where(state.board == 1, 1, 2) * (state.guesses == 1)
+        return marks.reshape(-1).astype(np.int32)
+
+    def partial_view(self, state: BattleShipState) -> bool:
+        return state.timestep == 0 or self.partial_obs
+
+    def reset_env(self, rng: np.random.Generator) -> BattleShipState:
+        board = np.zeros((self.board_size, self.board_size), dtype=np.float32)
+        for ship_size in self.ship_sizes:
+            _place_block(rng, board, ship_size)
+        return BattleShipState(
+            action_x=int(rng.integers(0, self.board_size - 1)),
+            action_y=int(rng.integers(0, self.board_size - 1)),
+            board=board,
+            guesses=np.zeros_like(board),
+            hits=0,
+            score=0,
+            timestep=0,
+        )
+
+    def step_env(self, state: BattleShipState, action: int) -> Tuple[BattleShipState, float, bool]:
+        if action != 4:
+            state = self._move(state, action)
+            return state, 0.0, state.timestep >= self.max_episode_length
+
+        x, y = state.action_x, state.action_y
+        is_ship = state.board[x, y] == 1
+        guessed_before = state.guesses[x, y] == 1
+        hit = is_ship and not guessed_before
+        guesses = state.guesses.copy()
+        guesses[x, y] = 1
+        if guessed_before:
+            reward = self.reward_repeated_hit
+        else:
+            reward = self.reward_hit if hit else self.reward_miss
+        state = dataclasses.replace(
+            state,
+            guesses=guesses,
+            hits=state.hits + int(hit),
+            score=state.score + int(reward > 0),
+            timestep=state.timestep + 1,
+        )
+        done = state.hits >= self.needed_hits or state.timestep >= self.max_episode_length
+        return state, reward, done
+
+
+@dataclasses.dataclass
+class MineSweeperState:
+    action_x: int
+    action_y: int
+    timestep: int
+    score: int
+    mine_grid: np.ndarray
+    neighbor_grid: np.ndarray
+
+
+class NumpyMineSweeper(NumpyGridEnvironment):
+    """NumPy version of `popgym_arcade.environments.minesweeper.MineSweeper`."""
+
+    def __init__(self, board_size: int, num_mines: int, partial_obs: bool = False, seed: int = 0):
+        jax_env = minesweeper.MineSweeper(board_size, num_mines=num_mines, partial_obs=partial_obs)
+        self.num_mines = num_mines
+        self.success_reward_scale = jax_env.success_reward_scale
+        self.fail_reward_scale = jax_env.fail_reward_scale
+        self.bad_action_reward_scale = jax_env.bad_action_reward_scale
+        self.max_episode_length = jax_env.max_episode_length
+        # 0: hidden, k + 1: revealed with k mines in the surrounding 3x3 block
+        self.num_marks = min(9, num_mines) + 2
+        self.max_score = board_size * board_size - num_mines
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+
+    def make_jax_state(self, cursor: int, marks: np.ndarray, score: int) -> minesweeper.EnvState:
+        shape = (self.board_size, self.board_size)
+        return minesweeper.EnvState(
+            action_x=jnp.asarray(cursor // self.board_size, dtype=jnp.int32),
+            action_y=jnp.asarray(cursor % self.board_size, dtype=jnp.int32),
+            timestep=jnp.asarray(1, dtype=jnp.int32),
+            score=jnp.asarray(score, dtype=jnp.int32),
+            mine_grid=jnp.asarray(np.where(marks > 0, 2, 0).reshape(shape), dtype=jnp.int8),
+            neighbor_grid=jnp.asarray(np.maximum(marks - 1, 0).reshape(shape), dtype=jnp.int8),
+        )
+
+    def to_jax_state(self, state: MineSweeperState) -> minesweeper.EnvState:
+        return minesweeper.EnvState(
+            action_x=jnp.asarray(state.action_x, dtype=jnp.int32),
+            action_y=jnp.asarray(state.action_y, dtype=jnp.int32),
+            timestep=jnp.asarray(state.timestep, dtype=jnp.int32),
+            score=jnp.asarray(state.score, dtype=jnp.int32),
+            mine_grid=jnp.asarray(state.mine_grid, dtype=jnp.int8),
+            neighbor_grid=jnp.asarray(state.neighbor_grid, dtype=jnp.int8),
+        )
+
+    def from_jax_state(self, state: minesweeper.EnvState) -> MineSweeperState:
+        return MineSweeperState(
+            action_x=int(state.action_x),
+            action_y=int(state.action_y),
+            timestep=int(state.timestep),
+            score=int(state.score),
+            mine_grid=np.asarray(state.mine_grid, dtype=np.int8),
+            neighbor_grid=np.asarray(state.neighbor_grid, dtype=np.int8),
+        )
+
+    def cell_marks(self, state: MineSweeperState) -> np.ndarray:
+        marks = np.where(state.mine_grid == 2, state.neighbor_grid.astype(np.int32) + 1, 0)
+        return marks.reshape(-1)
+
+    def partial_view(self, state: MineSweeperState) -> bool:
+        return state.timestep > 0 and self.partial_obs
+
+    def reset_env(self, rng: np.random.Generator) -> MineSweeperState:
+        n = self.board_size
+        mine_grid = np.zeros(n * n, dtype=np.int8)
+        mine_grid[rng.choice(n * n, self.num_mines, replace=False)] = 1
+        mine_grid = mine_grid.reshape(n, n)
+        padded = np.pad(mine_grid, 1)
+        neighbor_grid = sum(
+            padded[i:i + n, j:j + n] for i in range(3) for j in range(3)
+        ).astype(np.int8)
+        return MineSweeperState(
+            action_x=int(rng.integers(0, n - 1)),
+            action_y=int(rng.integers(0, n - 1)),
+            timestep=0,
+            score=0,
+            mine_grid=mine_grid,
+            neighbor_grid=neighbor_grid,
+        )
+
+    def step_env(self, state: MineSweeperState, action: int) -> Tuple[MineSweeperState, float, bool]:
+        if action != 4:
+            state = self._move(state, action)
+            return state, 0.0, state.timestep >= self.max_episode_length
+
+        x, y = state.action_x, state.action_y
+        mine = state.mine_grid[x, y] == 1
+        viewed = state.mine_grid[x, y] == 2
+        mine_grid = state.mine_grid.copy()
+        mine_grid[x, y] = 2
+        reward = self.success_reward_scale
+        if viewed:
+            reward = self.bad_action_reward_scale
+        if mine:
+            reward = self.fail_reward_scale
+        done = (
+            state.timestep >= self.max_episode_length
+            or mine
+            or np.sum(mine_grid == 2) == self.board_size ** 2 - self.num_mines
+        )
+        state = dataclasses.replace(
+            state,
+            score=state.score + int(reward > 0),
+            timestep=state.timestep + 1,
+            mine_grid=mine_grid,
+        )
+        return state, reward, bool(done)
+
+
+@dataclasses.dataclass
+class NavigatorState:
+    action_x: int
+    action_y: int
+    timestep: int
+    board: np.ndarray
+    score: int
+
+
+class NumpyNavigator(NumpyGridEnvironment):
+    """NumPy version of `popgym_arcade.environments.navigator.Navigator`."""
+
+    # The JAX version scores 100 per treasure
+    score_unit = 100
+    # A full board render holds one canvas per cell
+    render_batch_size = 4
+
+    def __init__(self, board_size: int, partial_obs: bool = False, seed: int = 0):
+        jax_env = navigator.Navigator(board_size, partial_obs=partial_obs)
+        self.barrier_sizes = jax_env.barrier_sizes
+        self.reward_step = jax_env.reward_step
+        self.reward_win = jax_env.reward_win
+        self.reward_die = jax_env.reward_die
+        self.max_episode_length = jax_env.max_steps_in_episode
+        # 0: empty, 1: TNT, 2: treasure
+        self.num_marks = 3
+        self.max_score = 1
+        # The JAX version draws the treasure coordinates with a fixed key, so
+        # they always come from the same indices of the free cells
+        num_free = board_size * board_size - sum(self.barrier_sizes)
+        key_x, key_y = jax.random.split(jax.random.PRNGKey(1))
+        self.treasure_index = (
+            int(jax.random.choice(key_x, jnp.arange(num_free))),
+            int(jax.random.choice(key_y, jnp.arange(num_free))),
+        )
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+        if partial_obs:
+            # The full board is the max of the canvases of every cell, which blends the
+            # marks with the background, while a partial view draws its cell directly
+            self.partial_renderer = TileRenderer(
+                jax_env.render,
+                lambda cursor, marks, score: self.make_jax_state(cursor, marks, score, timestep=1),
+                self.board_size * self.board_size,
+                self.num_marks,
+                self.max_score,
+                batch_size=self.render_batch_size,
+            )
+
+    def make_jax_state(self, cursor: int, marks: np.ndarray, score: int, timestep: int = 0) -> navigator.EnvState:
+        # The whole board is drawn on the first step, also with partial observations
+        return navigator.EnvState(
+            action_x=jnp.asarray(cursor // self.board_size, dtype=jnp.int32),
+            action_y=jnp.asarray(cursor % self.board_size, dtype=jnp.int32),
+            timestep=jnp.asarray(timestep, dtype=jnp.int32),
+            board=jnp.asarray(marks.reshape(self.board_size, self.board_size), dtype=jnp.float32),
+            score=jnp.asarray(score * self.score_unit, dtype=jnp.int32),
+        )
+
+    def to_jax_state(self, state: NavigatorState) -> navigator.EnvState:
+        return navigator.EnvState(
+            action_x=jnp.asarray(state.action_x, dtype=jnp.int32),
+            action_y=jnp.asarray(state.action_y, dtype=jnp.int32),
+            timestep=jnp.asarray(state.timestep, dtype=jnp.int32),
+            board=jnp.asarray(state.board, dtype=jnp.float32),
+            score=jnp.asarray(state.score, dtype=jnp.int32),
+        )
+
+    def from_jax_state(self, state: navigator.EnvState) -> NavigatorState:
+        return NavigatorState(
+            action_x=int(state.action_x),
+            action_y=int(state.action_y),
+            timestep=int(state.timestep),
+            board=np.asarray(state.board, dtype=np.float32),
+            score=int(state.score),
+        )
+
+    def cell_marks(self, state: NavigatorState) -> np.ndarray:
+        return state.board.reshape(-1).astype(np.int32)
+
+    def partial_view(self, state: NavigatorState) -> bool:
+        return state.timestep > 0 and self.partial_obs
+
+    def reset_env(self, rng: np.random.Generator) -> NavigatorState:
+        board = np.zeros((self.board_size, self.board_size), dtype=np.float32)
+        for barrier_size in self.barrier_sizes:
+            _place_block(rng, board, barrier_size)
+        rows, cols = np.nonzero(board == 0)
+        board[rows[self.treasure_index[0]], cols[self.treasure_index[1]]] = 2
+        return NavigatorState(
+            action_x=int(rows[rng.integers(len(rows))]),
+            action_y=int(cols[rng.integers(len(cols))]),
+            timestep=0,
+            board=board,
+            score=0,
+        )
+
+    def step_env(self, state: NavigatorState, action: int) -> Tuple[NavigatorState, float, bool]:
+        if action != 4:
+            state = self._move(state, action)
+            terminated = state.board[state.action_x, state.action_y] == 1
+            reward = -self.reward_die if terminated else -self.reward_step
+        else:
+            terminated = state.board[state.action_x, state.action_y] == 2
+            state = dataclasses.replace(state, timestep=state.timestep + 1)
+            reward = self.reward_win if terminated else -self.reward_step
+        truncated = state.timestep >= self.max_episode_length
+        if truncated:
+            reward = 0.0
+        state = dataclasses.replace(state, score=state.score + self.score_unit * int(reward > 0))
+        return state, reward, bool(terminated or truncated)
+
+
+class NumpyCardEnvironment(NumpyEnvironment):
+    """
+    Card game whose frames are painted from sprites of the JAX renderer.
+
+    The JAX renderer fills a large and a small canvas, pastes the small one in
+    the middle of the large one and draws every element with `jnp.where` over
+    the canvas. Each element is a sprite here: the card templates are compared
+    with the blank canvas they were drawn on, and the numbers and the name are
+    drawn once per value at construction. `get_obs` paints the sprites of
+    `large_sprites(state)` and `small_sprites(state)` in the same order as the
+    JAX renderer, so elements that overlap end up the same.
+    """
+
+    def __init__(self, jax_env, partial_obs: bool = False, seed: int = 0):
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+        self.large_canvas = np.asarray(jax_env.large_canva, dtype=np.float32)
+        self.small_canvas = np.asarray(jax_env.small_canva, dtype=np.float32)
+        self.frame_shape = self.large_canvas.shape
+        margin_x, margin_y = [(l - s) // 2 for l, s in zip(self.large_canvas.shape[:2], self.small_canvas.shape[:2])]
+        self.small_slice = (
+            slice(margin_x, self.frame_shape[0] - margin_x),
+            slice(margin_y, self.frame_shape[1] - margin_y),
+        )
+
+    def _template_sprites(self, templates: Any, canvas: np.ndarray) -> List[Sprite]:
+        return _sprites(np.asarray(templates, dtype=np.float32), canvas)
+
+    def _number_sprites(self, pos, color, values: Sequence[int]) -> List[Sprite]:
+        return _draw_sprites(
+            lambda value, canvas: draw_number(pos["top_left"], pos["bottom_right"], color, canvas, value),
+            values,
+            self.frame_shape,
+        )
+
+    def _name_sprite(self, pos, color) -> Sprite:
+        # draw_str adds the letters to the canvas instead of replacing its pixels,
+        # so the name is drawn on the blank canvas it covers in the JAX renderer
+        draw = jax.jit(lambda canvas: draw_str(pos["top_left"], pos["bottom_right"], color, canvas, self.name))
+        return _sprites(np.asarray(draw(self.large_canvas))[None], self.large_canvas)[0]
+
+    def get_obs(self, state: Any, params=None, key=None) -> np.ndarray:
+        large = self.large_canvas.reshape(-1, 3).copy()
+        for pixels, colors in self.large_sprites(state):
+            large[pixels] = colors
+        small = self.small_canvas.reshape(-1, 3).copy()
+        if not self.partial_obs:
+            for pixels, colors in self.small_sprites(state):
+                small[pixels] = colors
+        frame = large.reshape(self.frame_shape)
+        frame[self.small_slice] = small.reshape(self.small_canvas.shape)
+        return frame
+
+
+@dataclasses.dataclass
+class CountRecallState:
+    timestep: int
+    value_cards: np.ndarray
+    query_cards: np.ndarray
+    running_count: np.ndarray
+    history: np.ndarray
+    default_action: int
+    num_types: int
+    score: int
+    alreadyMove: int
+
+
+class NumpyCountRecall(NumpyCardEnvironment):
+    """NumPy version of `popgym_arcade.environments.countrecall.CountRecall`."""
+
+    def __init__(self, num_decks: int, num_types: int, partial_obs: bool = False, seed: int = 0):
+        jax_env = countrecall.CountRecall(num_decks=num_decks, num_types=num_types, partial_obs=partial_obs)
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+        self.num_types = num_types
+        self.num_cards = jax_env.num_cards
+        self.reward_scale = jax_env.reward_scale
+        self.max_episode_length = jax_env.max_steps_in_episode
+        color = jax_env.color
+        self.value_sprites = self._template_sprites(jax_env.value_templates, self.large_canvas)
+        self.query_sprites = self._template_sprites(jax_env.query_templates, self.large_canvas)
+        # history_sprites[card][i] is the card on the i-th history position
+        self.history_sprites = [
+            self._template_sprites(templates, self.small_canvas) for templates in jax_env.history_templates
+        ]
+        self.score_sprites = self._number_sprites(jax_env.score_pos, color["dark_red"], range(self.num_cards + 1))
+        # The selected count moves by one per step and is never reset within an episode
+        self.action_sprites = self._number_sprites(
+            jax_env.action_pos["action"],
+            color["soft_green"],
+            range(-self.max_episode_length, self.max_episode_length + 1),
+        )
+        self.name_sprite = self._name_sprite(jax_env.name_pos, color["bright_blue"])
+
+    def to_jax_state(self, state: CountRecallState) -> countrecall.EnvState:
+        return countrecall.EnvState(
+            timestep=jnp.asarray(state.timestep, dtype=jnp.int32),
+            value_cards=jnp.asarray(state.value_cards, dtype=jnp.int32),
+            query_cards=jnp.asarray(state.query_cards, dtype=jnp.int32),
+            running_count=jnp.asarray(state.running_count, dtype=jnp.float32),
+            history=jnp.asarray(state.history, dtype=jnp.float32),
+            default_action=jnp.asarray(state.default_action, dtype=jnp.int32),
+            num_types=jnp.asarray(state.num_types, dtype=jnp.int32),
+            score=jnp.asarray(state.score, dtype=jnp.int32),
+            alreadyMove=jnp.asarray(state.alreadyMove, dtype=jnp.int32),
+        )
+
+    def from_jax_state(self, state: countrecall.EnvState) -> CountRecallState:
+        return CountRecallState(
+            timestep=int(state.timestep),
+            value_cards=np.asarray(state.value_cards, dtype=np.int32),
+            query_cards=np.asarray(state.query_cards, dtype=np.int32),
+            running_count=np.asarray(state.running_count, dtype=np.float32),
+            history=np.asarray(state.history, dtype=np.float32),
+            default_action=int(state.default_action),
+            num_types=int(state.num_types),
+            score=int(state.score),
+            alreadyMove=int(state.alreadyMove),
+        )
+
+    def large_sprites(self, state: CountRecallState) -> List[Sprite]:
+        sprites = []
+        if state.timestep < self.num_cards:
+            sprites.append(self.value_sprites[state.value_cards[state.timestep]])
+            sprites.append(self.query_sprites[state.query_cards[state.timestep]])
+        return sprites + [
+            self.score_sprites[state.score],
+            self.action_sprites[state.default_action + self.max_episode_length],
+            self.name_sprite,
+        ]
+
+    def small_sprites(self, state: CountRecallState) -> List[Sprite]:
+        return [self.history_sprites[int(state.history[i])][i] for i in range(state.timestep)]
+
+    def reset_env(self, rng: np.random.Generator) -> CountRecallState:
+        cards = np.arange(self.num_cards, dtype=np.int32) % self.num_types
+        return CountRecallState(
+            timestep=0,
+            value_cards=rng.permutation(cards),
+            query_cards=rng.permutation(cards),
+            running_count=np.zeros(self.num_types, dtype=np.float32),
+            history=np.zeros(self.num_cards, dtype=np.float32),
+            default_action=0,
+            num_types=self.num_types,
+            score=0,
+            alreadyMove=0,
+        )
+
+    def step_env(self, state: CountRecallState, action: int) -> Tuple[CountRecallState, float, bool]:
+        default_action = state.default_action + int(action == 0) - int(action == 1)
+        fire = action == 4
+        t = state.timestep
+        reward = 0.0
+        running_count, history = state.running_count, state.history
+        if fire:
+            if default_action == running_count[state.query_cards[t]]:
+                reward = self.reward_scale
+            running_count = running_count.copy()
+            running_count[state.value_cards[t]] += 1
+            history = history.copy()
+            history[t] = state.value_cards[t]
+        state = dataclasses.replace(
+            state,
+            timestep=t + int(fire),
+            running_count=running_count,
+            history=history,
+            default_action=default_action,
+            score=state.score + int(reward > 0),
+            alreadyMove=state.alreadyMove + 1,
+        )
+        done = state.timestep == self.num_cards or state.alreadyMove >= self.max_episode_length
+        return state, reward, done
+
+
+@dataclasses.dataclass
+class AutoEncodeState:
+    timestep: int
+    cards: np.ndarray
+    score: int
+    count: int
+    default_action: int
+
+
+class NumpyAutoEncode(NumpyCardEnvironment):
+    """NumPy version of `popgym_arcade.environments.autoencode.AutoEncode`."""
+
+    def __init__(self, num_decks: int, partial_obs: bool = False, seed: int = 0):
+        jax_env = autoencode.AutoEncode(num_decks=num_decks, partial_obs=partial_obs)
+        super().__init__(jax_env, partial_obs=partial_obs, seed=seed)
+        self.num_suits = jax_env.num_suits
+        self.num_cards = jax_env.decksize * jax_env.num_decks
+        self.max_episode_length = jax_env.max_steps_in_episode
+        color = jax_env.color
+        self.value_sprites = self._template_sprites(jax_env.value_card_templates, self.large_canvas)
+        # history_sprites[card][i] is the card on the i-th history position
+        self.history_sprites = [
+            self._template_sprites(jax_env.history_card_templates[:, card], self.small_canvas)
+            for card in range(self.num_suits)
+        ]
+        suits = [
+            (draw_heart, color["red"]),
+            (draw_spade, color["black"]),
+            (draw_club, color["black"]),
+            (draw_diamond, color["red"]),
+        ]
+        pos = jax_env.current_suit_pos
+        self.action_sprites = _draw_sprites(
+            lambda suit, canvas: lax.switch(
+                suit,
+                [lambda c, draw=draw, clr=clr: draw(pos["top_left"], pos["bottom_right"], clr, c) for draw, clr in suits],
+                canvas,
+            ),
+            range(self.num_suits),
+            self.frame_shape,
+        )
+        # The last card can be scored once more in the step that ends the episode
+        self.score_sprites = self._number_sprites(jax_env.score, color["bright_red"], range(self.num_cards + 2))
+        self.name_sprite = self._name_sprite(jax_env.name_pos, color["neon_pink"])
+
+    def to_jax_state(self, state: AutoEncodeState) -> autoencode.EnvState:
+        return autoencode.EnvState(
+            timestep=jnp.asarray(state.timestep, dtype=jnp.int32),
+            cards=jnp.asarray(state.cards, dtype=jnp.int32),
+            score=jnp.asarray(state.score, dtype=jnp.int32),
+            count=jnp.asarray(state.count, dtype=jnp.int32),
+            default_action=jnp.asarray(state.default_action, dtype=jnp.int32),
+        )
+
+    def from_jax_state(self, state: autoencode.EnvState) -> AutoEncodeState:
+        return AutoEncodeState(
+            timestep=int(state.timestep),
+            cards=np.asarray(state.cards, dtype=np.int32),
+            score=int(state.score),
+            count=int(state.count),
+            default_action=int(state.default_action),
+        )
+
+    def large_sprites(self, state: AutoEncodeState) -> List[Sprite]:
+        sprites = []
+        if state.timestep < self.num_cards:
+            sprites.append(self.value_sprites[state.cards[state.timestep]])
+        return sprites + [
+            self.action_sprites[state.default_action],
+            self.score_sprites[state.score],
+            self.name_sprite,
+        ]
+
+    def small_sprites(self, state: AutoEncodeState) -> List[Sprite]:
+        return [self.history_sprites[state.cards[i]][i] for i in range(min(state.timestep, self.num_cards))]
+
+    def reset_env(self, rng: np.random.Generator) -> AutoEncodeState:
+        cards = np.arange(self.num_cards, dtype=np.int32) % self.num_suits
+        return AutoEncodeState(timestep=0, cards=rng.permutation(cards), score=0, count=0, default_action=0)
+
+    def step_env(self, state: AutoEncodeState, action: int) -> Tuple[AutoEncodeState, float, bool]:
+        default_action = (state.default_action + int(action == 2) - int(action == 3)) % self.num_suits
+        # Every card of the watch stage and the first of the play stage are played regardless of the action
+        fire = action == 4 or state.timestep <= self.num_cards
+        play = state.timestep >= self.num_cards
+        done = state.count >= self.num_cards or state.timestep >= self.max_episode_length
+        reward = 0.0
+        # Past the last card, the JAX version clamps the index to the first card
+        expected = state.cards[self.num_cards - 1 - min(state.count, self.num_cards - 1)]
+        if fire and play and expected == default_action:
+            reward = 1.0 / self.num_cards
+        state = dataclasses.replace(
+            state,
+            timestep=state.timestep + 1,
+            score=state.score + int(reward > 0),
+            count=state.count + int(fire and play),
+            default_action=default_action,
+        )
+        return state, reward, done
+
+
+NUMPY_ENVIRONMENTS = {
+    "BattleShipEasy": lambda **kwargs: NumpyBattleShip(board_size=8, **kwargs),
+    "BattleShipMedium": lambda **kwargs: NumpyBattleShip(board_size=10, **kwargs),
+    "BattleShipHard": lambda **kwargs: NumpyBattleShip(board_size=12, **kwargs),
+    "MineSweeperEasy": lambda **kwargs: NumpyMineSweeper(board_size=4, num_mines=2, **kwargs),
+    "MineSweeperMedium": lambda **kwargs: NumpyMineSweeper(board_size=6, num_mines=6, **kwargs),
+    "MineSweeperHard": lambda **kwargs: NumpyMineSweeper(board_size=8, num_mines=10, **kwargs),
+    "NavigatorEasy": lambda **kwargs: NumpyNavigator(board_size=8, **kwargs),
+    "NavigatorMedium": lambda **kwargs: NumpyNavigator(board_size=10, **kwargs),
+    "NavigatorHard": lambda **kwargs: NumpyNavigator(board_size=12, **kwargs),
+    "CountRecallEasy": lambda **kwargs: NumpyCountRecall(num_decks=1, num_types=2, **kwargs),
+    "CountRecallMedium": lambda **kwargs: NumpyCountRecall(num_decks=2, num_types=2, **kwargs),
+    "CountRecallHard": lambda **kwargs: NumpyCountRecall(num_decks=3, num_types=4, **kwargs),
+    "AutoEncodeEasy": lambda **kwargs: NumpyAutoEncode(num_decks=1, **kwargs),
+    "AutoEncodeMedium": lambda **kwargs: NumpyAutoEncode(num_decks=2, **kwargs),
+    "AutoEncodeHard": lambda **kwargs: NumpyAutoEncode(num_decks=3, **kwargs),
+}
+
+
+# Games without a NumPy backend. CartPole rasterizes the rotated pole from its
+# continuous angle every frame, so its frames cannot be composed from a finite
+# set of pre-rendered tiles or sprites
+UNSUPPORTED_GAMES = ("CartPole",)
+
+
+def make_numpy(env_id: str, **env_kwargs):
+    if env_id not in NUMPY_ENVIRONMENTS:
+        raise ValueError(
+            f"{env_id} has no NumPy backend, available: {', '.join(NUMPY_ENVIRONMENTS)}. "
+            f"{', '.join(UNSUPPORTED_GAMES)} are only available with the JAX backend"
+        )
+    env = NUMPY_ENVIRONMENTS[env_id](**env_kwargs)
+    return env, env.default_params
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+from typing import Callable, Iterable, Optional, Tuple
+
+import jax
+import jax.numpy as jnp
+from jax import export
+
+import popgym_arcade
+from popgym_arcade import environments
+from popgym_arcade.registration import REGISTERED_ENVIRONMENTS
+from popgym_arcade.wrappers import LogEnvState
+
+
+_REGISTERED_STATE_TYPES = set()
+
+
+def _register_state_serialization(cls) -> None:
+    """Teach `jax.export` how to (de)serialize a `struct.dataclass` env state."""
+    if cls in _REGISTERED_STATE_TYPES:
+        return
+    export.register_pytree_node_serialization(
+        cls,
+        serialized_name=f"{cls.__module__}.{cls.__qualname__}",
+        serialize_auxdata=lambda aux: json.dumps(list(aux)).encode("utf-8"),
+        deserialize_auxdata=lambda data: tuple(json.loads(data.decode("utf-8"))),
+    )
+    _REGISTERED_STATE_TYPES.add(cls)
+
+
+def _register_all_state_types() -> None:
+    modules = (
+        environments.cartpole,
+        environments.countrecall,
+        environments.battleship,
+        environments.minesweeper,
+        environments.autoencode,
+        environments.navigator,
+    )
+    for module in modules:
+        _register_state_serialization(module.EnvState)
+    _register_state_serialization(LogEnvState)
+
+
+_register_all_state_types()
+
+
+def _as_spec(x) -> jax.ShapeDtypeStruct:
+    # Drop weak types so that concrete arrays produced by the exported reset
+    # are accepted by the exported step.
+    return jax.ShapeDtypeStruct(x.shape, x.dtype)
+
+
+def _key_spec(num_envs: int) -> jax.ShapeDtypeStruct:
+    # Raw uint32 keys, as produced by `jax.random.PRNGKey` and `jax.random.split`
+    return jax.ShapeDtypeStruct((num_envs, 2), jnp.uint32)
+
+
+def export_env(
+        env_id: str,
+        num_envs: int,
+        partial_obs: bool = False,
+        platforms: Optional[Tuple[str, ...]] = None,
+) -> Tuple[export.Exported, export.Exported]:
+    """
+    Lower the vmapped `reset` and `step` of a registered environment ahead of time.
+
+    The default environment parameters are baked into the exported functions, so
+    the signatures are `reset(keys)` and `step(keys, state, actions)` where `keys`
+    is a `(num_envs, 2)` uint32 array of raw PRNG keys.
+
+    Args:
+        env_id: Registered environment name, e.g. "BattleShipEasy".
+        num_envs: Batch size the functions are lowered for.
+        partial_obs: Whether to export the POMDP variant.
+        platforms: Platforms to lower for, e.g. ("cpu", "cuda"). Defaults to the
+            platform of the default JAX backend.
+
+    Returns:
+        The exported `reset` and `step` functions.
+    """
+    env, env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+
+    def reset(keys):
+        return jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+
+    def step(keys, state, actions):
+        return jax.vmap(env.step, in_axes=(0, 0, 0, None))(keys, state, actions, env_params)
+
+    key_spec = _key_spec(num_envs)
+    _, state_shape = jax.eval_shape(reset, key_spec)
+    state_spec = jax.tree.map(_as_spec, state_shape)
+    action_spec = jax.ShapeDtypeStruct((num_envs,), jnp.int32)
+
+    exported_reset = export.export(jax.jit(reset), platforms=platforms)(key_spec)
+    exported_step = export.export(jax.jit(step), platforms=platforms)(
+        key_spec, state_spec, action_spec
+    )
+    return exported_reset, exported_step
+
+
+def _artifact_name(env_id: str, num_envs: int, partial_obs: bool, fn_name: str) -> str:
+    return f"{env_id}_Partial={partial_obs}_N={num_envs}_{fn_name}.jax"
+
+
+def save_kernels(
+        directory: str,
+        env_ids: Iterable[str] = REGISTERED_ENVIRONMENTS,
+        batch_sizes: Iterable[int] = (1, 16, 256),
+        partial_obs: Iterable[bool] = (False, True),
+        platforms: Optional[Tuple[str, ...]] = None,
+) -> dict:
+    """
+    Export and serialize `reset`/`step` for every env, batch size and obs setting.
+
+    A `manifest.json` listing every artifact is written next to the kernels.
+
+    Args:
+        directory: Output directory, created if it does not exist.
+        env_ids: Environments to export.
+        batch_sizes: Batch sizes to lower each environment for.
+        partial_obs: Observability settings to export.
+        platforms: Platforms to lower for, see `export_env`.
+
+    Returns:
+        The manifest as a dictionary.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"jax_version": jax.__version__, "kernels": []}
+    for env_id in env_ids:
+        for partial in partial_obs:
+            for num_envs in batch_sizes:
+                exported_reset, exported_step = export_env(
+                    env_id, num_envs, partial_obs=partial, platforms=platforms
+                )
+                entry = {
+                    "env_id": env_id,
+                    "partial_obs": partial,
+                    "num_envs": num_envs,
+                    "platforms": list(exported_reset.platforms),
+                }
+                for fn_name, exported in (("reset", exported_reset), ("step", exported_step)):
+                    file_name = _artifact_name(env_id, num_envs, partial, fn_name)
+                    with open(os.path.join(directory, file_name), "wb") as f:
+                        f.write(exported.serialize())
+                    entry[fn_name] = file_name
+                manifest["kernels"].append(entry)
+                print(f"Exported {env_id} (partial_obs={partial}, num_envs={num_envs})")
+
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_kernels(
+        directory: str,
+        env_id: str,
+        num_envs: int,
+        partial_obs: bool = False,
+) -> Tuple[Callable, Callable]:
+    """
+    Rehydrate serialized `reset`/`step` kernels without tracing any Python env code.
+
+    Args:
+        directory: Directory written by `save_kernels`.
+        env_id: Registered environment name.
+        num_envs: Batch size the kernels were exported for.
+        partial_obs: Observability setting the kernels were exported for.
+
+    Returns:
+        `reset(keys)` and `step(keys, state, actions)` callables.
+    """
+    fns = []
+    for fn_name in ("reset", "step"):
+        path = os.path.join(directory, _artifact_name(env_id, num_envs, partial_obs, fn_name))
+        if not os.path.exists(path):
+            raise ValueError(
+                f"No exported {fn_name} kernel for {env_id} "
+                f"(partial_obs={partial_obs}, num_envs={num_envs}) in {directory}"
+            )
+        with open(path, "rb") as f:
+            exported = export.deserialize(bytearray(f.read()))
+        fns.append(jax.jit(exported.call))
+    return fns[0], fns[1]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Export popgym_arcade env kernels")
+    parser.add_argument('--OUT_DIR',
+                        type=str,
+                        default='exported_kernels',
+                        help='Output directory')
+    parser.add_argument('--ENV_NAMES',
+                        type=str,
+                        nargs='+',
+                        default=REGISTERED_ENVIRONMENTS,
+                        help='Environments to export')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        nargs='+',
+                        default=[1, 16, 256],
+                        help='Batch sizes to export')
+    parser.add_argument('--PLATFORMS',
+                        type=str,
+                        nargs='+',
+                        default=None,
+                        help='Platforms to lower for, e.g. cpu cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    platforms = tuple(args.PLATFORMS) if args.PLATFORMS else None
+    save_kernels(args.OUT_DIR, args.ENV_NAMES, args.NUM_ENVS, platforms=platforms)
+
+
+if __name__ == '__main__':
+    main()
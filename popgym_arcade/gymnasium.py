@@ -0,0 +1,127 @@
+from functools import partial
+from typing import Any, Dict, Optional, Tuple
+
+import chex
+import gymnasium as gym
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnasium.vector.utils import batch_space
+
+import popgym_arcade
+from popgym_arcade.registration import REGISTERED_ENVIRONMENTS
+from popgym_arcade.vector import to_numpy
+
+
+class VectorEnv(gym.vector.VectorEnv):
+    """
+    Gymnasium vector API over the vmapped, jitted popgym_arcade `reset`/`step`.
+
+    Environments auto-reset on device within the same step, so the returned
+    observation of a finished env is already the first observation of its next
+    episode. As in `gymnasium.vector.SyncVectorEnv`, the terminal observation
+    and info of finished envs are returned as `final_obs` and `final_info` in
+    the infos, masked by `_final_obs` and `_final_info`. Observations are handed to NumPy through DLPack, which avoids a host
+    copy when JAX runs on the CPU. Episode time limits are part of the game
+    dynamics and are reported as terminations.
+
+    Args:
+        env_id: Registered environment name.
+        num_envs: Number of environments.
+        partial_obs: Whether to use the POMDP variant.
+        seed: Default random seed, used when `reset` is called without one.
+    """
+
+    metadata = {"autoreset_mode": gym.vector.AutoresetMode.SAME_STEP, "render_modes": []}
+
+    def __init__(self, env_id: str, num_envs: int, partial_obs: bool = False, seed: int = 0):
+        self.env, self.env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+        self.num_envs = num_envs
+        self.seed = seed
+
+        # Take the shape from a traced reset, not every game reports its frame shape
+        obs_shape, _ = jax.eval_shape(self.env.reset, jax.random.PRNGKey(0), self.env_params)
+        self.single_observation_space = gym.spaces.Box(
+            low=0.0, high=1.0, shape=obs_shape.shape, dtype=np.float32
+        )
+        self.single_action_space = gym.spaces.Discrete(self.env.num_actions)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self._key = None
+        self._state = None
+
+    @partial(jax.jit, static_argnums=(0,))
+    def _reset(self, key: chex.PRNGKey):
+        key, key_reset = jax.random.split(key)
+        obs, state = jax.vmap(self.env.reset, in_axes=(0, None))(
+            jax.random.split(key_reset, self.num_envs), self.env_params
+        )
+        return key, state, obs
+
+    def _env_step(self, key: chex.PRNGKey, state: Any, action: chex.Array):
+        # Same as `env.step`, but also returns the terminal observation the auto-reset replaces
+        key_step, key_reset = jax.random.split(key)
+        final_obs, state_st, reward, done, info = self.env.step_env(key_step, state, action, self.env_params)
+        obs_re, state_re = self.env.reset_env(key_reset, self.env_params)
+        state = jax.tree.map(lambda x, y: jax.lax.select(done, x, y), state_re, state_st)
+        obs = jax.lax.select(done, obs_re, final_obs)
+        return obs, state, reward, done, info, final_obs
+
+    @partial(jax.jit, static_argnums=(0,), donate_argnums=(2,))
+    def _step(self, key: chex.PRNGKey, state: Any, actions: chex.Array):
+        key, key_step = jax.random.split(key)
+        obs, state, reward, done, info, final_obs = jax.vmap(self._env_step)(
+            jax.random.split(key_step, self.num_envs), state, actions
+        )
+        return key, state, (obs, reward, done, info, final_obs)
+
+    def reset(
+            self,
+            *,
+            seed: Optional[int] = None,
+            options: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        if seed is None:
+            seed = self.seed if self._key is None else None
+        key = jax.random.PRNGKey(seed) if seed is not None else self._key
+        self._key, self._state, obs = self._reset(key)
+        return to_numpy(obs), {}
+
+    def step(self, actions: np.ndarray):
+        if self._state is None:
+            raise RuntimeError("Call reset before step")
+        self._key, self._state, (obs, reward, done, info, final_obs) = self._step(
+            self._key, self._state, jnp.asarray(actions, dtype=jnp.int32)
+        )
+        done = to_numpy(done)
+        infos = jax.tree.map(to_numpy, info)
+        if done.any():
+            final_info = {**infos, **{f"_{k}": done for k in infos}}
+            final_obs = to_numpy(final_obs)
+            infos["final_obs"] = np.full(self.num_envs, None, dtype=object)
+            for i in np.flatnonzero(done):
+                infos["final_obs"][i] = final_obs[i]
+            infos["_final_obs"] = done
+            infos["final_info"] = final_info
+            infos["_final_info"] = done
+        return (
+            to_numpy(obs),
+            to_numpy(reward),
+            done,
+            np.zeros_like(done),
+            infos,
+        )
+
+
+def register_envs() -> None:
+    """Register every game as `popgym_arcade/<name>` for `gymnasium.make_vec`."""
+    for env_id in REGISTERED_ENVIRONMENTS:
+        gym_id = f"popgym_arcade/{env_id}"
+        if gym_id in gym.registry:
+            continue
+        gym.register(
+            id=gym_id,
+            vector_entry_point="popgym_arcade.gymnasium:VectorEnv",
+            kwargs={"env_id": env_id},
+        )
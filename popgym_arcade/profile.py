@@ -0,0 +1,237 @@
+"""
+Compiled memory and HLO cost report for an environment.
+
+Lowers the batched `reset` and auto-resetting `step` of an environment, and
+reports the memory and cost estimates of the compiled executables. The step
+is traced under the named scopes `dynamics`, `render` and `auto_reset`, so the
+heaviest HLO ops can be traced back to the part of the environment they come
+from, e.g. the render of the observation that auto-reset throws away.
+
+    python -m popgym_arcade.profile --ENV_NAME MineSweeperEasy --NUM_ENVS 512
+
+"""
+import argparse
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+import jax
+import jax.numpy as jnp
+
+import popgym_arcade
+
+
+_DTYPE_BYTES = {
+    "pred": 1, "s8": 1, "u8": 1, "s16": 2, "u16": 2, "f16": 2, "bf16": 2,
+    "s32": 4, "u32": 4, "f32": 4, "s64": 8, "u64": 8, "f64": 8, "c64": 8, "c128": 16,
+}
+_INSTRUCTION = re.compile(r"^\s*(?:ROOT\s+)?%?(?P<name>[^\s=]+)\s*=\s*(?P<shape>\(.*?\)|\S+)\s+(?P<opcode>[\w\-]+)\(")
+_ARRAY_SHAPE = re.compile(r"\b(" + "|".join(_DTYPE_BYTES) + r")\[([\d,]*)\]")
+_OP_NAME = re.compile(r'op_name="([^"]*)"')
+# Computation headers look like `%name (args) -> shape {` or `ENTRY %name ... {`
+_COMPUTATION = re.compile(r"^(?:ENTRY\s+)?%?(?P<name>[\w.\-]+)\s.*\{\s*$")
+
+
+def _shape_bytes(shape: str) -> int:
+    return sum(
+        _DTYPE_BYTES[dtype] * math.prod(int(d) for d in dims.split(",") if d)
+        for dtype, dims in _ARRAY_SHAPE.findall(shape)
+    )
+
+
+def _scope(op_name: str) -> str:
+    parts = re.split(r"[/()]", op_name)
+    if "auto_reset" in parts:
+        return "auto_reset/render" if "render" in parts else "auto_reset"
+    for scope in ("render", "dynamics"):
+        if scope in parts:
+            return scope
+    return "other"
+
+
+def hlo_ops(hlo_text: str) -> List[Dict[str, Any]]:
+    """
+    Parse the executed instructions of an optimized HLO module.
+
+    Instructions inside fused computations are skipped since they run as part of
+    their fusion. The cost of an instruction is the size of its output in bytes,
+    which is the memory traffic it causes for the elementwise and gather heavy
+    ops that dominate rendering.
+
+    Returns:
+        One entry per instruction with its name, opcode, output shape, output bytes,
+        JAX op name and scope.
+    """
+    ops = []
+    computation = None
+    for line in hlo_text.splitlines():
+        header = _COMPUTATION.match(line)
+        if header is not None and "=" not in line.split("{")[0]:
+            computation = header.group("name")
+            continue
+        if line.strip() == "}":
+            computation = None
+            continue
+        instruction = _INSTRUCTION.match(line)
+        if instruction is None or computation is None or computation.startswith("fused"):
+            continue
+        if instruction.group("opcode") in ("parameter", "constant", "get-tuple-element", "tuple", "bitcast"):
+            continue
+        op_name = _OP_NAME.search(line)
+        op_name = op_name.group(1) if op_name is not None else ""
+        ops.append({
+            "name": instruction.group("name"),
+            "opcode": instruction.group("opcode"),
+            "shape": instruction.group("shape"),
+            "bytes": _shape_bytes(instruction.group("shape")),
+            "op_name": op_name,
+            "scope": _scope(op_name),
+        })
+    return ops
+
+
+def _analyze(fn, *args, top_k: int = 10) -> Dict[str, Any]:
+    compiled = jax.jit(fn).lower(*args).compile()
+    memory = compiled.memory_analysis()
+    analysis = compiled.cost_analysis()
+    # Older jax versions return one dict per device
+    if isinstance(analysis, (list, tuple)):
+        analysis = analysis[0] if analysis else {}
+    analysis = analysis or {}
+    ops = hlo_ops(compiled.as_text())
+    scopes = {}
+    for op in ops:
+        scopes[op["scope"]] = scopes.get(op["scope"], 0) + op["bytes"]
+    result = {
+        name: getattr(memory, name, None) if memory is not None else None
+        for name in ("temp_size_in_bytes", "argument_size_in_bytes", "output_size_in_bytes")
+    }
+    result.update({
+        "flops": analysis.get("flops"),
+        "bytes_accessed": analysis.get("bytes accessed"),
+        "scope_bytes": dict(sorted(scopes.items(), key=lambda item: -item[1])),
+        "top_ops": sorted(ops, key=lambda op: -op["bytes"])[:top_k],
+    })
+    return result
+
+
+def make_profiled_step(env, env_params):
+    """
+    Batched auto-resetting step, equivalent to `vmap(env.step)` but traced under named scopes.
+
+    The observation of the reset state is rendered on every step and discarded
+    unless the episode is done, which shows up under `auto_reset/render`.
+    """
+
+    def step(key, state, action):
+        key, key_reset = jax.random.split(key)
+        with jax.named_scope("dynamics"):
+            obs_st, state_st, reward, done, info = env.step_env(key, state, action, env_params)
+        with jax.named_scope("auto_reset"):
+            obs_re, state_re = env.reset_env(key_reset, env_params)
+            state = jax.tree.map(lambda x, y: jax.lax.select(done, x, y), state_re, state_st)
+            obs = jax.lax.select(done, obs_re, obs_st)
+        return obs, state, reward, done, info
+
+    return jax.vmap(step)
+
+
+def report(
+        env_id: str,
+        num_envs: int,
+        partial_obs: bool = False,
+        top_k: int = 10,
+        verbose: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compile the batched reset and step of an environment and report their costs.
+
+    Args:
+        env_id: Registered environment name.
+        num_envs: Number of parallel environments.
+        partial_obs: Whether to use the POMDP variant.
+        top_k: Number of HLO ops to list per function.
+        verbose: Print the report.
+
+    Returns:
+        For `reset` and `step`, the temp, argument and output sizes from
+        `memory_analysis()` in bytes, the FLOPs and bytes accessed from the HLO cost
+        model (`None` where the backend does not report them), the output bytes per
+        named scope and the `top_k` HLO ops by output bytes.
+    """
+    env, env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+    keys = jax.random.split(jax.random.PRNGKey(0), num_envs)
+
+    def reset(keys):
+        with jax.named_scope("reset"):
+            return jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+
+    _, state = jax.eval_shape(reset, keys)
+    action = jax.ShapeDtypeStruct((num_envs,), jnp.int32)
+    results = {
+        "reset": _analyze(reset, keys, top_k=top_k),
+        "step": _analyze(make_profiled_step(env, env_params), keys, state, action, top_k=top_k),
+    }
+    if verbose:
+        print(format_report(env_id, num_envs, partial_obs, results))
+    return results
+
+
+def _mib(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value / 2 ** 20:.2f}MiB"
+
+
+def format_report(env_id: str, num_envs: int, partial_obs: bool, results: Dict[str, Dict[str, Any]]) -> str:
+    lines = [f"{env_id} - Partial: {partial_obs}, Envs: {num_envs}"]
+    for fn_name, result in results.items():
+        flops = "n/a" if result["flops"] is None else f"{result['flops']:.3g}"
+        lines += [
+            f"\n{fn_name}",
+            f"  Temp memory:     {_mib(result['temp_size_in_bytes'])}",
+            f"  Argument memory: {_mib(result['argument_size_in_bytes'])}",
+            f"  Output memory:   {_mib(result['output_size_in_bytes'])}",
+            f"  FLOPs:           {flops}",
+            f"  Bytes accessed:  {_mib(result['bytes_accessed'])}",
+            "  Output bytes by scope:",
+        ]
+        lines += [f"    {scope:<20}{_mib(size):>12}" for scope, size in result["scope_bytes"].items()]
+        lines.append("  Top HLO ops by output bytes:")
+        for op in result["top_ops"]:
+            lines.append(f"    {_mib(op['bytes']):>12}  {op['scope']:<18}{op['opcode']:<14}{op['name']}")
+    return "\n".join(lines)
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compiled memory and HLO cost report for an environment")
+    parser.add_argument('--ENV_NAME',
+                        type=str,
+                        required=True,
+                        help='Environment to profile')
+    parser.add_argument('--NUM_ENVS',
+                        type=int,
+                        default=512,
+                        help='Number of parallel environments')
+    parser.add_argument('--PARTIAL_OBS',
+                        type=lambda x: x == 'True',
+                        default=False,
+                        help='Profile the POMDP variant, True or False')
+    parser.add_argument('--TOP_K',
+                        type=int,
+                        default=10,
+                        help='Number of HLO ops to list')
+    parser.add_argument('--PLATFORM',
+                        type=str,
+                        default=None,
+                        help='JAX platform, e.g. cpu or gpu')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    if args.PLATFORM is not None:
+        jax.config.update("jax_platform_name", args.PLATFORM)
+    report(args.ENV_NAME, args.NUM_ENVS, args.PARTIAL_OBS, args.TOP_K)
+
+
+if __name__ == '__main__':
+    main()
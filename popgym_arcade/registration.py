@@ -20,9 +20,15 @@ from popgym_arcade.environments import (CartPoleEasy,
                                  NavigatorMedium,
                                  NavigatorHard,
                                  )
+from popgym_arcade.environments.numpy_backend import make_numpy
 
 
-def make(env_id: str, **env_kwargs):
+def make(env_id: str, backend: str = "jax", **env_kwargs):
+    if backend == "numpy":
+        return make_numpy(env_id, **env_kwargs)
+    elif backend != "jax":
+        raise ValueError(f"Unknown backend {backend}, expected 'jax' or 'numpy'")
+
     if env_id == "CartPoleEasy":
         env = CartPoleEasy(**env_kwargs)
     elif env_id == "CartPoleMedium":
@@ -0,0 +1,165 @@
+from functools import partial
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+import chex
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnax.environments import environment
+
+
+OBS_MODES = ("float", "uint8", "state")
+
+
+class RolloutState(NamedTuple):
+    env_state: environment.EnvState
+    obs: chex.Array
+    done: chex.Array
+    policy_carry: Any
+    key: chex.PRNGKey
+
+
+class Trajectory(NamedTuple):
+    obs: chex.Array
+    action: chex.Array
+    reward: chex.Array
+    done: chex.Array
+    last_done: chex.Array
+    info: dict
+    extras: Any
+
+
+def _partition(tree):
+    """Split a pytree into array leaves, which can be scanned over, and everything else."""
+    leaves, treedef = jax.tree_util.tree_flatten(tree)
+    is_array = [isinstance(x, (jax.Array, np.ndarray, np.generic)) for x in leaves]
+    dynamic = [x if a else None for x, a in zip(leaves, is_array)]
+    static = [None if a else x for x, a in zip(leaves, is_array)]
+    return dynamic, (static, is_array, treedef)
+
+
+def _combine(dynamic, static_and_def):
+    static, is_array, treedef = static_and_def
+    leaves = [d if a else s for d, s, a in zip(dynamic, static, is_array)]
+    return jax.tree_util.tree_unflatten(treedef, leaves)
+
+
+def _compact_obs(obs: chex.Array, env_state: environment.EnvState, obs_mode: str):
+    if obs_mode == "float":
+        return obs
+    if obs_mode == "uint8":
+        return jnp.round(obs * 255).astype(jnp.uint8)
+    return env_state
+
+
+def init_rollout(
+        env: environment.Environment,
+        key: chex.PRNGKey,
+        num_envs: int,
+        policy_carry: Any = None,
+        params: Optional[environment.EnvParams] = None,
+) -> RolloutState:
+    """
+    Reset `num_envs` environments and pack everything `rollout` needs to continue.
+
+    Args:
+        env: Environment or wrapper with a `gymnax` reset/step interface.
+        key: Random key.
+        num_envs: Number of parallel environments.
+        policy_carry: Initial policy carry, e.g. recurrent states.
+        params: Environment parameters, defaults to `env.default_params`.
+
+    Returns:
+        The initial `RolloutState`.
+    """
+    if params is None:
+        params = env.default_params
+    key, key_reset = jax.random.split(key)
+    obs, env_state = jax.vmap(env.reset, in_axes=(0, None))(
+        jax.random.split(key_reset, num_envs), params
+    )
+    done = jnp.zeros((num_envs,), dtype=bool)
+    return RolloutState(env_state, obs, done, policy_carry, key)
+
+
+def rollout(
+        env: environment.Environment,
+        policy: Callable,
+        n_steps: int,
+        state: RolloutState,
+        params: Optional[environment.EnvParams] = None,
+        obs_mode: str = "float",
+) -> Tuple[RolloutState, Trajectory]:
+    """
+    Step a batch of environments for `n_steps` with a single `lax.scan`.
+
+    The policy is a pure function
+    `policy(policy_carry, obs, last_done, key) -> (policy_carry, action, extras)`
+    acting on the whole batch, where `last_done` flags envs that were reset
+    before `obs` and `extras` is any pytree (values, log-probs, Q-values, ...)
+    to be stacked into the trajectory. Environments auto-reset on `done`.
+    Non-array leaves of the policy carry (e.g. activation functions inside
+    `equinox` modules) are held static.
+
+    Args:
+        env: Environment or wrapper with a `gymnax` reset/step interface.
+        policy: Pure policy function, see above.
+        n_steps: Number of steps per environment.
+        state: State from `init_rollout` or a previous `rollout`.
+        params: Environment parameters, defaults to `env.default_params`.
+        obs_mode: How `Trajectory.obs` stores what the policy saw. "float" keeps the
+            observations, "uint8" stores them quantized to `[0, 255]`, and "state"
+            stores the env state instead so frames can be re-rendered on demand.
+
+    Returns:
+        The `RolloutState` to continue from and a `Trajectory` with `(n_steps, num_envs, ...)` leaves.
+    """
+    if obs_mode not in OBS_MODES:
+        raise ValueError(f"obs_mode must be one of {OBS_MODES}, got {obs_mode}")
+    if params is None:
+        params = env.default_params
+    num_envs = state.done.shape[0]
+    vmap_step = jax.vmap(env.step, in_axes=(0, 0, 0, None))
+
+    dynamic_state, static_state = _partition(state)
+
+    def _step(dynamic_state, _):
+        env_state, obs, last_done, policy_carry, key = _combine(dynamic_state, static_state)
+        key, key_policy, key_step = jax.random.split(key, 3)
+        policy_carry, action, extras = policy(policy_carry, obs, last_done, key_policy)
+        new_obs, new_env_state, reward, done, info = vmap_step(
+            jax.random.split(key_step, num_envs), env_state, action, params
+        )
+        transition = Trajectory(
+            obs=_compact_obs(obs, env_state, obs_mode),
+            action=action,
+            reward=reward,
+            done=done,
+            last_done=last_done,
+            info=info,
+            extras=extras,
+        )
+        new_state = RolloutState(new_env_state, new_obs, done, policy_carry, key)
+        return _partition(new_state)[0], transition
+
+    dynamic_state, trajectory = jax.lax.scan(_step, dynamic_state, None, n_steps)
+    return _combine(dynamic_state, static_state), trajectory
+
+
+def make_rollout(
+        env: environment.Environment,
+        policy: Callable,
+        n_steps: int,
+        params: Optional[environment.EnvParams] = None,
+        obs_mode: str = "float",
+        donate: bool = True,
+) -> Callable[[RolloutState], Tuple[RolloutState, Trajectory]]:
+    """
+    Compile `rollout` into `fn(state) -> (state, trajectory)`.
+
+    With `donate=True` the input state buffers are donated, so the env states
+    and observations are updated in place instead of being copied. The state must
+    then only hold arrays; use `eqx.filter_jit(rollout)` for equinox carries.
+    """
+    fn = partial(rollout, env, policy, n_steps, params=params, obs_mode=obs_mode)
+    return jax.jit(fn, donate_argnums=(0,) if donate else ())
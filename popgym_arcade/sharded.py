@@ -0,0 +1,123 @@
+import os
+from functools import partial
+from typing import Callable, Optional, Sequence, Tuple
+
+import chex
+import jax
+import numpy as np
+from gymnax.environments import environment
+from jax.experimental.shard_map import shard_map
+from jax.sharding import Mesh, NamedSharding, PartitionSpec as P
+
+
+AXIS_NAME = "envs"
+
+
+def set_host_device_count(num_devices: int) -> None:
+    """
+    Expose `num_devices` XLA CPU devices, e.g. one per physical core.
+
+    Must be called before JAX initializes its backends, i.e. before any array is created.
+    """
+    flags = [f for f in os.environ.get("XLA_FLAGS", "").split() if not f.startswith("--xla_force_host_platform_device_count")]
+    flags.append(f"--xla_force_host_platform_device_count={num_devices}")
+    os.environ["XLA_FLAGS"] = " ".join(flags)
+
+
+def make_mesh(devices: Optional[Sequence[jax.Device]] = None) -> Mesh:
+    """1D device mesh whose only axis shards the env batch."""
+    if devices is None:
+        devices = jax.devices()
+    return Mesh(np.asarray(devices), (AXIS_NAME,))
+
+
+def shard_keys(key: chex.PRNGKey, num_envs: int, mesh: Mesh) -> chex.Array:
+    """Split `key` into one key per env, laid out across the mesh."""
+    if num_envs % mesh.size != 0:
+        raise ValueError(f"num_envs ({num_envs}) must be divisible by the number of devices ({mesh.size})")
+    keys = jax.random.split(key, num_envs)
+    return jax.device_put(keys, NamedSharding(mesh, P(AXIS_NAME)))
+
+
+def make_sharded(
+        env: environment.Environment,
+        env_params: environment.EnvParams,
+        mesh: Mesh,
+) -> Tuple[Callable, Callable]:
+    """
+    Build `reset(keys)` and `step(keys, state, actions)` that run the env batch
+    split across the devices of `mesh`.
+
+    Each device vmaps the env over its own slice of the batch, so keys, states,
+    observations and rewards stay sharded along the batch axis end to end and no
+    data moves between devices.
+
+    Args:
+        env: Environment to shard.
+        env_params: Environment parameters, replicated on every device.
+        mesh: Mesh from `make_mesh`.
+
+    Returns:
+        Jitted `reset` and `step` functions taking per-env keys from `shard_keys`.
+    """
+    spec = P(AXIS_NAME)
+
+    def local_reset(keys):
+        return jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+
+    def local_step(keys, state, actions):
+        return jax.vmap(env.step, in_axes=(0, 0, 0, None))(keys, state, actions, env_params)
+
+    reset = shard_map(local_reset, mesh=mesh, in_specs=(spec,), out_specs=spec, check_rep=False)
+    step = shard_map(local_step, mesh=mesh, in_specs=(spec, spec, spec), out_specs=spec, check_rep=False)
+    return jax.jit(reset), jax.jit(step)
+
+
+def make_sharded_rollout(
+        env: environment.Environment,
+        env_params: environment.EnvParams,
+        mesh: Mesh,
+        num_steps: int,
+) -> Callable[[chex.Array], chex.Array]:
+    """
+    Build a jitted random-action rollout over a sharded env batch, used to measure
+    how throughput scales with the number of devices.
+
+    Every env carries its own key, so each device advances its slice of the batch
+    with a local `lax.scan` and no cross-device communication.
+
+    Args:
+        env: Environment to roll out.
+        env_params: Environment parameters.
+        mesh: Mesh from `make_mesh`.
+        num_steps: Number of steps per env.
+
+    Returns:
+        `rollout(keys) -> obs`, taking per-env keys from `shard_keys` and returning
+        the final sharded observations.
+    """
+    spec = P(AXIS_NAME)
+    sample = env.action_space(env_params).sample
+
+    def local_rollout(keys):
+        keys, reset_keys = _split_per_env(keys)
+        obs, state = jax.vmap(env.reset, in_axes=(0, None))(reset_keys, env_params)
+
+        def _step(carry, _):
+            keys, obs, state = carry
+            keys, action_keys = _split_per_env(keys)
+            keys, step_keys = _split_per_env(keys)
+            action = jax.vmap(sample)(action_keys)
+            obs, state, _, _, _ = jax.vmap(env.step, in_axes=(0, 0, 0, None))(step_keys, state, action, env_params)
+            return (keys, obs, state), None
+
+        (_, obs, _), _ = jax.lax.scan(_step, (keys, obs, state), None, num_steps)
+        return obs
+
+    rollout = shard_map(local_rollout, mesh=mesh, in_specs=(spec,), out_specs=spec, check_rep=False)
+    return jax.jit(rollout)
+
+
+def _split_per_env(keys: chex.Array) -> Tuple[chex.Array, chex.Array]:
+    new_keys = jax.vmap(partial(jax.random.split, num=2))(keys)
+    return new_keys[:, 0], new_keys[:, 1]
@@ -1,5 +1,8 @@
 import argparse
 
+from popgym_arcade.autotune import load_num_envs
+from popgym_arcade.baselines.model.encoders import ENCODERS, format_encoder_cost
+from popgym_arcade.baselines.model.precision import PRECISIONS
 from popgym_arcade.baselines.ppo import ppo_run
 from popgym_arcade.baselines.ppo_rnn import ppo_rnn_run
 from popgym_arcade.baselines.pqn import pqn_run
@@ -30,14 +33,14 @@ def get_args():
     ppo_parser.add_argument('--NUM_ENVS',
                             type=int,
                             default=16,
-                            help='Number of environments')
+                            help='Number of environments, 0 uses the autotuned value')
     ppo_parser.add_argument('--NUM_STEPS',
                             type=int,
                             default=128,
                             help='Number of steps')
     ppo_parser.add_argument('--TOTAL_TIMESTEPS',
                             type=int,
-                            default=1e7,
+                            default=10_000_000,
                             help='Total timesteps')
     ppo_parser.add_argument('--UPDATE_EPOCHS',
                             type=int,
@@ -78,6 +81,9 @@ def get_args():
     ppo_parser.add_argument('--PARTIAL',
                             action='store_true',
                             help='Partial Observations')
+    ppo_parser.add_argument('--SHARED_ENCODER',
+                            action='store_true',
+                            help='Share one CNN encoder between the actor and the critic')
     ppo_parser.add_argument('--ANNEAL_LR',
                             type=bool,
                             default=True,
@@ -98,6 +104,45 @@ def get_args():
                             type=str,
                             default='online',
                             help='WanDB mode')
+    ppo_parser.add_argument('--ENCODER',
+                            type=str,
+                            default='default',
+                            choices=list(ENCODERS),
+                            help='CNN encoder of the observations')
+    ppo_parser.add_argument('--PRECISION',
+                            type=str,
+                            default='fp32',
+                            choices=list(PRECISIONS),
+                            help='Compute dtype of the networks, parameters and optimizer state stay fp32')
+    ppo_parser.add_argument('--LOG_INTERVAL',
+                            type=int,
+                            default=50,
+                            help='Updates between writes of the training metrics, 0 writes them after every segment only')
+    ppo_parser.add_argument('--METRICS_SINKS',
+                            type=str,
+                            nargs='*',
+                            choices=['jsonl', 'parquet', 'wandb', 'stdout'],
+                            default=None,
+                            help='Where to write the training metrics, defaults to wandb unless WANDB_MODE is disabled')
+    ppo_parser.add_argument('--METRICS_DIR',
+                            type=str,
+                            default='metrics',
+                            help='Directory of the jsonl and parquet metrics')
+    ppo_parser.add_argument('--SEGMENT_UPDATES',
+                            type=int,
+                            default=0,
+                            help='Updates per compiled training segment, the smaller of it and LOG_INTERVAL is used, 0 ignores it')
+    ppo_parser.add_argument('--CHECKPOINT_INTERVAL',
+                            type=int,
+                            default=0,
+                            help='Updates between asynchronous checkpoints, rounded to a multiple of the segment length, 0 disables them')
+    ppo_parser.add_argument('--CHECKPOINT_DIR',
+                            type=str,
+                            default=None,
+                            help='Checkpoint directory, defaults to checkpoints/<run name>')
+    ppo_parser.add_argument('--RESUME',
+                            action='store_true',
+                            help='Continue training from the latest checkpoint in CHECKPOINT_DIR')
     # ppo with rnn parser
     ppo_rnn_parser = subparsers.add_parser('PPO_RNN', help='training with PPO using RNN models')
 
@@ -122,14 +167,14 @@ def get_args():
     ppo_rnn_parser.add_argument('--NUM_ENVS',
                                 type=int,
                                 default=16,
-                                help='Number of environments')
+                                help='Number of environments, 0 uses the autotuned value')
     ppo_rnn_parser.add_argument('--NUM_STEPS',
                                 type=int,
                                 default=128,
                                 help='Number of steps')
     ppo_rnn_parser.add_argument('--TOTAL_TIMESTEPS',
                                 type=int,
-                                default=1e7,
+                                default=10_000_000,
                                 help='Total timesteps')
     ppo_rnn_parser.add_argument('--UPDATE_EPOCHS',
                                 type=int,
@@ -170,6 +215,9 @@ def get_args():
     ppo_rnn_parser.add_argument('--PARTIAL',
                                 action='store_true',
                                 help='Partial Observations')
+    ppo_rnn_parser.add_argument('--SHARED_ENCODER',
+                                action='store_true',
+                                help='Share one CNN encoder between the actor and the critic')
     ppo_rnn_parser.add_argument('--ANNEAL_LR',
                                 type=bool,
                                 default=True,
@@ -190,6 +238,45 @@ def get_args():
                                 type=str,
                                 default='online',
                                 help='WanDB mode')
+    ppo_rnn_parser.add_argument('--ENCODER',
+                                type=str,
+                                default='default',
+                                choices=list(ENCODERS),
+                                help='CNN encoder of the observations')
+    ppo_rnn_parser.add_argument('--PRECISION',
+                                type=str,
+                                default='fp32',
+                                choices=list(PRECISIONS),
+                                help='Compute dtype of the networks, parameters and optimizer state stay fp32')
+    ppo_rnn_parser.add_argument('--LOG_INTERVAL',
+                                type=int,
+                                default=50,
+                                help='Updates between writes of the training metrics, 0 writes them after every segment only')
+    ppo_rnn_parser.add_argument('--METRICS_SINKS',
+                                type=str,
+                                nargs='*',
+                                choices=['jsonl', 'parquet', 'wandb', 'stdout'],
+                                default=None,
+                                help='Where to write the training metrics, defaults to wandb unless WANDB_MODE is disabled')
+    ppo_rnn_parser.add_argument('--METRICS_DIR',
+                                type=str,
+                                default='metrics',
+                                help='Directory of the jsonl and parquet metrics')
+    ppo_rnn_parser.add_argument('--SEGMENT_UPDATES',
+                                type=int,
+                                default=0,
+                                help='Updates per compiled training segment, the smaller of it and LOG_INTERVAL is used, 0 ignores it')
+    ppo_rnn_parser.add_argument('--CHECKPOINT_INTERVAL',
+                                type=int,
+                                default=0,
+                                help='Updates between asynchronous checkpoints, rounded to a multiple of the segment length, 0 disables them')
+    ppo_rnn_parser.add_argument('--CHECKPOINT_DIR',
+                                type=str,
+                                default=None,
+                                help='Checkpoint directory, defaults to checkpoints/<run name>')
+    ppo_rnn_parser.add_argument('--RESUME',
+                                action='store_true',
+                                help='Continue training from the latest checkpoint in CHECKPOINT_DIR')
 
     # pqn parser
     pqn_parser = subparsers.add_parser('PQN', help='Training with PQN')
@@ -199,16 +286,16 @@ def get_args():
                             help='Memory model type.')
     pqn_parser.add_argument('--TOTAL_TIMESTEPS',
                             type=int,
-                            default=3e6,
+                            default=3_000_000,
                             help='Total timesteps')
     pqn_parser.add_argument('--TOTAL_TIMESTEPS_DECAY',
                             type=int,
-                            default=1e6,
+                            default=1_000_000,
                             help='Total timesteps decay will be used for decay functions, in case you want to test for less timesteps and keep decays same.')
     pqn_parser.add_argument('--NUM_ENVS',
                             type=int,
                             default=16,
-                            help='Parallel Environments')
+                            help='Parallel Environments, 0 uses the autotuned value')
     pqn_parser.add_argument('--MEMORY_WINDOW',
                             type=int,
                             default=4,
@@ -293,6 +380,45 @@ def get_args():
                             type=str,
                             default='online',
                             help='WanDB mode')
+    pqn_parser.add_argument('--ENCODER',
+                            type=str,
+                            default='default',
+                            choices=list(ENCODERS),
+                            help='CNN encoder of the observations')
+    pqn_parser.add_argument('--PRECISION',
+                            type=str,
+                            default='fp32',
+                            choices=list(PRECISIONS),
+                            help='Compute dtype of the networks, parameters and optimizer state stay fp32')
+    pqn_parser.add_argument('--LOG_INTERVAL',
+                            type=int,
+                            default=50,
+                            help='Updates between writes of the training metrics, 0 writes them after every segment only')
+    pqn_parser.add_argument('--METRICS_SINKS',
+                            type=str,
+                            nargs='*',
+                            choices=['jsonl', 'parquet', 'wandb', 'stdout'],
+                            default=None,
+                            help='Where to write the training metrics, defaults to wandb unless WANDB_MODE is disabled')
+    pqn_parser.add_argument('--METRICS_DIR',
+                            type=str,
+                            default='metrics',
+                            help='Directory of the jsonl and parquet metrics')
+    pqn_parser.add_argument('--SEGMENT_UPDATES',
+                            type=int,
+                            default=0,
+                            help='Updates per compiled training segment, the smaller of it and LOG_INTERVAL is used, 0 ignores it')
+    pqn_parser.add_argument('--CHECKPOINT_INTERVAL',
+                            type=int,
+                            default=0,
+                            help='Updates between asynchronous checkpoints, rounded to a multiple of the segment length, 0 disables them')
+    pqn_parser.add_argument('--CHECKPOINT_DIR',
+                            type=str,
+                            default=None,
+                            help='Checkpoint directory, defaults to checkpoints/<run name>')
+    pqn_parser.add_argument('--RESUME',
+                            action='store_true',
+                            help='Continue training from the latest checkpoint in CHECKPOINT_DIR')
     pqn_parser.add_argument('--SEED',
                             type=int,
                             default=0,
@@ -324,6 +450,10 @@ def get_args():
                             type=int,
                             default=128,
                             help='Number of test environments')
+    pqn_parser.add_argument('--TEST_NUM_STEPS',
+                            type=int,
+                            default=500,
+                            help='Steps of each test rollout')
     pqn_parser.add_argument('--EPS_TEST',
                             type=float,
                             default=0,
@@ -344,20 +474,25 @@ def get_args():
                             help='Memory model type.')
     pqn_rnn_parser.add_argument('--TOTAL_TIMESTEPS',
                             type=int,
-                            default=3e6,
+                            default=3_000_000,
                             help='Total timesteps')
     pqn_rnn_parser.add_argument('--TOTAL_TIMESTEPS_DECAY',
                             type=int,
-                            default=1e6,
+                            default=1_000_000,
                             help='Total timesteps decay will be used for decay functions, in case you want to test for less timesteps and keep decays same.')
     pqn_rnn_parser.add_argument('--NUM_ENVS',
                             type=int,
                             default=16,
-                            help='Parallel Environments')
+                            help='Parallel Environments, 0 uses the autotuned value')
     pqn_rnn_parser.add_argument('--MEMORY_WINDOW',
                             type=int,
                             default=4,
                             help='steps of previous episode added in the rnn training horizon')
+    pqn_rnn_parser.add_argument('--OBS_DTYPE',
+                            type=str,
+                            default='float32',
+                            choices=['float32', 'uint8'],
+                            help='Storage dtype of the observations in the transition memory, uint8 uses 4x less memory')
     pqn_rnn_parser.add_argument('--NUM_STEPS',
                             type=int,
                             default=128,
@@ -438,6 +573,45 @@ def get_args():
                             type=str,
                             default='online',
                             help='WanDB mode')
+    pqn_rnn_parser.add_argument('--ENCODER',
+                            type=str,
+                            default='default',
+                            choices=list(ENCODERS),
+                            help='CNN encoder of the observations')
+    pqn_rnn_parser.add_argument('--PRECISION',
+                            type=str,
+                            default='fp32',
+                            choices=list(PRECISIONS),
+                            help='Compute dtype of the networks, parameters and optimizer state stay fp32')
+    pqn_rnn_parser.add_argument('--LOG_INTERVAL',
+                            type=int,
+                            default=50,
+                            help='Updates between writes of the training metrics, 0 writes them after every segment only')
+    pqn_rnn_parser.add_argument('--METRICS_SINKS',
+                            type=str,
+                            nargs='*',
+                            choices=['jsonl', 'parquet', 'wandb', 'stdout'],
+                            default=None,
+                            help='Where to write the training metrics, defaults to wandb unless WANDB_MODE is disabled')
+    pqn_rnn_parser.add_argument('--METRICS_DIR',
+                            type=str,
+                            default='metrics',
+                            help='Directory of the jsonl and parquet metrics')
+    pqn_rnn_parser.add_argument('--SEGMENT_UPDATES',
+                            type=int,
+                            default=0,
+                            help='Updates per compiled training segment, the smaller of it and LOG_INTERVAL is used, 0 ignores it')
+    pqn_rnn_parser.add_argument('--CHECKPOINT_INTERVAL',
+                            type=int,
+                            default=0,
+                            help='Updates between asynchronous checkpoints, rounded to a multiple of the segment length, 0 disables them')
+    pqn_rnn_parser.add_argument('--CHECKPOINT_DIR',
+                            type=str,
+                            default=None,
+                            help='Checkpoint directory, defaults to checkpoints/<run name>')
+    pqn_rnn_parser.add_argument('--RESUME',
+                            action='store_true',
+                            help='Continue training from the latest checkpoint in CHECKPOINT_DIR')
     pqn_rnn_parser.add_argument('--SEED',
                             type=int,
                             default=0,
@@ -469,10 +643,25 @@ def get_args():
                             type=int,
                             default=128,
                             help='Number of test environments')
+    pqn_rnn_parser.add_argument('--TEST_NUM_STEPS',
+                            type=int,
+                            default=500,
+                            help='Steps of each test rollout')
     pqn_rnn_parser.add_argument('--EPS_TEST',
                             type=float,
                             default=0,
                             help='0 for greedy policy')
+    pqn_rnn_parser.add_argument('--CHURN_EVAL',
+                            action='store_true',
+                            help='Log the fraction of greedy actions changed by each update')
+    pqn_rnn_parser.add_argument('--CHURN_INTERVAL',
+                            type=int,
+                            default=1,
+                            help='Measure the churn every CHURN_INTERVAL updates, counted from the start of each compiled segment')
+    pqn_rnn_parser.add_argument('--CHURN_NUM_ENVS',
+                            type=int,
+                            default=16,
+                            help='Number of environments of the memory the churn is measured on')
     pqn_rnn_parser.add_argument('--ALG_NAME',
                             type=str,
                             default='PQN_RNN',
@@ -490,6 +679,9 @@ def get_local_args():
 def main():
     args = get_args()
     args_dict = vars(args)
+    if args_dict["NUM_ENVS"] <= 0:
+        args_dict["NUM_ENVS"] = load_num_envs(args.ENV_NAME, args.PARTIAL)
+    print(format_encoder_cost(args.ENCODER))
 
     if args.TRAIN_TYPE == 'PPO':
         ppo_run(args_dict)
@@ -0,0 +1,178 @@
+import queue
+import threading
+from functools import partial
+from typing import Any, Dict, Optional, Tuple
+
+import chex
+import jax
+import jax.numpy as jnp
+import numpy as np
+from gymnax.environments import spaces
+
+import popgym_arcade
+
+
+def to_numpy(x: jax.Array) -> np.ndarray:
+    """
+    Hand a JAX array to NumPy, sharing the buffer through DLPack when it lives on the host.
+
+    Arrays on accelerators have to be copied to the host; use `torch.from_dlpack`
+    on the raw JAX array instead to keep them on device.
+    """
+    if all(d.platform == "cpu" for d in x.devices()):
+        return np.from_dlpack(x)
+    return np.asarray(x)
+
+
+class AsyncVectorEnv:
+    """
+    EnvPool-style asynchronous interface to a batch of `num_envs` environments.
+
+    `send(actions, env_ids)` enqueues a step for `batch_size` of the environments
+    and returns immediately. A background thread dispatches the jitted step and
+    converts its outputs to NumPy, while the caller prepares the next batch.
+    `recv()` returns the results of the oldest pending `send` (or `async_reset`)
+    as `(obs, reward, done, info, env_ids)`. Splitting the envs into two or more
+    batches that are sent alternately keeps the device busy while the host
+    consumes the previous batch. Environments auto-reset on `done`.
+
+    Args:
+        env_id: Registered environment name.
+        num_envs: Total number of environments.
+        batch_size: Number of environments per `send`/`recv`, defaults to `num_envs`.
+        partial_obs: Whether to use the POMDP variant.
+        seed: Random seed.
+        num_buffers: Number of finished batches that may wait in `recv` before the
+            background thread blocks.
+        return_jax: Return JAX arrays instead of NumPy arrays, e.g. for `torch.from_dlpack`.
+    """
+
+    def __init__(
+            self,
+            env_id: str,
+            num_envs: int,
+            batch_size: Optional[int] = None,
+            partial_obs: bool = False,
+            seed: int = 0,
+            num_buffers: int = 2,
+            return_jax: bool = False,
+    ):
+        self.env, self.env_params = popgym_arcade.make(env_id, partial_obs=partial_obs)
+        self.num_envs = num_envs
+        self.batch_size = num_envs if batch_size is None else batch_size
+        if self.num_envs % self.batch_size != 0:
+            raise ValueError(f"num_envs ({num_envs}) must be divisible by batch_size ({self.batch_size})")
+        self.return_jax = return_jax
+        # Take the shape from a traced reset, not every game reports its frame shape
+        obs, _ = jax.eval_shape(self.env.reset, jax.random.PRNGKey(0), self.env_params)
+        self.observation_space = spaces.Box(0.0, 1.0, obs.shape, obs.dtype)
+        self.action_space = self.env.action_space(self.env_params)
+
+        self._key = jax.random.PRNGKey(seed)
+        self._num_calls = 0
+        self._state = None
+        self._requests = queue.Queue()
+        self._results = queue.Queue(maxsize=num_buffers)
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    @partial(jax.jit, static_argnums=(0,))
+    def _reset(self, key: chex.PRNGKey):
+        obs, state = jax.vmap(self.env.reset, in_axes=(0, None))(
+            jax.random.split(key, self.num_envs), self.env_params
+        )
+        return obs, state
+
+    @partial(jax.jit, static_argnums=(0,), donate_argnums=(2,))
+    def _step(self, key: chex.PRNGKey, state: Any, actions: chex.Array, env_ids: chex.Array):
+        # Only the requested envs are gathered, stepped and scattered back, the
+        # state buffers are donated so the scatter happens in place
+        sub_state = jax.tree.map(lambda x: x[env_ids], state)
+        obs, sub_state, reward, done, info = jax.vmap(self.env.step, in_axes=(0, 0, 0, None))(
+            jax.random.split(key, env_ids.shape[0]), sub_state, actions, self.env_params
+        )
+        state = jax.tree.map(lambda x, y: x.at[env_ids].set(y), state, sub_state)
+        return state, (obs, reward, done, info)
+
+    def _next_key(self) -> chex.PRNGKey:
+        self._num_calls += 1
+        return jax.random.fold_in(self._key, self._num_calls)
+
+    def _output(self, x: jax.Array):
+        return x if self.return_jax else to_numpy(x)
+
+    def _work(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            try:
+                kind, actions, env_ids = request
+                if kind == "reset":
+                    obs, self._state = self._reset(self._next_key())
+                    for start in range(0, self.num_envs, self.batch_size):
+                        ids = np.arange(start, start + self.batch_size)
+                        batch_obs = obs[start:start + self.batch_size]
+                        reward = jnp.zeros((self.batch_size,))
+                        done = jnp.zeros((self.batch_size,), dtype=bool)
+                        self._results.put(
+                            (self._output(batch_obs), self._output(reward), self._output(done), {}, ids)
+                        )
+                else:
+                    self._state, (obs, reward, done, info) = self._step(
+                        self._next_key(), self._state, actions, env_ids
+                    )
+                    info = jax.tree.map(self._output, info)
+                    self._results.put(
+                        (self._output(obs), self._output(reward), self._output(done), info, np.asarray(env_ids))
+                    )
+            except Exception as e:
+                self._results.put(e)
+
+    def async_reset(self) -> None:
+        """Reset every environment. The observations arrive in `num_envs // batch_size` calls to `recv`."""
+        self._requests.put(("reset", None, None))
+
+    def send(self, actions: np.ndarray, env_ids: Optional[np.ndarray] = None) -> None:
+        """
+        Enqueue one step for the environments in `env_ids` without waiting for it.
+
+        Args:
+            actions: Integer actions, one per entry of `env_ids`.
+            env_ids: `batch_size` environment indices, as returned by `recv`.
+                Defaults to the first `batch_size` environments.
+        """
+        if env_ids is None:
+            env_ids = np.arange(self.batch_size)
+        if len(env_ids) != self.batch_size:
+            raise ValueError(f"Expected {self.batch_size} env_ids, got {len(env_ids)}")
+        actions = jnp.asarray(actions, dtype=jnp.int32)
+        env_ids = jnp.asarray(env_ids, dtype=jnp.int32)
+        self._requests.put(("step", actions, env_ids))
+
+    def recv(self) -> Tuple[Any, Any, Any, Dict[str, Any], np.ndarray]:
+        """
+        Block until the oldest pending batch is ready.
+
+        Returns:
+            `(obs, reward, done, info, env_ids)` for `batch_size` environments.
+        """
+        result = self._results.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def step(self, actions: np.ndarray, env_ids: Optional[np.ndarray] = None):
+        """Synchronous `send` followed by `recv`."""
+        self.send(actions, env_ids)
+        return self.recv()
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -71,3 +71,368 @@ class LogWrapper(GymnaxWrapper):
         info["timestep"] = state.timestep
         info["returned_episode"] = done
         return obs, state, reward, done, info
+
+
+@struct.dataclass
+class ResetPoolState:
+    env_state: environment.EnvState
+    pool_obs: chex.Array
+    pool_states: environment.EnvState
+    cursor: int
+    timestep: int
+
+
+class ResetPoolWrapper(GymnaxWrapper):
+    """Auto-reset from a device-resident pool of pre-generated initial states.
+
+    Generating boards and rendering the first frame dominates `reset_env` for
+    BattleShip, Navigator and MineSweeper. This wrapper samples finished envs'
+    initial observation and state from a shared pool instead, and regenerates
+    `refresh_size` pool entries every `refresh_interval` steps so that the pool
+    keeps changing over training. Larger pools use more memory
+    (`pool_size` observations of 256x256x3 float32) but repeat initial states less often.
+
+    Unlike `LogWrapper`, `reset` and `step` operate on the whole batch of
+    `num_envs` environments so that the pool is shared between them. Do not `vmap` them.
+    It calls `reset_env` and `step_env` of `env` directly, so `env` must be a bare
+    `Environment`: wrappers below it would be skipped, apply them on top instead.
+    """
+
+    def __init__(
+            self,
+            env: environment.Environment,
+            num_envs: int,
+            pool_size: int = 256,
+            refresh_size: int = 16,
+            refresh_interval: int = 8,
+    ):
+        super().__init__(env)
+        assert not isinstance(env, GymnaxWrapper), "ResetPoolWrapper must wrap a bare Environment"
+        assert pool_size % refresh_size == 0, "refresh_size must divide pool_size"
+        self.num_envs = num_envs
+        self.pool_size = pool_size
+        self.refresh_size = refresh_size
+        self.refresh_interval = refresh_interval
+
+    def _generate(self, key: chex.PRNGKey, n: int, params: environment.EnvParams):
+        return jax.vmap(self._env.reset_env, in_axes=(0, None))(
+            jax.random.split(key, n), params
+        )
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(
+            self, key: chex.PRNGKey, params: Optional[environment.EnvParams] = None
+    ) -> Tuple[chex.Array, ResetPoolState]:
+        if params is None:
+            params = self._env.default_params
+        key_envs, key_pool = jax.random.split(key)
+        obs, env_state = self._generate(key_envs, self.num_envs, params)
+        pool_obs, pool_states = self._generate(key_pool, self.pool_size, params)
+        state = ResetPoolState(
+            env_state=env_state,
+            pool_obs=pool_obs,
+            pool_states=pool_states,
+            cursor=jnp.array(0, dtype=jnp.int32),
+            timestep=jnp.array(0, dtype=jnp.int32),
+        )
+        return obs, state
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(
+            self,
+            key: chex.PRNGKey,
+            state: ResetPoolState,
+            action: chex.Array,
+            params: Optional[environment.EnvParams] = None,
+    ) -> Tuple[chex.Array, ResetPoolState, chex.Array, chex.Array, dict]:
+        if params is None:
+            params = self._env.default_params
+        key_step, key_sample, key_refresh = jax.random.split(key, 3)
+        obs_st, env_state_st, reward, done, info = jax.vmap(
+            self._env.step_env, in_axes=(0, 0, 0, None)
+        )(jax.random.split(key_step, self.num_envs), state.env_state, action, params)
+
+        # Auto-reset finished envs with (possibly repeated) samples from the pool
+        idx = jax.random.randint(key_sample, (self.num_envs,), 0, self.pool_size)
+
+        def select(x_re, x_st):
+            mask = done.reshape(done.shape + (1,) * (x_st.ndim - 1))
+            return jnp.where(mask, x_re[idx], x_st)
+
+        obs = select(state.pool_obs, obs_st)
+        env_state = jax.tree.map(select, state.pool_states, env_state_st)
+
+        def refresh(pool):
+            pool_obs, pool_states, cursor = pool
+            new_obs, new_states = self._generate(key_refresh, self.refresh_size, params)
+            write = lambda x, new: jax.lax.dynamic_update_slice_in_dim(
+                x, new.astype(x.dtype), cursor, axis=0
+            )
+            return (
+                write(pool_obs, new_obs),
+                jax.tree.map(write, pool_states, new_states),
+                (cursor + self.refresh_size) % self.pool_size,
+            )
+
+        pool_obs, pool_states, cursor = jax.lax.cond(
+            state.timestep % self.refresh_interval == 0,
+            refresh,
+            lambda pool: pool,
+            (state.pool_obs, state.pool_states, state.cursor),
+        )
+        state = ResetPoolState(
+            env_state=env_state,
+            pool_obs=pool_obs,
+            pool_states=pool_states,
+            cursor=cursor,
+            timestep=state.timestep + 1,
+        )
+        return obs, state, reward, done, info
+
+
+@struct.dataclass
+class FrameStackEnvState:
+    env_state: environment.EnvState
+    frames: chex.Array
+
+
+class FrameStackWrapper(GymnaxWrapper):
+    """Stack the last `num_frames` observations along the channel axis.
+
+    The `(H, W, num_frames * C)` stack lives in the wrapper state, oldest frame
+    first. Each step drops the oldest frame and appends the new one, and the stack
+    is refilled with the first frame of a new episode when `done`. A ring buffer
+    that only writes the new frame is slower on CPU, even when the consumer
+    rotates the raw buffer itself, see `plotting/FrameStack_FPS_test.py`.
+    """
+
+    def __init__(self, env: environment.Environment, num_frames: int = 4):
+        super().__init__(env)
+        self.num_frames = num_frames
+
+    def _fill(self, obs: chex.Array) -> chex.Array:
+        return jnp.concatenate([obs] * self.num_frames, axis=-1)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(
+            self, key: chex.PRNGKey, params: Optional[environment.EnvParams] = None
+    ) -> Tuple[chex.Array, FrameStackEnvState]:
+        obs, env_state = self._env.reset(key, params)
+        frames = self._fill(obs)
+        return frames, FrameStackEnvState(env_state=env_state, frames=frames)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(
+            self,
+            key: chex.PRNGKey,
+            state: FrameStackEnvState,
+            action: Union[int, float],
+            params: Optional[environment.EnvParams] = None,
+    ) -> Tuple[chex.Array, FrameStackEnvState, float, bool, dict]:
+        obs, env_state, reward, done, info = self._env.step(
+            key, state.env_state, action, params
+        )
+        obs = obs.astype(state.frames.dtype)
+        frames = jnp.concatenate([state.frames[..., obs.shape[-1]:], obs], axis=-1)
+        # A new episode starts with every slot holding its first frame
+        frames = jnp.where(done, self._fill(obs), frames)
+        return frames, FrameStackEnvState(env_state=env_state, frames=frames), reward, done, info
+
+    def observation_space(self, params: environment.EnvParams) -> spaces.Box:
+        # Take the shape from a traced reset, not every game reports its frame shape
+        obs, _ = jax.eval_shape(self._env.reset, jax.random.PRNGKey(0), params)
+        height, width, channels = obs.shape
+        return spaces.Box(0.0, 1.0, (height, width, channels * self.num_frames), obs.dtype)
+
+
+class ActionRepeatWrapper(GymnaxWrapper):
+    """Repeat each action `num_repeats` times and only render the final state.
+
+    The intermediate observations returned by `step_env` are never used, so their
+    renders are dead code that XLA removes and only the dynamics run `num_repeats` times.
+    Rewards are summed over the repeats. Once an episode ends, the remaining repeats
+    leave the state and info untouched and the env auto-resets as in `gymnax`.
+    With `max_pool=True` the observation is the pixel-wise maximum over the
+    renders of the last two states.
+    """
+
+    def __init__(
+            self,
+            env: environment.Environment,
+            num_repeats: int = 4,
+            max_pool: bool = False,
+    ):
+        super().__init__(env)
+        self.num_repeats = num_repeats
+        self.max_pool = max_pool
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(
+            self, key: chex.PRNGKey, params: Optional[environment.EnvParams] = None
+    ) -> Tuple[chex.Array, environment.EnvState]:
+        return self._env.reset(key, params)
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(
+            self,
+            key: chex.PRNGKey,
+            state: environment.EnvState,
+            action: Union[int, float],
+            params: Optional[environment.EnvParams] = None,
+    ) -> Tuple[chex.Array, environment.EnvState, float, bool, dict]:
+        if params is None:
+            params = self._env.default_params
+        key, key_reset, key_obs, key_prev_obs = jax.random.split(key, 4)
+        step_keys = jax.random.split(key, self.num_repeats)
+
+        done = jnp.array(False)
+        reward = jnp.array(0.0)
+        prev_state = state
+        info = {}
+        for i in range(self.num_repeats):
+            _, next_state, step_reward, step_done, step_info = self._env.step_env(
+                step_keys[i], state, action, params
+            )
+            # After the episode ends, keep the info of its final step
+            info = step_info if i == 0 else jax.tree.map(
+                lambda p, n: jnp.where(done, p, n), info, step_info
+            )
+            reward = reward + jnp.where(done, 0.0, step_reward)
+            prev_state = jax.tree.map(lambda p, s: jnp.where(done, p, s), prev_state, state)
+            state = jax.tree.map(lambda s, n: jnp.where(done, s, n), state, next_state)
+            done = jnp.logical_or(done, step_done)
+
+        obs = self._env.get_obs(state, params, key=key_obs)
+        if self.max_pool:
+            obs = jnp.maximum(obs, self._env.get_obs(prev_state, params, key=key_prev_obs))
+
+        obs_re, state_re = self._env.reset_env(key_reset, params)
+        state = jax.tree.map(lambda x, y: jax.lax.select(done, x, y), state_re, state)
+        obs = jax.lax.select(done, obs_re, obs)
+        return obs, state, reward, done, info
+
+
+@struct.dataclass
+class StatsEnvState:
+    env_state: environment.EnvState
+    episode_returns: float
+    episode_lengths: int
+    recent_returns: chex.Array
+    recent_lengths: chex.Array
+    num_episodes: int
+    timestep: int
+
+
+@struct.dataclass
+class EpisodeStats:
+    num_episodes: int
+    mean_return: float
+    min_return: float
+    max_return: float
+    mean_length: float
+    min_length: float
+    max_length: float
+
+
+class StatsWrapper(GymnaxWrapper):
+    """Keep rolling episode statistics on device.
+
+    Each env records the returns and lengths of its last `window` completed
+    episodes in fixed-size ring buffers. `summary` reduces a (batched) state to a
+    small `EpisodeStats` struct, so the host can pull a handful of scalars at
+    whatever interval it likes instead of per-step info arrays, e.g.
+
+        stats = StatsWrapper.summary(env_state)
+        jax.lax.cond(update % 10 == 0, lambda: jax.debug.callback(print, stats), lambda: None)
+
+    The per-step info contains the same keys as `LogWrapper`.
+    """
+
+    def __init__(self, env: environment.Environment, window: int = 32):
+        super().__init__(env)
+        self.window = window
+
+    @partial(jax.jit, static_argnums=(0,))
+    def reset(
+            self, key: chex.PRNGKey, params: Optional[environment.EnvParams] = None
+    ) -> Tuple[chex.Array, StatsEnvState]:
+        obs, env_state = self._env.reset(key, params)
+        state = StatsEnvState(
+            env_state=env_state,
+            episode_returns=jnp.array(0.0),
+            episode_lengths=jnp.array(0, dtype=jnp.int32),
+            recent_returns=jnp.zeros((self.window,)),
+            recent_lengths=jnp.zeros((self.window,), dtype=jnp.int32),
+            num_episodes=jnp.array(0, dtype=jnp.int32),
+            timestep=jnp.array(0, dtype=jnp.int32),
+        )
+        return obs, state
+
+    @partial(jax.jit, static_argnums=(0,))
+    def step(
+            self,
+            key: chex.PRNGKey,
+            state: StatsEnvState,
+            action: Union[int, float],
+            params: Optional[environment.EnvParams] = None,
+    ) -> Tuple[chex.Array, StatsEnvState, float, bool, dict]:
+        obs, env_state, reward, done, info = self._env.step(
+            key, state.env_state, action, params
+        )
+        new_episode_return = state.episode_returns + reward
+        new_episode_length = state.episode_lengths + 1
+        slot = state.num_episodes % self.window
+        recent_returns = state.recent_returns.at[slot].set(
+            jnp.where(done, new_episode_return, state.recent_returns[slot])
+        )
+        recent_lengths = state.recent_lengths.at[slot].set(
+            jnp.where(done, new_episode_length, state.recent_lengths[slot])
+        )
+        num_episodes = state.num_episodes + done
+        state = StatsEnvState(
+            env_state=env_state,
+            episode_returns=new_episode_return * (1 - done),
+            episode_lengths=new_episode_length * (1 - done),
+            recent_returns=recent_returns,
+            recent_lengths=recent_lengths,
+            num_episodes=num_episodes,
+            timestep=state.timestep + 1,
+        )
+        last_slot = (num_episodes - 1) % self.window
+        info["returned_episode_returns"] = recent_returns[last_slot]
+        info["returned_episode_lengths"] = recent_lengths[last_slot]
+        info["timestep"] = state.timestep
+        info["returned_episode"] = done
+        return obs, state, reward, done, info
+
+    @staticmethod
+    @jax.jit
+    def summary(state: StatsEnvState) -> EpisodeStats:
+        """Reduce a single or batched `StatsEnvState` to one `EpisodeStats`.
+
+        Statistics are NaN until at least one episode has completed.
+        """
+        window = state.recent_returns.shape[-1]
+        num_valid = jnp.minimum(state.num_episodes, window)
+        valid = jnp.arange(window) < num_valid[..., None]
+        count = valid.sum()
+        lengths = state.recent_lengths.astype(jnp.float32)
+
+        def mean(x):
+            return jnp.where(count > 0, jnp.where(valid, x, 0.0).sum() / count, jnp.nan)
+
+        def reduce_min(x):
+            return jnp.where(count > 0, jnp.where(valid, x, jnp.inf).min(), jnp.nan)
+
+        def reduce_max(x):
+            return jnp.where(count > 0, jnp.where(valid, x, -jnp.inf).max(), jnp.nan)
+
+        return EpisodeStats(
+            num_episodes=state.num_episodes.sum(),
+            mean_return=mean(state.recent_returns),
+            min_return=reduce_min(state.recent_returns),
+            max_return=reduce_max(state.recent_returns),
+            mean_length=mean(lengths),
+            min_length=reduce_min(lengths),
+            max_length=reduce_max(lengths),
+        )
@@ -9,11 +9,13 @@ setup(
     long_description=open("README.md").read(),
     long_description_content_type="text/markdown",
     url="",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=[
         "gymnax",
         "dm_pix",
         "jaxtyping",
+        # serialization of the exported kernels in popgym_arcade.export
+        "flatbuffers",
     ],
     extras_require = {
         "baselines": [
@@ -23,8 +25,13 @@ setup(
             "wandb",
             "beartype",
             "jaxtyping",
-            "imageio"
-        ]
+            "imageio",
+            "orbax-checkpoint"
+        ],
+        # ParquetSink of popgym_arcade.baselines.metrics
+        "parquet": [
+            "pyarrow",
+        ],
     },
     classifiers=[
         "Programming Language :: Python :: 3",
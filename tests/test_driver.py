@@ -0,0 +1,98 @@
+import json
+
+import jax
+import jax.numpy as jnp
+import pytest
+
+from popgym_arcade.baselines.driver import run_segments, segment_lengths, snap_intervals
+
+
+def test_segment_lengths():
+    assert segment_lengths(10, 0) == [10]
+    assert segment_lengths(10, 4) == [4, 4, 2]
+    assert segment_lengths(10, 20) == [10]
+
+
+def test_segment_lengths_resume():
+    assert segment_lengths(10, 4, start=4) == [4, 2]
+    # A checkpoint written with another segment length
+    assert segment_lengths(10, 4, start=5) == [3, 2]
+    assert segment_lengths(10, 4, start=10) == []
+
+
+def test_snap_intervals():
+    assert snap_intervals(50, 61, 0) == (50, 50, 0)
+    assert snap_intervals(50, 130, 20) == (50, 150, 50)
+    assert snap_intervals(0, 3, 10) == (3, 3, 9)
+    assert snap_intervals(0, 0, 0) == (0, 0, 0)
+
+
+def test_at_most_two_segment_lengths():
+    # 1220 updates with the default TEST_INTERVAL of 0.05 and LOG_INTERVAL of 50
+    segment, test_interval, _ = snap_intervals(50, int(1220 * 0.05), 0)
+    assert set(segment_lengths(1220, segment)) == {50, 20}
+    assert test_interval % segment == 0
+
+
+def init(rng):
+    return jnp.array(0, dtype=jnp.int32), rng
+
+
+def train_segment(runner_state, num_updates):
+    count, rng = runner_state
+    return (count + num_updates, rng), {"step": count + 1 + jnp.arange(num_updates)}
+
+
+def count_test(count, rng):
+    return {"count": count}
+
+
+def make_config(tmp_path, num_updates, **overrides):
+    return {
+        "TRAIN_TYPE": "TEST",
+        "ENV_NAME": "Counter",
+        "PARTIAL": False,
+        "SEED": 0,
+        "NUM_UPDATES": num_updates,
+        "TEST_DURING_TRAINING": False,
+        "TEST_INTERVAL": 0.05,
+        "METRICS_SINKS": [],
+        "CHECKPOINT_DIR": str(tmp_path / "checkpoints"),
+        **overrides,
+    }
+
+
+def test_run_segments_tests_every_update_of_short_runs(tmp_path):
+    # TEST_INTERVAL * NUM_UPDATES rounds to zero updates
+    config = make_config(
+        tmp_path, 10, TEST_DURING_TRAINING=True, METRICS_SINKS=["jsonl"], METRICS_DIR=str(tmp_path / "metrics")
+    )
+    outs = run_segments(config, init, train_segment, count_test, jax.random.split(jax.random.PRNGKey(0), 2))
+    assert outs["metrics"]["step"].shape == (2, 10)
+    with open(tmp_path / "metrics" / "TEST__Counter_Partial=False_SEED=0.jsonl") as f:
+        rows = [json.loads(line) for line in f]
+    tests = {row["update"]: row["test_count"] for row in rows if "test_count" in row}
+    assert tests == {i: float(i) for i in range(1, 11)}
+
+
+def test_run_segments_resume(tmp_path):
+    rngs = jax.random.split(jax.random.PRNGKey(0), 2)
+    outs = run_segments(make_config(tmp_path, 6, CHECKPOINT_INTERVAL=4), init, train_segment, None, rngs)
+    assert outs["runner_state"][0].tolist() == [6, 6]
+
+    # Continues from the checkpoint at the end of the first run
+    config = make_config(tmp_path, 10, CHECKPOINT_INTERVAL=4, RESUME=True)
+    outs = run_segments(config, init, train_segment, None, rngs)
+    assert outs["runner_state"][0].tolist() == [10, 10]
+    assert outs["metrics"]["step"][0].tolist() == [7, 8, 9, 10]
+
+    # Nothing is left to train after the final checkpoint
+    outs = run_segments(config, init, train_segment, None, rngs)
+    assert outs["runner_state"][0].tolist() == [10, 10]
+    assert outs["metrics"] == []
+
+
+def test_run_segments_warns_when_intervals_are_rounded(tmp_path):
+    config = make_config(tmp_path, 10, LOG_INTERVAL=4, CHECKPOINT_INTERVAL=6)
+    with pytest.warns(UserWarning, match="CHECKPOINT_INTERVAL of 6 updates is rounded to 8"):
+        run_segments(config, init, train_segment, None, jax.random.split(jax.random.PRNGKey(0), 2))
@@ -0,0 +1,36 @@
+import equinox as eqx
+import jax
+import jax.numpy as jnp
+import pytest
+
+from popgym_arcade.baselines.model.encoders import ENCODERS, OBS_SHAPE, encoder_cost, make_encoder
+from popgym_arcade.baselines.model.precision import PRECISIONS, cast
+
+
+@pytest.mark.parametrize("precision", list(PRECISIONS))
+@pytest.mark.parametrize("name", list(ENCODERS))
+def test_encoder_forward(name, precision):
+    dtype = PRECISIONS[precision]
+    encoder = make_encoder(name, jax.random.PRNGKey(0))
+    obs = jax.random.uniform(jax.random.PRNGKey(1), OBS_SHAPE).astype(dtype)
+    out = eqx.filter_jit(lambda encoder, obs: cast(encoder, dtype)(obs))(encoder, obs)
+    assert out.shape == (encoder.out_features,)
+    assert out.dtype == dtype
+    assert jnp.all(jnp.isfinite(out))
+
+
+@pytest.mark.parametrize("name", list(ENCODERS))
+def test_encoder_cost(name):
+    cost = encoder_cost(name)
+    assert cost["params"] > 0
+    assert cost["out_features"] == make_encoder(name, jax.random.PRNGKey(0)).out_features
+
+
+def test_default_encoder_layer_keys():
+    # The baseline models initialize each conv layer of the default encoder from its own key
+    keys = jax.random.split(jax.random.PRNGKey(0), 4)
+    encoder = make_encoder("default", keys[0], keys)
+    convs = [layer for layer in encoder.layers.layers if isinstance(layer, eqx.nn.Conv2d)]
+    conv = eqx.nn.Conv2d(in_channels=3, out_channels=64, kernel_size=7, stride=2, key=keys[0])
+    assert len(convs) == 4
+    assert jnp.array_equal(convs[0].weight, conv.weight)
@@ -0,0 +1,39 @@
+import jax.numpy as jnp
+import pytest
+
+from popgym_arcade.baselines.metrics import MetricsWriter, Sink
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+
+class FailingSink(Sink):
+    def write(self, rows):
+        raise OSError("disk full")
+
+
+def test_writer_rows():
+    sink = ListSink()
+    writer = MetricsWriter([sink])
+    writer.write({"loss": jnp.arange(6.0).reshape(2, 3)}, start=4)
+    writer.log({"test_return": 1.0}, update=7)
+    writer.close()
+    assert sink.rows == [
+        {"update": 5, "loss": 1.5},
+        {"update": 6, "loss": 2.5},
+        {"update": 7, "loss": 3.5},
+        {"update": 7, "test_return": 1.0},
+    ]
+
+
+def test_writer_raises_sink_errors():
+    writer = MetricsWriter([FailingSink()])
+    writer.write({"loss": jnp.zeros((1, 2))}, start=0)
+    with pytest.raises(RuntimeError) as info:
+        writer.close()
+    assert isinstance(info.value.__cause__, OSError)
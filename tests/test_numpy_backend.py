@@ -0,0 +1,32 @@
+import dataclasses
+
+import jax
+import numpy as np
+import pytest
+
+import popgym_arcade
+
+
+@pytest.mark.parametrize("partial_obs", [False, True])
+@pytest.mark.parametrize("env_name", ["NavigatorEasy", "CountRecallEasy", "AutoEncodeEasy"])
+def test_numpy_backend_matches_jax(env_name, partial_obs):
+    jax_env, env_params = popgym_arcade.make(env_name, partial_obs=partial_obs)
+    np_env, _ = popgym_arcade.make(env_name, backend="numpy", partial_obs=partial_obs)
+    step = jax.jit(jax_env.step)
+    rng = np.random.default_rng(0)
+    key = jax.random.PRNGKey(0)
+    obs, state = jax.jit(jax_env.reset)(key, env_params)
+    for _ in range(20):
+        np_state = np_env.from_jax_state(state)
+        np.testing.assert_array_equal(np_env.get_obs(np_state), np.asarray(obs))
+
+        action = int(rng.integers(np_env.num_actions))
+        key, key_step = jax.random.split(key)
+        np_next, np_reward, np_done = np_env.step_env(np_state, action)
+        obs, state, reward, done, _ = step(key_step, state, action, env_params)
+        assert np.isclose(np_reward, float(reward))
+        if not np_done:
+            jax_next = np_env.from_jax_state(state)
+            for field in dataclasses.fields(np_next):
+                np.testing.assert_array_equal(getattr(np_next, field.name), getattr(jax_next, field.name))
+        assert np_done == bool(done)
@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from popgym_arcade.vector import AsyncVectorEnv
+
+
+@pytest.mark.parametrize("env_id", ["MineSweeperEasy", "NavigatorEasy"])
+def test_observation_space_contains_reset_obs(env_id):
+    with AsyncVectorEnv(env_id, num_envs=2) as envs:
+        envs.async_reset()
+        obs, _, _, _, _ = envs.recv()
+    assert obs.shape == (2, *envs.observation_space.shape)
+    assert obs.dtype == envs.observation_space.dtype
+    assert all(envs.observation_space.contains(o) for o in np.asarray(obs))
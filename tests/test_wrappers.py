@@ -0,0 +1,41 @@
+import jax
+import jax.numpy as jnp
+import pytest
+
+import popgym_arcade
+from popgym_arcade.wrappers import FrameStackWrapper, LogWrapper, ResetPoolWrapper
+
+
+class Counter:
+    """Emits its step count as a 2x2 frame and ends the episode on the third step."""
+
+    def reset(self, key, params=None):
+        return jnp.zeros((2, 2, 1)), jnp.array(0)
+
+    def step(self, key, state, action, params=None):
+        state = state + 1
+        return jnp.full((2, 2, 1), state, dtype=jnp.float32), state, 0.0, state == 3, {}
+
+
+def test_frame_stack_order_and_reset():
+    env = FrameStackWrapper(Counter(), num_frames=4)
+    assert env.observation_space(None).shape == (2, 2, 4)
+    obs, state = env.reset(jax.random.PRNGKey(0))
+    stacks = []
+    for _ in range(4):
+        obs, state, _, _, _ = env.step(jax.random.PRNGKey(0), state, 0)
+        stacks.append(obs[0, 0].tolist())
+    # Oldest frame first, and a new episode starts with its first frame in every slot
+    assert stacks == [[0, 0, 0, 1], [0, 0, 1, 2], [3, 3, 3, 3], [3, 3, 3, 4]]
+
+
+def test_reset_pool_wraps_bare_environments():
+    env, env_params = popgym_arcade.make("CountRecallEasy")
+    with pytest.raises(AssertionError):
+        ResetPoolWrapper(LogWrapper(env), num_envs=2)
+
+    env = ResetPoolWrapper(env, num_envs=2, pool_size=4, refresh_size=2, refresh_interval=1)
+    obs, state = env.reset(jax.random.PRNGKey(0), env_params)
+    obs, state, reward, done, _ = env.step(jax.random.PRNGKey(1), state, jnp.zeros(2, dtype=jnp.int32), env_params)
+    assert obs.shape[0] == reward.shape[0] == done.shape[0] == 2
+    assert state.cursor == 2